@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""Pick the fastest way to run card recognition on this machine.
+
+Which is quickest (per-card threads, a process pool, or plain serial
+matching) depends on the core count and on how OpenCV was built. Every
+calculator is tuned on the code it actually runs, and only the execution
+strategy is tuned: the recognizer is the calculator's own (--matcher).
+
+    belot_calculator             identify_card with pruning: serial, threads,
+                                 processes
+    belot_calculator_clipboards  its streaming identify_card: serial, threads,
+                                 processes
+    belot_calculator_loop        the recognition cascade (its default
+                                 matcher): serial or a thread pool
+
+Backends are timed on synthetic strips from synth_hands.py (sub-pixel
+shifts, brightness/contrast changes and JPEG recompression of the cards the
+templates were cut from), and any backend less accurate there than serial
+matching of the same calculator is dropped. The rankings are stored in
+tuning.json keyed by a machine fingerprint (CPU, core count, OpenCV/NumPy/
+Python builds) together with the template store version.
+
+The calculators call ensure_tuning() at startup: a stored ranking for this
+machine, these templates and that calculator is reused, anything else (new
+hardware, a recalibration, no file) runs a quick tune of that calculator
+first. One-shot runs also pay the pool start-up.
+
+    python autotune.py            # tune every calculator and save
+    python autotune.py --show     # print the stored rankings
+"""
+import cv2
+import numpy as np
+import os
+import sys
+import json
+import time
+import hashlib
+import platform
+import argparse
+import importlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from template_bank import template_bank_version
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+TUNING_FILE = os.path.join(BASE_DIR, 'tuning.json')
+
+BACKENDS = ('serial', 'threads', 'processes')
+
+# Backends each calculator can run
+TARGETS = {
+    'belot_calculator': BACKENDS,
+    'belot_calculator_clipboards': BACKENDS,
+    'belot_calculator_loop': ('serial', 'threads'),
+}
+
+# Timed passes over the tuning hands per candidate after one warm-up pass; a
+# quick tune (at calculator start-up) uses fewer
+REPEAT = 7
+QUICK_REPEAT = 3
+
+# Held-out hands: synthetic strips at the layout's card positions, so the
+# calculators can slice them, but shifted, re-lit and recompressed
+TUNE_HANDS = 8
+TUNE_SEED = 4048
+
+Choice = namedtuple('Choice', ['backend', 'workers'])
+
+def cpu_model():
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+def machine_fingerprint():
+    """(id, details) of everything the ranking depends on besides the templates"""
+    try:
+        usable = len(os.sched_getaffinity(0))
+    except AttributeError:
+        usable = os.cpu_count()
+    info = {
+        'system': platform.system(),
+        'machine': platform.machine(),
+        'cpu': cpu_model(),
+        'cpus': os.cpu_count(),
+        'usable_cpus': usable,
+        'opencv': cv2.__version__,
+        'opencv_build': hashlib.md5(cv2.getBuildInformation().encode('utf-8')).hexdigest()[:12],
+        'numpy': np.__version__,
+        'python': platform.python_version(),
+    }
+    key = hashlib.md5(json.dumps(info, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return key, info
+
+def worker_counts():
+    """Pool sizes worth trying: 2, 4, ... up to twice the usable cores"""
+    cpus = machine_fingerprint()[1]['usable_cpus'] or 1
+    counts = {cpus}
+    n = 2
+    while n <= 2 * cpus:
+        counts.add(n)
+        n *= 2
+    return sorted(c for c in counts if c >= 2)
+
+# Process pool workers load their own templates once, through the calculator
+# module they serve, and identify cards with its identify_card
+_worker_module = None
+
+def init_worker(module_name):
+    global _worker_module
+    cv2.setNumThreads(1)
+    _worker_module = importlib.import_module(module_name)
+    _worker_module.load_recognizer_config()
+    _worker_module.load_templates()
+
+def identify_in_worker(card, candidates=(None, None)):
+    return _worker_module.identify_card(card, candidates)
+
+def make_executor(choice, module_name):
+    """Executor for choice (the default thread pool without one); None for serial,
+    which runs on the calling thread"""
+    if choice is None:
+        return ThreadPoolExecutor()
+    if choice.backend == 'threads':
+        return ThreadPoolExecutor(max_workers=choice.workers)
+    if choice.backend == 'processes':
+        return ProcessPoolExecutor(max_workers=choice.workers, initializer=init_worker,
+                                   initargs=(module_name,))
+    return None
+
+def load_hands(count=TUNE_HANDS, seed=TUNE_SEED):
+    """Synthetic hands as [(BGR strip, [(rank, suit), ...])]"""
+    from synth_hands import iter_strips, DEFAULT_CONFIG
+
+    # Card positions stay on the slicing grid; everything else varies
+    config = DEFAULT_CONFIG._replace(scale_range=(1.0, 1.0), gap_jitter=0)
+    hands = []
+    for _, image, labels, _, _ in iter_strips(count, seed=seed, config=config):
+        truth = [("back", "back") if label == 'back' else (label[:-1], label[-1]) for label in labels]
+        hands.append((image, truth))
+    return hands
+
+def time_backend(run, repeat, setup=None):
+    """(predictions of the warm-up pass, median ms per hand, warm-up pass ms per hand).
+
+    setup, when given, runs untimed before every pass.
+    """
+    if setup is not None:
+        setup()
+    start = time.perf_counter()
+    predicted = run()
+    first = time.perf_counter() - start
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return predicted, 1000 * float(np.median(times)), 1000 * first
+
+def prepare_calculator(module):
+    """Load a calculator module the way its main() does"""
+    module.load_card_layout()
+    module.load_recognizer_config()
+    if not module.load_templates():
+        raise RuntimeError("Card templates not found. Run belot_calibrator.py first.")
+
+def slice_hands(module, hands):
+    """Gray card slices and colour index corners of every hand, as the calculator ingests them"""
+    from ingest import color_corners
+
+    sliced = []
+    for image, _ in hands:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        sliced.append((module.slice_cards(gray), color_corners(image, module.card_layout)))
+    return sliced
+
+def one_shot_runners(module_name, module, hands, supported):
+    """(backend, workers, run, setup) for a calculator that identifies cards one at a time,
+    pruned by the colour of each index corner as its main() does"""
+    prepare_calculator(module)
+    # Tuning runs with its own pruner, so the calculator's pruning report stays its own
+    default_pruner = module.candidate_pruner
+    module.build_candidate_pruner()
+    sliced = slice_hands(module, hands)
+
+    def run_with(mapper, identify):
+        return lambda: [list(mapper(identify, cards, module.candidate_pruner.candidates(cards, corners)))
+                        for cards, corners in sliced]
+
+    try:
+        yield 'serial', None, run_with(map, module.identify_card), None
+        for backend in ('threads', 'processes'):
+            if backend not in supported:
+                continue
+            for workers in worker_counts():
+                # Process workers import the calculator by name in their own interpreter
+                executor = make_executor(Choice(backend, workers), module_name)
+                identify = identify_in_worker if backend == 'processes' else module.identify_card
+                try:
+                    yield backend, workers, run_with(executor.map, identify), None
+                finally:
+                    executor.shutdown()
+    finally:
+        module.candidate_pruner = default_pruner
+
+def loop_runners(module_name, loop, hands, supported):
+    """(backend, workers, run, setup) for the continuous loop's cascade, through recognize_cards"""
+    saved = loop.quiet_mode, loop.matcher, loop.cascade, loop.card_executor
+    loop.quiet_mode = True
+    loop.matcher = 'cascade'
+    prepare_calculator(loop)
+    grays = [cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) for image, _ in hands]
+
+    # The cascade learns every region it resolves; a cascade kept across passes
+    # would answer every later pass from its lookup table, so each pass starts
+    # from a fresh one as the loop does at start-up
+    setup = loop.build_cascade
+
+    def run():
+        return [loop.recognize_cards(gray)[0] for gray in grays]
+
+    try:
+        loop.serial_recognition = True
+        yield 'serial', None, run, setup
+        loop.serial_recognition = False
+        if 'threads' in supported:
+            for workers in worker_counts():
+                loop.card_executor = ThreadPoolExecutor(max_workers=workers)
+                try:
+                    yield 'threads', workers, run, setup
+                finally:
+                    loop.card_executor.shutdown()
+    finally:
+        loop.serial_recognition = False
+        loop.quiet_mode, loop.matcher, loop.cascade, loop.card_executor = saved
+
+def tune_target(name, hands, repeat=REPEAT, log=print, module=None):
+    """Benchmark every backend of one calculator; returns its {'ranking', 'rejected'}.
+
+    module is the calculator's live module; a calculator running as a script is
+    __main__, and importing it by name would tune a second copy.
+    """
+    truth = [card for _, labels in hands for card in labels]
+
+    def accuracy(predicted):
+        flat = [tuple(card) for hand in predicted for card in hand]
+        return sum(p == t for p, t in zip(flat, truth)) / len(truth)
+
+    runners = loop_runners if name == 'belot_calculator_loop' else one_shot_runners
+    log(f"{name}:")
+    results = []
+    module = module or importlib.import_module(name)
+    for backend, workers, run, setup in runners(name, module, hands, TARGETS[name]):
+        predicted, frame_ms, first_ms = time_backend(run, repeat, setup)
+        # Pools spawn (and process workers load templates) during the first pass
+        startup_ms = max(0.0, first_ms - frame_ms) if backend in ('threads', 'processes') else 0.0
+        results.append({'backend': backend, 'workers': workers, 'accuracy': round(accuracy(predicted), 5),
+                        'frame_ms': round(frame_ms / len(hands), 3), 'startup_ms': round(startup_ms, 3)})
+        log(f"  {backend:<10} {workers or '':>3}  {frame_ms / len(hands):8.2f} ms/hand  "
+            f"start-up {startup_ms:7.1f} ms  accuracy {100 * accuracy(predicted):.1f}%")
+
+    # Only backends as accurate as serial matching of the same calculator are eligible
+    baseline = results[0]['accuracy']
+    return {
+        'ranking': sorted((r for r in results if r['accuracy'] >= baseline), key=lambda r: r['frame_ms']),
+        'rejected': [r for r in results if r['accuracy'] < baseline],
+    }
+
+def tune(targets=tuple(TARGETS), repeat=REPEAT, log=print, modules=None):
+    """Benchmark the given calculators on synthetic hands; returns the tuning entry for this machine.
+
+    modules maps target names to already loaded calculator modules.
+    """
+    modules = modules or {}
+    hands = load_hands()
+    if not hands:
+        raise RuntimeError("No tuning hands; check cards/ and card_mapping.json")
+    log(f"Tuning recognition on {len(hands)} synthetic hands, "
+        f"{sum(len(labels) for _, labels in hands)} cards ({repeat} timed passes per backend)")
+    key, info = machine_fingerprint()
+    return {
+        'machine_id': key,
+        'machine': info,
+        'templates': template_bank_version(TEMPLATES_DIR),
+        'tuned_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'hands': len(hands),
+        'targets': {name: tune_target(name, hands, repeat, log, modules.get(name)) for name in targets},
+    }
+
+def read_tuning_file(path=TUNING_FILE):
+    if not os.path.exists(path):
+        return {'machines': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_tuning(entry, path=TUNING_FILE):
+    """Store entry under its machine id, keeping other machines' results and, for
+    the same templates, the calculators this entry did not tune"""
+    data = read_tuning_file(path)
+    machines = data.setdefault('machines', {})
+    previous = machines.get(entry['machine_id'])
+    if previous and previous.get('templates') == entry['templates'] and 'targets' in previous:
+        entry = dict(entry, targets=dict(previous['targets'], **entry['targets']))
+    machines[entry['machine_id']] = entry
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return entry
+
+def load_tuning(path=TUNING_FILE, templates_dir=TEMPLATES_DIR):
+    """The stored entry for this machine, or None when missing or tuned for other templates"""
+    try:
+        entry = read_tuning_file(path).get('machines', {}).get(machine_fingerprint()[0])
+    except (OSError, ValueError):
+        return None
+    if entry is None or 'targets' not in entry or entry.get('templates') != template_bank_version(templates_dir):
+        return None
+    return entry
+
+def choose(entry, target, supported=None, one_shot=False):
+    """Fastest ranked backend of target among supported; one-shot runs count pool start-up too"""
+    ranking = entry['targets'].get(target, {}).get('ranking', [])
+    candidates = [r for r in ranking if supported is None or r['backend'] in supported]
+    if not candidates:
+        return None
+    cost = (lambda r: r['frame_ms'] + r['startup_ms']) if one_shot else (lambda r: r['frame_ms'])
+    best = min(candidates, key=cost)
+    return Choice(best['backend'], best['workers'])
+
+def ensure_tuning(target, supported=None, one_shot=False, log=print, module=None):
+    """Choice for target on this machine, tuning it first when nothing valid is stored; None on failure.
+
+    module is the calling calculator's module (sys.modules[__name__]), so a
+    calculator started as a script is tuned as itself.
+    """
+    entry = load_tuning()
+    if entry is None or target not in entry['targets']:
+        log(f"No tuning of {target} for this machine and template set; benchmarking recognition backends...")
+        try:
+            entry = save_tuning(tune((target,), QUICK_REPEAT, log=lambda message: None,
+                                     modules={target: module} if module is not None else None))
+        except Exception as e:
+            log(f"Autotune failed ({e}); using the default thread pool")
+            return None
+    choice = choose(entry, target, supported, one_shot)
+    if choice is not None:
+        log(f"Recognition backend: {describe(choice)}")
+    return choice
+
+def describe(choice):
+    return f"{choice.backend} ({choice.workers} workers)" if choice.workers else choice.backend
+
+def show(path):
+    entry = load_tuning(path)
+    if entry is None:
+        print("No valid tuning for this machine and template set. Run: python autotune.py")
+        return 1
+    print(f"Machine {entry['machine_id']}: {entry['machine']['cpu']} "
+          f"({entry['machine']['usable_cpus']} usable CPUs), OpenCV {entry['machine']['opencv']}")
+    print(f"Templates {entry['templates']}, tuned {entry['tuned_at']} on {entry['hands']} synthetic hands")
+    for name, result in entry['targets'].items():
+        print(f"{name}:")
+        for r in result['ranking']:
+            print(f"  {r['backend']:<10} {r['workers'] or '':>3}  {r['frame_ms']:8.2f} ms/hand  "
+                  f"start-up {r['startup_ms']:7.1f} ms  accuracy {100 * r['accuracy']:.1f}%")
+        for r in result.get('rejected', []):
+            print(f"  {r['backend']:<10} {r['workers'] or '':>3}  rejected: accuracy {100 * r['accuracy']:.1f}%")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark recognition backends and store the fastest')
+    parser.add_argument('-r', '--repeat', type=int, default=REPEAT, help='timed passes per backend')
+    parser.add_argument('--target', choices=list(TARGETS), action='append', default=None,
+                        help='calculator to tune (repeatable; default: all)')
+    parser.add_argument('--show', action='store_true', help='print the stored rankings and exit')
+    parser.add_argument('-o', '--output', default=TUNING_FILE)
+    args = parser.parse_args()
+    if args.show:
+        return show(args.output)
+
+    try:
+        entry = tune(tuple(args.target or TARGETS), args.repeat)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    entry = save_tuning(entry, args.output)
+    for name in args.target or TARGETS:
+        for one_shot, mode in ((True, 'one-shot'), (False, 'continuous')):
+            choice = choose(entry, name, one_shot=one_shot)
+            if choice is not None:
+                print(f"Fastest {name} {mode}: {describe(choice)}")
+    print(f"Saved to {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
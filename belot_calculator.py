@@ -4,10 +4,17 @@ import numpy as np
 from PIL import ImageGrab
 import time
 import os
+import sys
 import json
+import argparse
 from rich.console import Console
 from rich.table import Table
-from concurrent.futures import ThreadPoolExecutor
+from card_extractor import CardLayout, load_layout, slice_image
+from candidate_pruning import CandidatePruner
+from ingest import ingest, to_gray
+from hamming_classifier import HandClassifier
+from autotune import BACKENDS, ensure_tuning, make_executor, identify_in_worker
+from template_bank import read_glyph_regions
 
 # Current user and time information
 USER = "wolketich"
@@ -24,25 +31,93 @@ SUIT_COLORS = {'♠': 'white', '♥': 'red', '♦': 'red', '♣': 'white'}
 CARD_WIDTH = 180
 CARD_HEIGHT = 250
 CARD_GAP = 15
-MAX_CARDS = 16
+MAX_CARDS = 32  # a full deck, across all rows
 
-# Card recognition regions
+# Card recognition regions; the tight glyph regions the calibrator stores in
+# templates/regions.json replace these when present
 RANK_REGION = (0, 0, 80, 80)
 SUIT_REGION = (0, 80, 80, 145)
 
+# Regions the calibrator cuts templates from; configured regions must lie inside
+TEMPLATE_RANK_REGION = (0, 0, 80, 80)
+TEMPLATE_SUIT_REGION = (0, 80, 80, 145)
+
+# Matching settings (overridden by recognizer_config.json from param_sweep.py)
+MATCH_METHOD = cv2.TM_CCOEFF_NORMED
+MATCH_THRESHOLD = 0.6
+BACK_THRESHOLD = 0.7
+TEMPLATE_SCALE = 1.0
+
 # Directories
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 MAPPING_FILE = os.path.join(BASE_DIR, 'card_mapping.json')
+LAYOUT_FILE = os.path.join(BASE_DIR, 'card_layout.json')
+CONFIG_FILE = os.path.join(BASE_DIR, 'recognizer_config.json')
 
 # Template caches
 rank_templates = {}
 suit_templates = {}
 back_template = None
 
+# Templates at TEMPLATE_SCALE for the correlation matcher
+scaled_rank_templates = {}
+scaled_suit_templates = {}
+scaled_back_template = None
+
+# Narrows the templates each slot is correlated against (built with the templates)
+candidate_pruner = None
+
+# Hand layout; recognition only needs the index corner of each card
+card_layout = CardLayout(CARD_WIDTH, CARD_HEIGHT, CARD_GAP, MAX_CARDS, crop='corner')
+
+def load_recognizer_config():
+    """Apply the calibrator's glyph regions, then recognizer_config.json (exported by
+    param_sweep.py) if present; regions set in the config win"""
+    global RANK_REGION, SUIT_REGION, MATCH_METHOD, MATCH_THRESHOLD, BACK_THRESHOLD, TEMPLATE_SCALE
+    
+    glyph_regions = read_glyph_regions(TEMPLATES_DIR)
+    if glyph_regions is not None:
+        RANK_REGION, SUIT_REGION = glyph_regions
+    
+    if not os.path.exists(CONFIG_FILE):
+        return False
+    
+    with open(CONFIG_FILE) as f:
+        config = json.load(f)
+    
+    RANK_REGION = tuple(config.get('rank_region', RANK_REGION))
+    SUIT_REGION = tuple(config.get('suit_region', SUIT_REGION))
+    MATCH_METHOD = getattr(cv2, config.get('method', 'TM_CCOEFF_NORMED'))
+    MATCH_THRESHOLD = config.get('match_threshold', MATCH_THRESHOLD)
+    BACK_THRESHOLD = config.get('back_threshold', BACK_THRESHOLD)
+    TEMPLATE_SCALE = config.get('template_scale', TEMPLATE_SCALE)
+    return True
+
+def fit_template(template, template_region, region):
+    """Cut the configured region out of a template cut at template_region"""
+    ox, oy = template_region[:2]
+    x1, y1, x2, y2 = region
+    return template[y1-oy:y2-oy, x1-ox:x2-ox]
+
+def scale_region(img):
+    """Resize to TEMPLATE_SCALE (no-op at full resolution)"""
+    if TEMPLATE_SCALE == 1.0:
+        return img
+    return cv2.resize(img, None, fx=TEMPLATE_SCALE, fy=TEMPLATE_SCALE, interpolation=cv2.INTER_AREA)
+
+def match_score(gray, template):
+    """Template similarity where higher is better, whatever MATCH_METHOD is"""
+    result = cv2.matchTemplate(gray, template, MATCH_METHOD)
+    min_val, max_val, _, _ = cv2.minMaxLoc(result)
+    if MATCH_METHOD in (cv2.TM_SQDIFF, cv2.TM_SQDIFF_NORMED):
+        return 1.0 - min_val
+    return max_val
+
 def load_templates():
     """Load templates for ranks and suits"""
     global rank_templates, suit_templates, back_template
+    global scaled_rank_templates, scaled_suit_templates, scaled_back_template
     
     # Check if templates directory exists
     if not os.path.exists(TEMPLATES_DIR):
@@ -57,7 +132,7 @@ def load_templates():
                 template_path = os.path.join(rank_dir, file)
                 template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
                 if template is not None:
-                    rank_templates[rank] = template
+                    rank_templates[rank] = fit_template(template, TEMPLATE_RANK_REGION, RANK_REGION)
     
     # Load suit templates
     suit_dir = os.path.join(TEMPLATES_DIR, 'suits')
@@ -68,44 +143,51 @@ def load_templates():
                 template_path = os.path.join(suit_dir, file)
                 template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
                 if template is not None:
-                    suit_templates[suit] = template
+                    suit_templates[suit] = fit_template(template, TEMPLATE_SUIT_REGION, SUIT_REGION)
     
     # Load card back template
     back_path = os.path.join(TEMPLATES_DIR, 'back.png')
     if os.path.exists(back_path):
         back_template = cv2.imread(back_path, cv2.IMREAD_GRAYSCALE)
     
+    scaled_rank_templates = {rank: scale_region(t) for rank, t in rank_templates.items()}
+    scaled_suit_templates = {suit: scale_region(t) for suit, t in suit_templates.items()}
+    if back_template is not None:
+        scaled_back_template = scale_region(back_template)
+    
     return len(rank_templates) > 0 and len(suit_templates) > 0
 
-def get_image_from_clipboard():
-    """Get image from clipboard and convert to OpenCV format"""
+def get_image_from_clipboard(with_corners=True):
+    """Get the clipboard image as grayscale, plus the colour index corners pruning needs"""
     try:
         image = ImageGrab.grabclipboard()
-        if image is None:
+        if image is None or not hasattr(image, 'mode'):
             return None
-        img_array = np.array(image)
-        if len(img_array.shape) >= 3:
-            return cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-        return img_array
+        return ingest(image, card_layout if with_corners else None)
     except Exception as e:
         print(f"Error getting image from clipboard: {e}")
         return None
 
-def slice_cards(image, card_width=CARD_WIDTH, card_height=CARD_HEIGHT, gap=CARD_GAP, max_cards=MAX_CARDS):
-    """Slice a row of cards into individual card images"""
+def build_candidate_pruner():
+    """Derive the feature references from the loaded templates"""
+    global candidate_pruner
+    candidate_pruner = CandidatePruner(rank_templates, suit_templates, RANK_REGION, SUIT_REGION)
+    return candidate_pruner
+
+def load_card_layout():
+    """Load an optional layout override (rows, overlapping cards) from card_layout.json"""
+    global card_layout
+    
+    if os.path.exists(LAYOUT_FILE):
+        card_layout = load_layout(LAYOUT_FILE)
+    return card_layout
+
+def slice_cards(image, layout=None):
+    """Slice a row, grid or fan of cards into individual card images"""
     if image is None:
         return []
-        
-    img_height, img_width = image.shape[:2]
-    cards = []
-    x = 0
-    
-    while x + card_width <= img_width and len(cards) < max_cards:
-        card = image[0:min(card_height, img_height), x:x+card_width]
-        cards.append(card)
-        x += card_width + gap
-        
-    return cards
+    
+    return list(slice_image(image, layout or card_layout))
 
 def extract_card_regions(card):
     """Extract rank and suit regions from a card image"""
@@ -124,60 +206,84 @@ def is_card_back(card):
         
     # Just check top-left corner
     corner = card[0:80, 0:80]
-    gray = cv2.cvtColor(corner, cv2.COLOR_BGR2GRAY)
+    gray = scale_region(to_gray(corner))
     
     # Template matching with back template
-    result = cv2.matchTemplate(gray, back_template, cv2.TM_CCOEFF_NORMED)
-    _, max_val, _, _ = cv2.minMaxLoc(result)
+    max_val = match_score(gray, scaled_back_template)
     
-    return max_val > 0.7  # High threshold for certainty
+    return max_val > BACK_THRESHOLD  # High threshold for certainty
 
-def identify_rank(rank_img):
-    """Identify the rank of a card using template matching"""
-    gray = cv2.cvtColor(rank_img, cv2.COLOR_BGR2GRAY)
+def identify_rank(rank_img, candidates=None):
+    """Identify the rank of a card using template matching.
+    
+    candidates limits the templates tried (from candidate_pruner); if none of
+    them clears the threshold, every template is tried after all.
+    """
+    gray = scale_region(to_gray(rank_img))
     
     best_match = None
     best_score = -1
     
-    for rank, template in rank_templates.items():
+    templates = scaled_rank_templates
+    if candidates is not None:
+        templates = {label: templates[label] for label in candidates if label in templates}
+    
+    for rank, template in templates.items():
         # Template matching
-        result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, _ = cv2.minMaxLoc(result)
+        max_val = match_score(gray, template)
         
         if max_val > best_score:
             best_score = max_val
             best_match = rank
     
-    return best_match if best_score > 0.6 else '?'
+    if candidates is not None and best_score <= MATCH_THRESHOLD:
+        if candidate_pruner is not None:
+            candidate_pruner.record_fallback('rank')
+        return identify_rank(rank_img)
+    
+    return best_match if best_score > MATCH_THRESHOLD else '?'
 
-def identify_suit(suit_img):
-    """Identify the suit of a card using template matching"""
-    gray = cv2.cvtColor(suit_img, cv2.COLOR_BGR2GRAY)
+def identify_suit(suit_img, candidates=None):
+    """Identify the suit of a card using template matching.
+    
+    candidates limits the templates tried (from candidate_pruner); if none of
+    them clears the threshold, every template is tried after all.
+    """
+    gray = scale_region(to_gray(suit_img))
     
     best_match = None
     best_score = -1
     
-    for suit, template in suit_templates.items():
+    templates = scaled_suit_templates
+    if candidates is not None:
+        templates = {label: templates[label] for label in candidates if label in templates}
+    
+    for suit, template in templates.items():
         # Template matching
-        result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, _ = cv2.minMaxLoc(result)
+        max_val = match_score(gray, template)
         
         if max_val > best_score:
             best_score = max_val
             best_match = suit
     
-    return best_match if best_score > 0.6 else '?'
+    if candidates is not None and best_score <= MATCH_THRESHOLD:
+        if candidate_pruner is not None:
+            candidate_pruner.record_fallback('suit')
+        return identify_suit(suit_img)
+    
+    return best_match if best_score > MATCH_THRESHOLD else '?'
 
-def identify_card(card_image):
-    """Identify rank and suit from a card image"""
+def identify_card(card_image, candidates=(None, None)):
+    """Identify rank and suit from a card image; candidates is (ranks, suits) or Nones"""
     # Check if this is a card back
     if is_card_back(card_image):
         return "back", "back"
     
     rank_region, suit_region = extract_card_regions(card_image)
     
-    rank = identify_rank(rank_region)
-    suit = identify_suit(suit_region)
+    rank_candidates, suit_candidates = candidates
+    rank = identify_rank(rank_region, rank_candidates)
+    suit = identify_suit(suit_region, suit_candidates)
     
     return rank, suit
 
@@ -196,33 +302,66 @@ def calculate_points(cards, trump_suit):
     return total
 
 def main():
+    parser = argparse.ArgumentParser(description="Belot Card Calculator")
+    parser.add_argument("image", nargs="?", default=None,
+                        help="image file to read instead of the clipboard, or - for stdin")
+    parser.add_argument("--matcher", choices=["template", "hamming"], default="template",
+                        help="template: correlation matching per card; hamming: one vectorised pass of "
+                             "the binary bit-packed matcher over the whole hand")
+    args = parser.parse_args()
+    
     start_time = time.time()
     console = Console()
     
     console.print(f"[bold cyan]Belot Card Calculator[/bold cyan]")
     console.print(f"[dim]User: {USER} | Time: {CURRENT_TIME}[/dim]\n")
     
+    load_card_layout()
+    load_recognizer_config()
+    
     # Check if templates are available
     if not load_templates():
         console.print("[bold red]Card templates not found![/bold red]")
         console.print("Please run belot_calibrator.py first to set up card recognition.")
         return
-    
-    console.print("Getting image from clipboard...", end="")
-    
-    # Get image from clipboard
-    image = get_image_from_clipboard()
-    
-    if image is None:
-        console.print("\r[bold red]No image found in clipboard![/bold red]")
-        console.print("Please copy an image with cards to your clipboard and try again.")
-        return
+    # The Hamming pass compares every template anyway: no pruning, so no colour corners
+    vectorized = args.matcher == 'hamming'
+    choice = None
+    if not vectorized:
+        build_candidate_pruner()
+        # Fastest way to run template matching on this machine (autotune.py);
+        # a single run also pays for starting a pool
+        choice = ensure_tuning('belot_calculator', BACKENDS, one_shot=True,
+                               log=lambda message: console.print(f"[dim]{message}[/dim]"),
+                               module=sys.modules[__name__])
+    
+    if args.image:
+        source = 'stdin' if args.image == '-' else args.image
+        console.print(f"Reading {source}...", end="")
+        try:
+            frame = ingest(args.image, None if vectorized else card_layout)
+        except OSError as e:
+            console.print(f"\r[bold red]Could not read {source}: {e}[/bold red]")
+            return
+        if frame is None:
+            console.print(f"\r[bold red]Could not read an image from {source}![/bold red]")
+            return
+    else:
+        console.print("Getting image from clipboard...", end="")
+        
+        # Get image from clipboard
+        frame = get_image_from_clipboard(with_corners=not vectorized)
+        
+        if frame is None:
+            console.print("\r[bold red]No image found in clipboard![/bold red]")
+            console.print("Please copy an image with cards to your clipboard and try again.")
+            return
     
     console.print("\r[green]Image loaded successfully![/green]")
     
     # Slice cards from image
     console.print("Processing cards...", end="")
-    cards = slice_cards(image)
+    cards = slice_cards(frame.gray)
     
     if not cards:
         console.print("\r[bold red]No cards detected in image![/bold red]")
@@ -234,8 +373,18 @@ def main():
     console.print("Identifying cards...")
     
     card_data = []
-    with ThreadPoolExecutor() as executor:
-        card_data = list(executor.map(identify_card, cards))
+    if vectorized:
+        classifier = HandClassifier(rank_templates, suit_templates, back_template, RANK_REGION, SUIT_REGION)
+        card_data = classifier.identify_cards(cards)
+    else:
+        # Cheap features for all slots at once narrow the templates each card is matched against
+        candidates = candidate_pruner.candidates(cards, frame.corners)
+        if choice is not None and choice.backend == 'serial':
+            card_data = list(map(identify_card, cards, candidates))
+        else:
+            identify = identify_in_worker if choice is not None and choice.backend == 'processes' else identify_card
+            with make_executor(choice, 'belot_calculator') as executor:
+                card_data = list(executor.map(identify, cards, candidates))
     
     # Show identified cards
     unknown_count = 0
@@ -281,6 +430,8 @@ def main():
     elapsed = time.time() - start_time
     console.print(f"\n[dim]Execution time: {elapsed:.3f} seconds[/dim]")
     console.print(f"[dim]Valid cards: {len(valid_cards)}, Card backs: {back_count}, Unidentified: {unknown_count}[/dim]")
+    if not vectorized:
+        console.print(f"[dim]{candidate_pruner.report()}[/dim]")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -4,12 +4,20 @@ import numpy as np
 from PIL import ImageGrab
 import time
 import os
+import sys
 import json
-import hashlib
+import argparse
 import pyperclip
 from rich.console import Console
 from rich.table import Table
-from concurrent.futures import ThreadPoolExecutor
+from rich.live import Live
+from rich.text import Text
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from card_extractor import CardLayout, load_layout, slice_image
+from candidate_pruning import CandidatePruner
+from ingest import ingest, to_gray, frame_digest
+from autotune import ensure_tuning, make_executor, identify_in_worker
+from template_bank import read_glyph_regions
 
 # Current user and time information
 USER = "wolketich"
@@ -28,29 +36,110 @@ SUIT_COLORS = {'♠': 'white', '♥': 'red', '♦': 'green', '♣': 'white'}
 CARD_WIDTH = 180
 CARD_HEIGHT = 250
 CARD_GAP = 15
-MAX_CARDS = 16
+MAX_CARDS = 32  # a full deck, across all rows
 
-# Card recognition regions
+# Card recognition regions; the tight glyph regions the calibrator stores in
+# templates/regions.json replace these when present
 RANK_REGION = (0, 0, 80, 80)
 SUIT_REGION = (0, 80, 80, 145)
 
+# Regions the calibrator cuts templates from; configured regions must lie inside
+TEMPLATE_RANK_REGION = (0, 0, 80, 80)
+TEMPLATE_SUIT_REGION = (0, 80, 80, 145)
+
+# Matching settings (overridden by recognizer_config.json from param_sweep.py)
+MATCH_METHOD = cv2.TM_CCOEFF_NORMED
+MATCH_THRESHOLD = 0.6
+BACK_THRESHOLD = 0.7
+TEMPLATE_SCALE = 1.0
+
 # Directories
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 MAPPING_FILE = os.path.join(BASE_DIR, 'card_mapping.json')
+LAYOUT_FILE = os.path.join(BASE_DIR, 'card_layout.json')
+CONFIG_FILE = os.path.join(BASE_DIR, 'recognizer_config.json')
 
 # Template caches
 rank_templates = {}
 suit_templates = {}
 back_template = None
 
+# Templates at TEMPLATE_SCALE for the correlation matcher
+scaled_rank_templates = {}
+scaled_suit_templates = {}
+scaled_back_template = None
+
+# Narrows the templates each slot is correlated against (built with the templates)
+candidate_pruner = None
+
+# Hand layout; recognition only needs the index corner of each card
+card_layout = CardLayout(CARD_WIDTH, CARD_HEIGHT, CARD_GAP, MAX_CARDS, crop='corner')
+
 # Clipboard monitoring
 last_clipboard_hash = None
 console = Console()
 
+# Shared pool for per-card recognition, reused across frames
+card_executor = ThreadPoolExecutor()
+
+# Backends that can stream one card at a time; the function the pool runs per
+# card is identify_in_worker when the pool is processes
+STREAMING_BACKENDS = ('serial', 'threads', 'processes')
+card_identifier = None
+
+# Optional per-frame deadline in seconds (--deadline). Cards not identified
+# by then are shown as pending and the frame completes in the background.
+frame_deadline = None
+pending_frame = None  # (start_time, card_data, futures) of a frame past its deadline
+
+def load_recognizer_config():
+    """Apply the calibrator's glyph regions, then recognizer_config.json (exported by
+    param_sweep.py) if present; regions set in the config win"""
+    global RANK_REGION, SUIT_REGION, MATCH_METHOD, MATCH_THRESHOLD, BACK_THRESHOLD, TEMPLATE_SCALE
+    
+    glyph_regions = read_glyph_regions(TEMPLATES_DIR)
+    if glyph_regions is not None:
+        RANK_REGION, SUIT_REGION = glyph_regions
+    
+    if not os.path.exists(CONFIG_FILE):
+        return False
+    
+    with open(CONFIG_FILE) as f:
+        config = json.load(f)
+    
+    RANK_REGION = tuple(config.get('rank_region', RANK_REGION))
+    SUIT_REGION = tuple(config.get('suit_region', SUIT_REGION))
+    MATCH_METHOD = getattr(cv2, config.get('method', 'TM_CCOEFF_NORMED'))
+    MATCH_THRESHOLD = config.get('match_threshold', MATCH_THRESHOLD)
+    BACK_THRESHOLD = config.get('back_threshold', BACK_THRESHOLD)
+    TEMPLATE_SCALE = config.get('template_scale', TEMPLATE_SCALE)
+    return True
+
+def fit_template(template, template_region, region):
+    """Cut the configured region out of a template cut at template_region"""
+    ox, oy = template_region[:2]
+    x1, y1, x2, y2 = region
+    return template[y1-oy:y2-oy, x1-ox:x2-ox]
+
+def scale_region(img):
+    """Resize to TEMPLATE_SCALE (no-op at full resolution)"""
+    if TEMPLATE_SCALE == 1.0:
+        return img
+    return cv2.resize(img, None, fx=TEMPLATE_SCALE, fy=TEMPLATE_SCALE, interpolation=cv2.INTER_AREA)
+
+def match_score(gray, template):
+    """Template similarity where higher is better, whatever MATCH_METHOD is"""
+    result = cv2.matchTemplate(gray, template, MATCH_METHOD)
+    min_val, max_val, _, _ = cv2.minMaxLoc(result)
+    if MATCH_METHOD in (cv2.TM_SQDIFF, cv2.TM_SQDIFF_NORMED):
+        return 1.0 - min_val
+    return max_val
+
 def load_templates():
     """Load templates for ranks and suits"""
     global rank_templates, suit_templates, back_template
+    global scaled_rank_templates, scaled_suit_templates, scaled_back_template
     
     # Check if templates directory exists
     if not os.path.exists(TEMPLATES_DIR):
@@ -65,7 +154,7 @@ def load_templates():
                 template_path = os.path.join(rank_dir, file)
                 template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
                 if template is not None:
-                    rank_templates[rank] = template
+                    rank_templates[rank] = fit_template(template, TEMPLATE_RANK_REGION, RANK_REGION)
     
     # Load suit templates
     suit_dir = os.path.join(TEMPLATES_DIR, 'suits')
@@ -76,25 +165,27 @@ def load_templates():
                 template_path = os.path.join(suit_dir, file)
                 template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
                 if template is not None:
-                    suit_templates[suit] = template
+                    suit_templates[suit] = fit_template(template, TEMPLATE_SUIT_REGION, SUIT_REGION)
     
     # Load card back template
     back_path = os.path.join(TEMPLATES_DIR, 'back.png')
     if os.path.exists(back_path):
         back_template = cv2.imread(back_path, cv2.IMREAD_GRAYSCALE)
     
+    scaled_rank_templates = {rank: scale_region(t) for rank, t in rank_templates.items()}
+    scaled_suit_templates = {suit: scale_region(t) for suit, t in suit_templates.items()}
+    if back_template is not None:
+        scaled_back_template = scale_region(back_template)
+    
     return len(rank_templates) > 0 and len(suit_templates) > 0
 
 def get_image_from_clipboard():
-    """Get image from clipboard and convert to OpenCV format"""
+    """Get the clipboard image as grayscale plus the colour index corners pruning needs"""
     try:
         image = ImageGrab.grabclipboard()
-        if image is None:
+        if image is None or not hasattr(image, 'mode'):
             return None
-        img_array = np.array(image)
-        if len(img_array.shape) >= 3:
-            return cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-        return img_array
+        return ingest(image, card_layout)
     except Exception as e:
         console.print(f"[red]Error getting image from clipboard: {e}[/red]")
         return None
@@ -105,25 +196,28 @@ def get_clipboard_hash():
     if image is None:
         return None
     
-    # Convert to bytes and hash
-    image_bytes = np.array(image).tobytes()
-    return hashlib.md5(image_bytes).hexdigest()
+    return frame_digest(np.asarray(image))
+
+def build_candidate_pruner():
+    """Derive the feature references from the loaded templates"""
+    global candidate_pruner
+    candidate_pruner = CandidatePruner(rank_templates, suit_templates, RANK_REGION, SUIT_REGION)
+    return candidate_pruner
+
+def load_card_layout():
+    """Load an optional layout override (rows, overlapping cards) from card_layout.json"""
+    global card_layout
+    
+    if os.path.exists(LAYOUT_FILE):
+        card_layout = load_layout(LAYOUT_FILE)
+    return card_layout
 
-def slice_cards(image, card_width=CARD_WIDTH, card_height=CARD_HEIGHT, gap=CARD_GAP, max_cards=MAX_CARDS):
-    """Slice a row of cards into individual card images"""
+def slice_cards(image, layout=None):
+    """Slice a row, grid or fan of cards into individual card images"""
     if image is None:
         return []
-        
-    img_height, img_width = image.shape[:2]
-    cards = []
-    x = 0
-    
-    while x + card_width <= img_width and len(cards) < max_cards:
-        card = image[0:min(card_height, img_height), x:x+card_width]
-        cards.append(card)
-        x += card_width + gap
-        
-    return cards
+    
+    return list(slice_image(image, layout or card_layout))
 
 def extract_card_regions(card):
     """Extract rank and suit regions from a card image"""
@@ -142,60 +236,84 @@ def is_card_back(card):
         
     # Just check top-left corner
     corner = card[0:80, 0:80]
-    gray = cv2.cvtColor(corner, cv2.COLOR_BGR2GRAY)
+    gray = scale_region(to_gray(corner))
     
     # Template matching with back template
-    result = cv2.matchTemplate(gray, back_template, cv2.TM_CCOEFF_NORMED)
-    _, max_val, _, _ = cv2.minMaxLoc(result)
+    max_val = match_score(gray, scaled_back_template)
     
-    return max_val > 0.7  # High threshold for certainty
+    return max_val > BACK_THRESHOLD  # High threshold for certainty
 
-def identify_rank(rank_img):
-    """Identify the rank of a card using template matching"""
-    gray = cv2.cvtColor(rank_img, cv2.COLOR_BGR2GRAY)
+def identify_rank(rank_img, candidates=None):
+    """Identify the rank of a card using template matching.
+    
+    candidates limits the templates tried (from candidate_pruner); if none of
+    them clears the threshold, every template is tried after all.
+    """
+    gray = scale_region(to_gray(rank_img))
     
     best_match = None
     best_score = -1
     
-    for rank, template in rank_templates.items():
+    templates = scaled_rank_templates
+    if candidates is not None:
+        templates = {label: templates[label] for label in candidates if label in templates}
+    
+    for rank, template in templates.items():
         # Template matching
-        result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, _ = cv2.minMaxLoc(result)
+        max_val = match_score(gray, template)
         
         if max_val > best_score:
             best_score = max_val
             best_match = rank
     
-    return best_match if best_score > 0.6 else '?'
+    if candidates is not None and best_score <= MATCH_THRESHOLD:
+        if candidate_pruner is not None:
+            candidate_pruner.record_fallback('rank')
+        return identify_rank(rank_img)
+    
+    return best_match if best_score > MATCH_THRESHOLD else '?'
 
-def identify_suit(suit_img):
-    """Identify the suit of a card using template matching"""
-    gray = cv2.cvtColor(suit_img, cv2.COLOR_BGR2GRAY)
+def identify_suit(suit_img, candidates=None):
+    """Identify the suit of a card using template matching.
+    
+    candidates limits the templates tried (from candidate_pruner); if none of
+    them clears the threshold, every template is tried after all.
+    """
+    gray = scale_region(to_gray(suit_img))
     
     best_match = None
     best_score = -1
     
-    for suit, template in suit_templates.items():
+    templates = scaled_suit_templates
+    if candidates is not None:
+        templates = {label: templates[label] for label in candidates if label in templates}
+    
+    for suit, template in templates.items():
         # Template matching
-        result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, _ = cv2.minMaxLoc(result)
+        max_val = match_score(gray, template)
         
         if max_val > best_score:
             best_score = max_val
             best_match = suit
     
-    return best_match if best_score > 0.6 else '?'
+    if candidates is not None and best_score <= MATCH_THRESHOLD:
+        if candidate_pruner is not None:
+            candidate_pruner.record_fallback('suit')
+        return identify_suit(suit_img)
+    
+    return best_match if best_score > MATCH_THRESHOLD else '?'
 
-def identify_card(card_image):
-    """Identify rank and suit from a card image"""
+def identify_card(card_image, candidates=(None, None)):
+    """Identify rank and suit from a card image; candidates is (ranks, suits) or Nones"""
     # Check if this is a card back
     if is_card_back(card_image):
         return "back", "back"
     
     rank_region, suit_region = extract_card_regions(card_image)
     
-    rank = identify_rank(rank_region)
-    suit = identify_suit(suit_region)
+    rank_candidates, suit_candidates = candidates
+    rank = identify_rank(rank_region, rank_candidates)
+    suit = identify_suit(suit_region, suit_candidates)
     
     return rank, suit
 
@@ -225,7 +343,9 @@ def format_results_for_clipboard(card_data, points_by_suit, stats):
     # Add identified cards
     result.append("IDENTIFIED CARDS:")
     for i, (rank, suit) in enumerate(card_data):
-        if rank == "back" and suit == "back":
+        if rank is None:
+            result.append(f"Card {i+1}: Pending")
+        elif rank == "back" and suit == "back":
             result.append(f"Card {i+1}: Card Back")
         elif rank == '?' or suit == '?':
             result.append(f"Card {i+1}: Unidentified")
@@ -250,57 +370,58 @@ def format_results_for_clipboard(card_data, points_by_suit, stats):
     
     return "\n".join(result)
 
-def process_clipboard_image():
-    """Process image found in clipboard"""
-    global last_clipboard_hash
-    
-    start_time = time.time()
-    
-    # Clear screen for better display in continuous mode
-    console.clear()
-    
-    console.print(f"[bold cyan]Belot Card Calculator - Continuous Mode[/bold cyan]")
-    console.print(f"[dim]User: {USER} | Timpul: {time.strftime('%H:%M:%S')}[/dim]")
-    console.print("[yellow]Monitorizează clipboard pentru imagini cu cărți...[/yellow]")
-    
-    # Get image from clipboard
-    image = get_image_from_clipboard()
-    
-    if image is None:
-        console.print("[yellow]Nu s-a găsit nicio imagine în clipboard.[/yellow]")
-        return False
-    
-    # Slice cards from image
-    console.print("Procesează cărțile...", end="")
-    cards = slice_cards(image)
-    
-    if not cards:
-        console.print("\r[bold red]Nu s-au detectat cărți în imagine![/bold red]")
-        return True
-    
-    console.print(f"\r[green]S-au găsit {len(cards)} cărți![/green]")
-    
-    # Identify each card (rank and suit)
-    console.print("Identificarea cărților...")
-    
-    card_data = []
-    with ThreadPoolExecutor() as executor:
-        card_data = list(executor.map(identify_card, cards))
-    
-    # Show identified cards
-    unknown_count = 0
-    back_count = 0
-    for i, (rank, suit) in enumerate(card_data):
-        if rank == "back" and suit == "back":
-            back_count += 1
-            console.print(f"Cartea {i+1}: [blue]Verso Carte[/blue]")
-        elif rank == '?' or suit == '?':
-            unknown_count += 1
-            console.print(f"Cartea {i+1}: [red]Neidentificată[/red]")
-        else:
-            color = SUIT_COLORS[suit]
-            suit_name = SUIT_NAMES[suit]
-            console.print(f"Cartea {i+1}: [{color}]{rank} de {suit_name} ({suit})[/{color}]")
+def card_line(index, card):
+    """One line of the card list; card is None while it is still being identified"""
+    if card is None:
+        return f"Cartea {index+1}: [dim]în curs...[/dim]"
+    rank, suit = card
+    if rank == "back" and suit == "back":
+        return f"Cartea {index+1}: [blue]Verso Carte[/blue]"
+    if rank == '?' or suit == '?':
+        return f"Cartea {index+1}: [red]Neidentificată[/red]"
+    color = SUIT_COLORS[suit]
+    return f"Cartea {index+1}: [{color}]{rank} de {SUIT_NAMES[suit]} ({suit})[/{color}]"
+
+def progress_view(card_data, points_by_suit):
+    """Card list plus running totals for the cards identified so far"""
+    lines = [card_line(i, card) for i, card in enumerate(card_data)]
+    done = sum(card is not None for card in card_data)
+    totals = " | ".join(f"[{SUIT_COLORS[suit]}]{SUIT_NAMES[suit]} ({suit})[/{SUIT_COLORS[suit]}] "
+                        f"{points_by_suit[suit]}" for suit in SUITS)
+    lines.append(f"\n[bold]Puncte ({done}/{len(card_data)} cărți):[/bold] {totals}")
+    return Text.from_markup("\n".join(lines))
+
+def stream_card_results(cards, timeout=None, corners=None):
+    """Identify cards in the shared pool, showing each one as soon as it is done.
+    
+    corners are the colour index corners for the pruner's suit-colour check.
+    Returns (card_data, futures); card_data[i] is None for cards that were
+    still pending when timeout ran out.
+    """
+    candidates = candidate_pruner.candidates(cards, corners)
+    futures = {card_executor.submit(card_identifier or identify_card, card, cands): i
+               for i, (card, cands) in enumerate(zip(cards, candidates))}
+    card_data = [None] * len(cards)
+    points_by_suit = {suit: 0 for suit in SUITS}
+    
+    with Live(progress_view(card_data, points_by_suit), console=console, refresh_per_second=20) as live:
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                i = futures[future]
+                card_data[i] = future.result()
+                # Totals only need the new card's contribution
+                for suit in SUITS:
+                    points_by_suit[suit] += calculate_points([card_data[i]], suit)
+                live.update(progress_view(card_data, points_by_suit))
+        except FuturesTimeout:
+            pass
+    
+    return card_data, futures
+
+def report_results(card_data, start_time):
+    """Points table, stats and clipboard copy for a frame whose cards are all identified"""
+    unknown_count = sum(1 for r, s in card_data if r != "back" and (r == '?' or s == '?'))
+    back_count = sum(1 for r, s in card_data if r == "back" and s == "back")
     
     if unknown_count > 0:
         console.print(f"\n[yellow]Atenție: {unknown_count} cărți nu au putut fi identificate.[/yellow]")
@@ -311,7 +432,7 @@ def process_clipboard_image():
     
     if len(valid_cards) == 0:
         console.print("\n[yellow]Nu s-au găsit cărți valide pentru calculul punctelor.[/yellow]")
-        return True
+        return
     
     # Calculate points for all trump suits
     console.print("\n[bold]Puncte după atu:[/bold]")
@@ -353,17 +474,124 @@ def process_clipboard_image():
         console.print(f"\n[red]Eroare la copierea în clipboard: {e}[/red]")
     
     console.print("\n[yellow]Așteptând schimbări în clipboard...[/yellow]")
+
+def finish_pending_frame():
+    """Report a frame that missed its deadline once its last card is done"""
+    global pending_frame
     
+    if pending_frame is None:
+        return False
+    start_time, card_data, futures = pending_frame
+    if not all(future.done() for future in futures):
+        return False
+    pending_frame = None
+    
+    for future, i in futures.items():
+        card_data[i] = future.result()
+    
+    console.print("\n[bold cyan]Rezultat complet:[/bold cyan]")
+    for i, card in enumerate(card_data):
+        console.print(card_line(i, card))
+    report_results(card_data, start_time)
     return True
 
+def drop_pending_frame():
+    """A newer image supersedes a frame still completing in the background"""
+    global pending_frame
+    
+    if pending_frame is not None:
+        for future in pending_frame[2]:
+            future.cancel()
+        pending_frame = None
+
+def process_clipboard_image():
+    """Process image found in clipboard"""
+    global last_clipboard_hash, pending_frame
+    
+    start_time = time.time()
+    drop_pending_frame()
+    
+    # Clear screen for better display in continuous mode
+    console.clear()
+    
+    console.print(f"[bold cyan]Belot Card Calculator - Continuous Mode[/bold cyan]")
+    console.print(f"[dim]User: {USER} | Timpul: {time.strftime('%H:%M:%S')}[/dim]")
+    console.print("[yellow]Monitorizează clipboard pentru imagini cu cărți...[/yellow]")
+    
+    # Get image from clipboard
+    frame = get_image_from_clipboard()
+    
+    if frame is None:
+        console.print("[yellow]Nu s-a găsit nicio imagine în clipboard.[/yellow]")
+        return False
+    
+    # Slice cards from image
+    console.print("Procesează cărțile...", end="")
+    cards = slice_cards(frame.gray)
+    
+    if not cards:
+        console.print("\r[bold red]Nu s-au detectat cărți în imagine![/bold red]")
+        return True
+    
+    console.print(f"\r[green]S-au găsit {len(cards)} cărți![/green]")
+    
+    # Identify each card (rank and suit), showing results as they arrive
+    console.print("Identificarea cărților...")
+    
+    timeout = None
+    if frame_deadline is not None:
+        timeout = max(0.0, frame_deadline - (time.time() - start_time))
+    card_data, futures = stream_card_results(cards, timeout, frame.corners)
+    
+    pending = sum(card is None for card in card_data)
+    if pending:
+        # Partial totals stay on screen only; the clipboard (read back by the
+        # browser script) gets the complete result
+        console.print(f"\n[yellow]Termen de {frame_deadline:.2f}s depășit: {pending} cărți în curs, "
+                      f"rezultatul complet urmează.[/yellow]")
+        pending_frame = (start_time, card_data, futures)
+        return True
+    
+    report_results(card_data, start_time)
+    
+    return True
+
+def configure_recognition(choice):
+    """Size the per-card pool to the autotuned backend (None keeps the default pool)"""
+    global card_executor, card_identifier
+    
+    if choice is None:
+        return
+    card_executor.shutdown(wait=False)
+    # Serial still goes through a one-thread pool, so cards keep streaming in
+    card_executor = make_executor(choice, 'belot_calculator_clipboards') or ThreadPoolExecutor(max_workers=1)
+    card_identifier = identify_in_worker if choice.backend == 'processes' else identify_card
+
 def main():
-    global last_clipboard_hash
+    global last_clipboard_hash, frame_deadline
+    
+    parser = argparse.ArgumentParser(description="Belot Card Calculator - clipboard mode")
+    parser.add_argument("--no-autotune", action="store_true",
+                        help="keep the default thread pool instead of the backend tuned for this machine")
+    parser.add_argument("--deadline", type=float, default=None, metavar="SECONDS",
+                        help="show the cards identified so far after SECONDS and finish the rest "
+                             "in the background")
+    args = parser.parse_args()
+    frame_deadline = args.deadline
+    
+    load_card_layout()
+    load_recognizer_config()
     
     # Check if templates are available
     if not load_templates():
         console.print("[bold red]Nu s-au găsit template-uri pentru cărți![/bold red]")
         console.print("Rulează belot_calibrator.py mai întâi pentru a configura recunoașterea cărților.")
         return
+    build_candidate_pruner()
+    if not args.no_autotune:
+        configure_recognition(ensure_tuning('belot_calculator_clipboards', STREAMING_BACKENDS,
+                                            log=lambda message: console.print(f"[dim]{message}[/dim]"),
+                                            module=sys.modules[__name__]))
     
     console.print("[bold cyan]Belot Card Calculator - Mod Continuu[/bold cyan]")
     console.print(f"[dim]User: {USER} | Timpul: {CURRENT_TIME}[/dim]\n")
@@ -379,12 +607,16 @@ def main():
             if current_hash and current_hash != last_clipboard_hash:
                 last_clipboard_hash = current_hash
                 process_clipboard_image()
+            else:
+                finish_pending_frame()
             
             # Short sleep to prevent high CPU usage
             time.sleep(0.5)
             
     except KeyboardInterrupt:
         console.print("\n[bold cyan]Program oprit de utilizator.[/bold cyan]")
+    finally:
+        card_executor.shutdown(wait=False, cancel_futures=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
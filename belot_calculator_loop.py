@@ -6,9 +6,25 @@ import time
 import os
 import json
 import hashlib
-from rich.console import Console
-from rich.table import Table
+import asyncio
+import argparse
+import re
+import sys
+from collections import namedtuple
 from concurrent.futures import ThreadPoolExecutor
+from card_extractor import CardLayout, load_layout, slice_image
+from recognition_cascade import RecognitionCascade, TIER_NAMES
+from capture_archive import CaptureArchive
+from hamming_classifier import HandClassifier
+from strip_detector import StripDetector
+from deck_tracker import DeckTracker
+from profiling_hooks import FrameProfiler
+from result_cache import ResultCache
+from screen_capture import ScreenCapture, FakeScreen, parse_region
+from results_log import ResultsLog
+from template_bank import template_bank_version, read_glyph_regions, TemplateWatcher
+from autotune import ensure_tuning
+from ingest import ingest, to_gray, frame_digest, iter_png_stream
 
 # Current user and time information
 USER = "wolketich"
@@ -27,75 +43,260 @@ SUIT_COLORS = {'♠': 'white', '♥': 'red', '♦': 'green', '♣': 'yellow'}
 CARD_WIDTH = 180
 CARD_HEIGHT = 250
 CARD_GAP = 15
-MAX_CARDS = 16
+MAX_CARDS = 32  # a full deck, across all rows
 
-# Card recognition regions
+# Card recognition regions; the tight glyph regions the calibrator stores in
+# templates/regions.json replace these when present
 RANK_REGION = (0, 0, 80, 80)
 SUIT_REGION = (0, 80, 80, 145)
 
+# Regions the calibrator cuts templates from; configured regions must lie inside
+TEMPLATE_RANK_REGION = (0, 0, 80, 80)
+TEMPLATE_SUIT_REGION = (0, 80, 80, 145)
+
+# Matching settings (overridden by recognizer_config.json from param_sweep.py)
+MATCH_METHOD = cv2.TM_CCOEFF_NORMED
+MATCH_THRESHOLD = 0.6
+BACK_THRESHOLD = 0.7
+TEMPLATE_SCALE = 1.0
+
 # Directories
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 MAPPING_FILE = os.path.join(BASE_DIR, 'card_mapping.json')
+LAYOUT_FILE = os.path.join(BASE_DIR, 'card_layout.json')
+CONFIG_FILE = os.path.join(BASE_DIR, 'recognizer_config.json')
+PROFILES_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILE_REQUEST_FILE = os.path.join(BASE_DIR, 'profile.request')
 
 # Template caches
 rank_templates = {}
 suit_templates = {}
 back_template = None
 
+# Templates at TEMPLATE_SCALE for the correlation matcher
+scaled_rank_templates = {}
+scaled_suit_templates = {}
+scaled_back_template = None
+
+# Everything loaded from one version of the template store. A reload builds a
+# new bank off the hot path and swaps it in between frames.
+TemplateBank = namedtuple('TemplateBank', ['ranks', 'suits', 'back', 'scaled_ranks', 'scaled_suits',
+                                           'scaled_back', 'recognizer', 'regions'])
+# (rank, suit) regions set in recognizer_config.json (None where unset); they
+# take precedence over the glyph regions of every template store
+configured_regions = (None, None)
+template_watcher = None
+
+# Hand layout; recognition only needs the index corner of each card
+card_layout = CardLayout(CARD_WIDTH, CARD_HEIGHT, CARD_GAP, MAX_CARDS, crop='corner')
+
 # Clipboard monitoring
 last_clipboard_hash = None
-console = Console()
+POLL_INTERVAL = 0.5
 
-def load_templates():
-    """Load templates for ranks and suits"""
-    global rank_templates, suit_templates, back_template
-    
-    # Check if templates directory exists
-    if not os.path.exists(TEMPLATES_DIR):
+# Direct screen-region capture (--screen) instead of the clipboard
+screen_capture = None
+
+# With --stdin: PNG images from iter_png_stream(), read in order; every one is
+# processed instead of only the newest
+stdin_frames = None
+keep_every_frame = False
+
+# Output: rich is only imported when a console is actually needed, so the
+# --quiet JSONL mode runs without it
+console = None
+quiet_mode = False
+REFRESH_PER_SECOND = 4
+
+# Shared pool for per-card recognition, reused across frames, unless the
+# autotuner found plain serial matching faster on this machine
+card_executor = ThreadPoolExecutor()
+serial_recognition = False
+LOOP_BACKENDS = ('serial', 'threads')
+
+# Recognizers, built once the templates are loaded. matcher selects between
+# the tiered cascade, the bit-packed Hamming classifier and whole-strip
+# detection (which does not slice the image at all).
+matcher = 'cascade'
+cascade = None
+hand_classifier = None
+strip_detector = None
+
+# Optional capture archive (--record)
+archive = None
+
+# Optional persistent result cache (--cache)
+result_cache = None
+
+# Optional columnar log of every processed frame (--results-log)
+results_log = None
+
+# Cards seen during the current deal, across frames
+deck_tracker = DeckTracker()
+
+# On-demand profiling (SIGUSR1, BELOT_PROFILE_FRAMES or profile.request)
+frame_profiler = None
+
+# A clipboard frame as it moves through the pipeline stages
+Frame = namedtuple('Frame', ['seq', 'hash', 'image', 'captured_at', 'card_data', 'scores', 'timings',
+                             'tiers', 'cached', 'deck', 'confidences'],
+                   defaults=[None, None, None, None, False, None, None])
+
+def get_console():
+    """Create the rich console on first use"""
+    global console
+    if console is None:
+        from rich.console import Console
+        console = Console()
+    return console
+
+def log(message):
+    """Print a status message; plain text on stderr in quiet mode"""
+    if quiet_mode:
+        print(re.sub(r'\[/?[a-z #]*\]', '', message), file=sys.stderr)
+    else:
+        get_console().print(message)
+
+def load_recognizer_config():
+    """Apply the calibrator's glyph regions, then recognizer_config.json (exported by
+    param_sweep.py) if present; regions set in the config win"""
+    global RANK_REGION, SUIT_REGION, MATCH_METHOD, MATCH_THRESHOLD, BACK_THRESHOLD, TEMPLATE_SCALE
+    global configured_regions
+    
+    if not os.path.exists(CONFIG_FILE):
+        RANK_REGION, SUIT_REGION = matching_regions()
         return False
     
+    with open(CONFIG_FILE) as f:
+        config = json.load(f)
+    
+    configured_regions = (config.get('rank_region'), config.get('suit_region'))
+    RANK_REGION, SUIT_REGION = matching_regions()
+    MATCH_METHOD = getattr(cv2, config.get('method', 'TM_CCOEFF_NORMED'))
+    MATCH_THRESHOLD = config.get('match_threshold', MATCH_THRESHOLD)
+    BACK_THRESHOLD = config.get('back_threshold', BACK_THRESHOLD)
+    TEMPLATE_SCALE = config.get('template_scale', TEMPLATE_SCALE)
+    return True
+
+def matching_regions(templates_dir=TEMPLATES_DIR):
+    """(rank, suit) regions to match for a template store: recognizer_config.json,
+    else the store's glyph regions, else the full template regions"""
+    rank_region, suit_region = read_glyph_regions(templates_dir) or (TEMPLATE_RANK_REGION, TEMPLATE_SUIT_REGION)
+    return (tuple(configured_regions[0] or rank_region),
+            tuple(configured_regions[1] or suit_region))
+
+def fit_template(template, template_region, region):
+    """Cut the configured region out of a template cut at template_region"""
+    ox, oy = template_region[:2]
+    x1, y1, x2, y2 = region
+    return template[y1-oy:y2-oy, x1-ox:x2-ox]
+
+def scale_region(img):
+    """Resize to TEMPLATE_SCALE (no-op at full resolution)"""
+    if TEMPLATE_SCALE == 1.0:
+        return img
+    return cv2.resize(img, None, fx=TEMPLATE_SCALE, fy=TEMPLATE_SCALE, interpolation=cv2.INTER_AREA)
+
+def match_score(gray, template):
+    """Template similarity where higher is better, whatever MATCH_METHOD is"""
+    result = cv2.matchTemplate(gray, template, MATCH_METHOD)
+    min_val, max_val, _, _ = cv2.minMaxLoc(result)
+    if MATCH_METHOD in (cv2.TM_SQDIFF, cv2.TM_SQDIFF_NORMED):
+        return 1.0 - min_val
+    return max_val
+
+def read_template_bank(templates_dir=TEMPLATES_DIR):
+    """Read the template store into a new TemplateBank, leaving the active one alone.
+    
+    The bank carries the store's matching regions, so a recalibration that
+    moves the glyph regions is swapped in together with its templates.
+    """
+    ranks, suits, back = {}, {}, None
+    rank_region, suit_region = matching_regions(templates_dir)
+    
     # Load rank templates
-    rank_dir = os.path.join(TEMPLATES_DIR, 'ranks')
+    rank_dir = os.path.join(templates_dir, 'ranks')
     if os.path.exists(rank_dir):
         for file in os.listdir(rank_dir):
             if file.endswith('.png'):
                 rank = os.path.splitext(file)[0]
-                template_path = os.path.join(rank_dir, file)
-                template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
+                template = cv2.imread(os.path.join(rank_dir, file), cv2.IMREAD_GRAYSCALE)
                 if template is not None:
-                    rank_templates[rank] = template
+                    ranks[rank] = fit_template(template, TEMPLATE_RANK_REGION, rank_region)
     
     # Load suit templates
-    suit_dir = os.path.join(TEMPLATES_DIR, 'suits')
+    suit_dir = os.path.join(templates_dir, 'suits')
     if os.path.exists(suit_dir):
         for file in os.listdir(suit_dir):
             if file.endswith('.png'):
                 suit = os.path.splitext(file)[0]
-                template_path = os.path.join(suit_dir, file)
-                template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
+                template = cv2.imread(os.path.join(suit_dir, file), cv2.IMREAD_GRAYSCALE)
                 if template is not None:
-                    suit_templates[suit] = template
+                    suits[suit] = fit_template(template, TEMPLATE_SUIT_REGION, suit_region)
     
     # Load card back template
-    back_path = os.path.join(TEMPLATES_DIR, 'back.png')
+    back_path = os.path.join(templates_dir, 'back.png')
     if os.path.exists(back_path):
-        back_template = cv2.imread(back_path, cv2.IMREAD_GRAYSCALE)
+        back = cv2.imread(back_path, cv2.IMREAD_GRAYSCALE)
+    
+    return TemplateBank(
+        ranks, suits, back,
+        {rank: scale_region(t) for rank, t in ranks.items()},
+        {suit: scale_region(t) for suit, t in suits.items()},
+        scale_region(back) if back is not None else None,
+        None,
+        (rank_region, suit_region))
+
+def validate_template_bank(bank):
+    """Raise ValueError unless every rank and suit is present at a consistent size"""
+    missing = [rank for rank in TRUMP_POINTS if rank not in bank.ranks]
+    missing += [suit for suit in SUITS if suit not in bank.suits]
+    if missing:
+        raise ValueError(f"missing templates: {' '.join(missing)}")
+    for kind, templates in (('rank', bank.ranks), ('suit', bank.suits)):
+        shapes = {t.shape for t in templates.values()}
+        if len(shapes) > 1:
+            raise ValueError(f"{kind} templates differ in size: {sorted(shapes)}")
+
+def prepare_template_bank(templates_dir):
+    """Load, validate and build the recognizer for a new store version (watcher thread)"""
+    bank = read_template_bank(templates_dir)
+    validate_template_bank(bank)
+    return bank._replace(recognizer=create_recognizer(bank.ranks, bank.suits, bank.back, bank.regions))
+
+def install_template_bank(bank):
+    """Make bank the active template set"""
+    global rank_templates, suit_templates, back_template
+    global scaled_rank_templates, scaled_suit_templates, scaled_back_template
+    global RANK_REGION, SUIT_REGION
+    
+    rank_templates, suit_templates, back_template = bank.ranks, bank.suits, bank.back
+    RANK_REGION, SUIT_REGION = bank.regions
+    scaled_rank_templates = bank.scaled_ranks
+    scaled_suit_templates = bank.scaled_suits
+    scaled_back_template = bank.scaled_back
+    if bank.recognizer is not None:
+        install_recognizer(bank.recognizer)
+
+def load_templates():
+    """Load templates for ranks and suits"""
+    # Check if templates directory exists
+    if not os.path.exists(TEMPLATES_DIR):
+        return False
     
+    install_template_bank(read_template_bank())
     return len(rank_templates) > 0 and len(suit_templates) > 0
 
 def get_image_from_clipboard():
-    """Get image from clipboard and convert to OpenCV format"""
+    """Get the clipboard image as the grayscale array recognition works on"""
     try:
         image = ImageGrab.grabclipboard()
-        if image is None:
+        if image is None or not hasattr(image, 'mode'):
             return None
-        img_array = np.array(image)
-        if len(img_array.shape) >= 3:
-            return cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-        return img_array
+        return ingest(image).gray
     except Exception as e:
-        console.print(f"[red]Error getting image from clipboard: {e}[/red]")
+        log(f"[red]Error getting image from clipboard: {e}[/red]")
         return None
 
 def get_clipboard_hash():
@@ -104,25 +305,52 @@ def get_clipboard_hash():
     if image is None:
         return None
     
-    # Convert to bytes and hash
-    image_bytes = np.array(image).tobytes()
-    return hashlib.md5(image_bytes).hexdigest()
+    return frame_digest(np.asarray(image))
+
+def grab_clipboard_frame():
+    """Grab the clipboard once and return (hash, image), or (None, None) without an image"""
+    try:
+        image = ImageGrab.grabclipboard()
+    except Exception as e:
+        log(f"[red]Error getting image from clipboard: {e}[/red]")
+        return None, None
+    
+    # Some platforms return a list of file names instead of an image
+    if image is None or not hasattr(image, 'size'):
+        return None, None
+    
+    frame = ingest(image)
+    return frame.digest, frame.gray
+
+def read_stdin_frame():
+    """Decode the next PNG from stdin as (hash, image); raises EOFError at the end"""
+    try:
+        data = next(stdin_frames)
+    except StopIteration:
+        raise EOFError
+    except ValueError as e:
+        log(f"[red]{e}[/red]")
+        raise EOFError
+    frame = ingest(data)
+    if frame is None:
+        log("[red]Imagine PNG invalidă pe stdin, ignorată.[/red]")
+        return None, None
+    return frame.digest, frame.gray
+
+def load_card_layout():
+    """Load an optional layout override (rows, overlapping cards) from card_layout.json"""
+    global card_layout
+    
+    if os.path.exists(LAYOUT_FILE):
+        card_layout = load_layout(LAYOUT_FILE)
+    return card_layout
 
-def slice_cards(image, card_width=CARD_WIDTH, card_height=CARD_HEIGHT, gap=CARD_GAP, max_cards=MAX_CARDS):
-    """Slice a row of cards into individual card images"""
+def slice_cards(image, layout=None):
+    """Slice a row, grid or fan of cards into individual card images"""
     if image is None:
         return []
-        
-    img_height, img_width = image.shape[:2]
-    cards = []
-    x = 0
-    
-    while x + card_width <= img_width and len(cards) < max_cards:
-        card = image[0:min(card_height, img_height), x:x+card_width]
-        cards.append(card)
-        x += card_width + gap
-        
-    return cards
+    
+    return list(slice_image(image, layout or card_layout))
 
 def extract_card_regions(card):
     """Extract rank and suit regions from a card image"""
@@ -141,49 +369,46 @@ def is_card_back(card):
         
     # Just check top-left corner
     corner = card[0:80, 0:80]
-    gray = cv2.cvtColor(corner, cv2.COLOR_BGR2GRAY)
+    gray = scale_region(to_gray(corner))
     
     # Template matching with back template
-    result = cv2.matchTemplate(gray, back_template, cv2.TM_CCOEFF_NORMED)
-    _, max_val, _, _ = cv2.minMaxLoc(result)
+    max_val = match_score(gray, scaled_back_template)
     
-    return max_val > 0.7  # High threshold for certainty
+    return max_val > BACK_THRESHOLD  # High threshold for certainty
 
 def identify_rank(rank_img):
     """Identify the rank of a card using template matching"""
-    gray = cv2.cvtColor(rank_img, cv2.COLOR_BGR2GRAY)
+    gray = scale_region(to_gray(rank_img))
     
     best_match = None
     best_score = -1
     
-    for rank, template in rank_templates.items():
+    for rank, template in scaled_rank_templates.items():
         # Template matching
-        result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, _ = cv2.minMaxLoc(result)
+        max_val = match_score(gray, template)
         
         if max_val > best_score:
             best_score = max_val
             best_match = rank
     
-    return best_match if best_score > 0.6 else '?'
+    return best_match if best_score > MATCH_THRESHOLD else '?'
 
 def identify_suit(suit_img):
     """Identify the suit of a card using template matching"""
-    gray = cv2.cvtColor(suit_img, cv2.COLOR_BGR2GRAY)
+    gray = scale_region(to_gray(suit_img))
     
     best_match = None
     best_score = -1
     
-    for suit, template in suit_templates.items():
+    for suit, template in scaled_suit_templates.items():
         # Template matching
-        result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, _ = cv2.minMaxLoc(result)
+        max_val = match_score(gray, template)
         
         if max_val > best_score:
             best_score = max_val
             best_match = suit
     
-    return best_match if best_score > 0.6 else '?'
+    return best_match if best_score > MATCH_THRESHOLD else '?'
 
 def identify_card(card_image):
     """Identify rank and suit from a card image"""
@@ -212,68 +437,161 @@ def calculate_points(cards, trump_suit):
             total += NON_TRUMP_POINTS.get(rank, 0)
     return total
 
-def process_clipboard_image():
-    """Process image found in clipboard"""
-    global last_clipboard_hash
+def create_recognizer(ranks, suits, back, regions=None):
+    """Build the recognizer selected by matcher for a set of templates cut at regions
+    (default: the active RANK_REGION and SUIT_REGION)"""
+    rank_region, suit_region = regions or (RANK_REGION, SUIT_REGION)
+    if matcher == 'strip':
+        return StripDetector(ranks, suits, back, rank_region=rank_region, suit_region=suit_region,
+                             threshold=MATCH_THRESHOLD, back_threshold=BACK_THRESHOLD,
+                             scale=TEMPLATE_SCALE)
+    if matcher == 'hamming':
+        return HandClassifier(ranks, suits, back, rank_region=rank_region, suit_region=suit_region)
+    return RecognitionCascade(ranks, suits, back, rank_region=rank_region, suit_region=suit_region,
+                              threshold=MATCH_THRESHOLD, back_threshold=BACK_THRESHOLD)
+
+def install_recognizer(recognizer):
+    """Make recognizer the one recognize_cards uses"""
+    global cascade, hand_classifier, strip_detector
+    if matcher == 'strip':
+        strip_detector = recognizer
+    elif matcher == 'hamming':
+        hand_classifier = recognizer
+    else:
+        cascade = recognizer
+
+def apply_tuning(choice):
+    """Size the cascade's per-card pool to the autotuned backend. The matcher
+    itself only changes with --matcher; the Hamming and strip matchers need no pool."""
+    global card_executor, serial_recognition
     
-    start_time = time.time()
+    if choice is None or matcher != 'cascade':
+        return
+    if choice.backend == 'serial':
+        serial_recognition = True
+    elif choice.backend == 'threads':
+        card_executor.shutdown(wait=False)
+        card_executor = ThreadPoolExecutor(max_workers=choice.workers)
+
+def build_cascade():
+    """Create the recognizer selected by matcher from the loaded templates"""
+    recognizer = create_recognizer(rank_templates, suit_templates, back_template)
+    install_recognizer(recognizer)
+    return recognizer
+
+def apply_template_reload():
+    """Swap in a bank prepared by the template watcher. Only called between
+    frames, so a frame never sees a mix of old and new templates."""
+    if template_watcher is None:
+        return False
+    ready = template_watcher.take()
+    if ready is None:
+        return False
+    
+    bank, version, load_time = ready
+    start = time.perf_counter()
+    install_template_bank(bank)
+    version = recognizer_version()
+    if result_cache is not None:
+        result_cache.set_version(version)
+    if archive is not None:
+        archive.set_recognizer(matcher, version)
+    log(f"[green]Template-uri reîncărcate (versiunea {version}): încărcare {load_time * 1000:.0f} ms, "
+        f"comutare {(time.perf_counter() - start) * 1000:.2f} ms[/green]")
+    return True
+
+def recognizer_version():
+    """Identify everything a cached result depends on: templates, layout and regions"""
+    parts = [template_bank_version(TEMPLATES_DIR) or 'none', matcher, repr(tuple(card_layout)),
+             repr(RANK_REGION), repr(SUIT_REGION),
+             repr((MATCH_METHOD, MATCH_THRESHOLD, BACK_THRESHOLD, TEMPLATE_SCALE))]
+    return hashlib.md5("|".join(parts).encode('utf-8')).hexdigest()[:16]
+
+def recognize_cards(image, serial=False):
+    """Slice an image and identify every card (CPU-bound).
+    
+    Returns (card_data, tiers) where tiers[i] is the cascade tier that
+    resolved card i (1 = lookup ... 4 = OCR; None for the Hamming and strip
+    matchers). serial=True keeps all work on the calling thread, so a profiler
+    sees it.
+    """
+    card_data, tiers, _ = recognize_cards_scored(image, serial)
+    return card_data, tiers
+
+def recognize_cards_scored(image, serial=False):
+    """recognize_cards plus each card's confidence: the lower of its rank and
+    suit scores, in the selected matcher's own scale (None when it has none)"""
+    if strip_detector is not None:
+        # Cards are located in the whole strip, independent of card_layout
+        detections = strip_detector.detect(image)
+        return ([(d.rank, d.suit) for d in detections], [None] * len(detections),
+                [min(d.rank_score, d.suit_score) for d in detections])
+    cards = slice_cards(image)
+    if hand_classifier is not None:
+        # One vectorised pass over all slots, no per-card threads needed
+        card_data, confidences = hand_classifier.identify_cards_scored(cards)
+        return card_data, [None] * len(cards), confidences
+    mapper = map if serial or serial_recognition else card_executor.map
+    if cascade is None:
+        return list(mapper(identify_card, cards)), [2] * len(cards), [None] * len(cards)
+    
+    results = list(mapper(cascade.identify, cards))
+    return ([(r.rank, r.suit) for r in results], [r.tier for r in results],
+            [min(r.rank_score, r.suit_score) for r in results])
+
+def score_cards(card_data):
+    """Count card categories and points for every possible trump suit"""
+    back_count = sum(1 for r, s in card_data if r == "back" and s == "back")
+    unknown_count = sum(1 for r, s in card_data if r != "back" and (r == '?' or s == '?'))
+    
+    # Filter out card backs for point calculation
+    valid_cards = [(r, s) for r, s in card_data if r != "back" and s != "back"]
+    points_by_suit = {suit: calculate_points(valid_cards, suit) for suit in SUITS}
+    
+    return {
+        'valid': len(valid_cards),
+        'backs': back_count,
+        'unknown': unknown_count,
+        'points': points_by_suit,
+    }
+
+def render_results(card_data, scores, elapsed):
+    """Print the identified cards and the points table for one frame"""
+    from rich.table import Table
+    console = get_console()
     
     # Clear screen for better display in continuous mode
     console.clear()
     
     console.print(f"[bold cyan]Belot Card Calculator - Continuous Mode[/bold cyan]")
     console.print(f"[dim]User: {USER} | Timpul: {time.strftime('%H:%M:%S')}[/dim]")
-    console.print("[yellow]Monitorizează clipboard pentru imagini cu cărți...[/yellow]")
-    
-    # Get image from clipboard
-    image = get_image_from_clipboard()
-    
-    if image is None:
-        console.print("[yellow]Nu s-a găsit nicio imagine în clipboard.[/yellow]")
-        return False
-    
-    # Slice cards from image
-    console.print("Procesează cărțile...", end="")
-    cards = slice_cards(image)
-    
-    if not cards:
-        console.print("\r[bold red]Nu s-au detectat cărți în imagine![/bold red]")
-        return True
-    
-    console.print(f"\r[green]S-au găsit {len(cards)} cărți![/green]")
     
-    # Identify each card (rank and suit)
-    console.print("Identificarea cărților...")
+    if not card_data:
+        console.print("[bold red]Nu s-au detectat cărți în imagine![/bold red]")
+        console.print("\n[yellow]Așteptând schimbări în clipboard...[/yellow]")
+        return
     
-    card_data = []
-    with ThreadPoolExecutor() as executor:
-        card_data = list(executor.map(identify_card, cards))
+    console.print(f"[green]S-au găsit {len(card_data)} cărți![/green]")
     
     # Show identified cards
-    unknown_count = 0
-    back_count = 0
     for i, (rank, suit) in enumerate(card_data):
         if rank == "back" and suit == "back":
-            back_count += 1
             console.print(f"Cartea {i+1}: [blue]Verso Carte[/blue]")
         elif rank == '?' or suit == '?':
-            unknown_count += 1
             console.print(f"Cartea {i+1}: [red]Neidentificată[/red]")
         else:
             color = SUIT_COLORS[suit]
             suit_name = SUIT_NAMES[suit]
             console.print(f"Cartea {i+1}: [{color}]{rank} de {suit_name} ({suit})[/{color}]")
     
-    if unknown_count > 0:
-        console.print(f"\n[yellow]Atenție: {unknown_count} cărți nu au putut fi identificate.[/yellow]")
+    if scores['unknown'] > 0:
+        console.print(f"\n[yellow]Atenție: {scores['unknown']} cărți nu au putut fi identificate.[/yellow]")
         console.print("[yellow]Încearcă să rulezi belot_calibrator.py din nou pentru acuratețe mai bună.[/yellow]")
     
-    # Filter out card backs for point calculation
-    valid_cards = [(r, s) for r, s in card_data if r != "back" and s != "back"]
-    
-    if len(valid_cards) == 0:
+    if scores['valid'] == 0:
         console.print("\n[yellow]Nu s-au găsit cărți valide pentru calculul punctelor.[/yellow]")
-        return True
+        console.print("\n[yellow]Așteptând schimbări în clipboard...[/yellow]")
+        return
     
     # Calculate points for all trump suits
     console.print("\n[bold]Puncte după atu:[/bold]")
@@ -282,52 +600,413 @@ def process_clipboard_image():
     table.add_column("Atu", style="bold")
     table.add_column("Puncte", justify="right")
     
-    # Calculate points for each possible trump suit
     for suit in SUITS:
-        points = calculate_points(valid_cards, suit)
         color = SUIT_COLORS[suit]
         suit_name = SUIT_NAMES[suit]
-        table.add_row(f"[{color}]{suit_name} ({suit})[/{color}]", str(points))
+        table.add_row(f"[{color}]{suit_name} ({suit})[/{color}]", str(scores['points'][suit]))
     
     console.print(table)
     
     # Print execution time
-    elapsed = time.time() - start_time
     console.print(f"\n[dim]Timp de execuție: {elapsed:.3f} secunde[/dim]")
-    console.print(f"[dim]Cărți valide: {len(valid_cards)}, Verso: {back_count}, Neidentificate: {unknown_count}[/dim]")
+    console.print(f"[dim]Cărți valide: {scores['valid']}, Verso: {scores['backs']}, Neidentificate: {scores['unknown']}[/dim]")
     console.print("\n[yellow]Așteptând schimbări în clipboard...[/yellow]")
+
+def card_label(rank, suit):
+    """Short text label for a recognised card"""
+    if rank == "back" and suit == "back":
+        return "back"
+    if rank == '?' or suit == '?':
+        return "?"
+    return f"{rank}{suit}"
+
+class JsonlRenderer:
+    """Headless output: one JSON object per frame on stdout, no rich"""
+    
+    def render(self, frame):
+        record = {
+            'seq': frame.seq,
+            'hash': frame.hash,
+            'time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(frame.captured_at)),
+            'cards': [card_label(r, s) for r, s in frame.card_data],
+            'tiers': frame.tiers,
+            'cached': frame.cached,
+            'points': frame.scores['points'],
+            'valid': frame.scores['valid'],
+            'backs': frame.scores['backs'],
+            'unknown': frame.scores['unknown'],
+            'deck': frame.deck,
+            'timings': {k: round(v, 6) for k, v in frame.timings.items()},
+            'elapsed': round(time.time() - frame.captured_at, 6),
+        }
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+    
+    def close(self):
+        pass
+
+class LiveRenderer:
+    """In-place terminal display that rebuilds only rows whose content changed.
+    
+    Frames only update the renderable; rich repaints the region on its own
+    timer at refresh_per_second, so bursts of frames cost one repaint.
+    """
+    
+    def __init__(self, refresh_per_second=REFRESH_PER_SECOND):
+        from rich.live import Live
+        self.live = Live(console=get_console(), refresh_per_second=refresh_per_second,
+                         auto_refresh=True, transient=False)
+        self.card_keys = []
+        self.card_rows = []
+        self.points_key = None
+        self.points_table = None
+        self.live.start()
+    
+    def card_row(self, index, rank, suit, tier):
+        from rich.text import Text
+        tier_note = f" [dim]({TIER_NAMES.get(tier, tier)})[/dim]" if tier is not None else ""
+        if rank == "back" and suit == "back":
+            return Text.from_markup(f"Cartea {index+1}: [blue]Verso Carte[/blue]{tier_note}")
+        if rank == '?' or suit == '?':
+            return Text.from_markup(f"Cartea {index+1}: [red]Neidentificată[/red]{tier_note}")
+        color = SUIT_COLORS[suit]
+        return Text.from_markup(
+            f"Cartea {index+1}: [{color}]{rank} de {SUIT_NAMES[suit]} ({suit})[/{color}]{tier_note}")
+    
+    def deck_line(self, deck):
+        from rich.text import Text
+        points = ", ".join(f"[{SUIT_COLORS[suit]}]{SUIT_NAMES[suit]}[/{SUIT_COLORS[suit]}] "
+                           f"{deck['remaining_points'][suit]}" for suit in SUITS)
+        exhausted = " ".join(deck['exhausted']) or "-"
+        return Text.from_markup(
+            f"[bold]Pachet (runda {deck['deal']}):[/bold] {len(deck['remaining'])} cărți rămase | "
+            f"Puncte rămase: {points} | Culori epuizate: {exhausted}")
+    
+    def render(self, frame):
+        from rich.console import Group
+        from rich.table import Table
+        from rich.text import Text
+        
+        # Rebuild only the card rows that differ from the previous frame
+        tiers = frame.tiers or [None] * len(frame.card_data)
+        keys = [(rank, suit, tier) for (rank, suit), tier in zip(frame.card_data, tiers)]
+        for i, key in enumerate(keys):
+            if i >= len(self.card_keys):
+                self.card_rows.append(self.card_row(i, *key))
+            elif self.card_keys[i] != key:
+                self.card_rows[i] = self.card_row(i, *key)
+        del self.card_rows[len(keys):]
+        self.card_keys = keys
+        
+        scores = frame.scores
+        points_key = tuple(scores['points'][suit] for suit in SUITS)
+        if points_key != self.points_key:
+            table = Table(title="Scor Belot")
+            table.add_column("Atu", style="bold")
+            table.add_column("Puncte", justify="right")
+            for suit, points in zip(SUITS, points_key):
+                color = SUIT_COLORS[suit]
+                table.add_row(f"[{color}]{SUIT_NAMES[suit]} ({suit})[/{color}]", str(points))
+            self.points_key = points_key
+            self.points_table = table
+        
+        elapsed = time.time() - frame.captured_at
+        header = Text.from_markup(
+            f"[bold cyan]Belot Card Calculator - Continuous Mode[/bold cyan]\n"
+            f"[dim]User: {USER} | Timpul: {time.strftime('%H:%M:%S')}[/dim]")
+        footer = Text.from_markup(
+            f"[dim]Timp de execuție: {elapsed:.3f} secunde{' (cache)' if frame.cached else ''}[/dim]\n"
+            f"[dim]Cărți valide: {scores['valid']}, Verso: {scores['backs']}, "
+            f"Neidentificate: {scores['unknown']}[/dim]\n"
+            "[yellow]Așteptând schimbări în clipboard...[/yellow]")
+        
+        parts = [header, *self.card_rows]
+        if scores['unknown'] > 0:
+            parts.append(Text.from_markup(
+                f"[yellow]Atenție: {scores['unknown']} cărți nu au putut fi identificate.[/yellow]"))
+        if scores['valid'] > 0:
+            parts.append(self.points_table)
+        if frame.deck is not None:
+            parts.append(self.deck_line(frame.deck))
+        parts.append(footer)
+        self.live.update(Group(*parts))
+    
+    def close(self):
+        self.live.stop()
+
+def process_clipboard_image():
+    """Process image found in clipboard"""
+    start_time = time.time()
+    
+    # Get image from clipboard
+    image = get_image_from_clipboard()
+    
+    if image is None:
+        log("[yellow]Nu s-a găsit nicio imagine în clipboard.[/yellow]")
+        return False
+    
+    card_data, _ = recognize_cards(image)
+    scores = score_cards(card_data)
+    render_results(card_data, scores, time.time() - start_time)
     
     return True
 
-def main():
+def offer_latest(queue, item):
+    """Put item on a bounded queue, superseding whatever is still waiting there"""
+    while True:
+        try:
+            queue.put_nowait(item)
+            return
+        except asyncio.QueueFull:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+
+async def forward(queue, item):
+    """Pass item to the next stage: newest-wins normally, every item when reading stdin"""
+    if keep_every_frame:
+        await queue.put(item)
+    else:
+        offer_latest(queue, item)
+
+async def capture_stage(out_queue):
+    """Poll the clipboard (or the screen region, or stdin) and emit each new image as a Frame.
+    
+    At the end of stdin a None is passed down so every stage finishes.
+    """
     global last_clipboard_hash
     
+    loop = asyncio.get_running_loop()
+    if stdin_frames is not None:
+        grab = read_stdin_frame
+    elif screen_capture is not None:
+        grab = screen_capture.read
+    else:
+        grab = grab_clipboard_frame
+    seq = 0
+    while True:
+        started = time.monotonic()
+        # Clipboard access can block (e.g. xclip on Linux), keep it off the loop
+        try:
+            frame_hash, image = await loop.run_in_executor(None, grab)
+        except EOFError:
+            await out_queue.put(None)
+            return
+        
+        # If clipboard has changed and contains an image; stdin frames are all kept
+        if frame_hash and (stdin_frames is not None or frame_hash != last_clipboard_hash):
+            last_clipboard_hash = frame_hash
+            seq += 1
+            await forward(out_queue, Frame(seq, frame_hash, image, time.time()))
+        
+        # Short sleep to prevent high CPU usage; screen capture keeps its frame rate
+        if stdin_frames is not None:
+            continue
+        if screen_capture is not None:
+            await asyncio.sleep(screen_capture.remaining(started))
+        else:
+            await asyncio.sleep(POLL_INTERVAL)
+
+async def recognize_stage(in_queue, out_queue):
+    """Identify the cards of the newest waiting frame in a worker thread"""
+    loop = asyncio.get_running_loop()
+    while True:
+        frame = await in_queue.get()
+        if frame is None:
+            await out_queue.put(None)
+            return
+        
+        # The previous frame has finished, so this is a safe point to swap
+        apply_template_reload()
+        start = time.time()
+        
+        # A cache hit skips recognition entirely
+        cached = result_cache.get(frame.hash) if result_cache is not None else None
+        if cached is not None:
+            card_data = [tuple(card) for card in cached['cards']]
+            tiers = cached['tiers']
+            confidences = cached.get('confidences')
+        elif frame_profiler is not None and frame_profiler.begin_frame():
+            card_data, tiers, confidences = await loop.run_in_executor(
+                None, frame_profiler.run, recognize_cards_scored, frame.image, True)
+            frame_profiler.end_frame()
+        else:
+            card_data, tiers, confidences = await loop.run_in_executor(None, recognize_cards_scored, frame.image)
+        if cached is None and result_cache is not None:
+            result_cache.put(frame.hash, {'cards': card_data, 'tiers': tiers, 'confidences': confidences})
+        timings = {'recognize': time.time() - start}
+        # The image is kept only when it still has to be archived
+        image = frame.image if archive is not None else None
+        await forward(out_queue, frame._replace(image=image, card_data=card_data, timings=timings,
+                                                tiers=tiers, cached=cached is not None,
+                                                confidences=confidences))
+
+async def score_stage(in_queue, out_queue):
+    """Compute points by trump suit and update the deck tracker for recognised frames"""
+    while True:
+        frame = await in_queue.get()
+        if frame is None:
+            await out_queue.put(None)
+            return
+        start = time.time()
+        scores = score_cards(frame.card_data)
+        new_deal = deck_tracker.update(frame.card_data)
+        deck = dict(deck_tracker.state()._asdict(), new_deal=new_deal)
+        timings = dict(frame.timings, score=time.time() - start)
+        await forward(out_queue, frame._replace(scores=scores, timings=timings, deck=deck))
+
+async def render_stage(in_queue, renderer):
+    """Display the newest scored frame, then log and archive it when enabled"""
+    loop = asyncio.get_running_loop()
+    while True:
+        frame = await in_queue.get()
+        if frame is None:
+            return
+        start = time.time()
+        renderer.render(frame)
+        timings = dict(frame.timings, render=time.time() - start)
+        if results_log is not None:
+            # A fixed-width append, cheap enough to stay on the event loop
+            results_log.record(frame.captured_at, frame.seq, frame.hash, frame.card_data, frame.scores,
+                               dict(timings, total=time.time() - frame.captured_at),
+                               frame.confidences, frame.tiers, frame.cached)
+        if archive is not None:
+            await loop.run_in_executor(None, archive.record, frame.hash, frame.image,
+                                       frame.card_data, frame.tiers, timings)
+
+async def run_pipeline(renderer):
+    """Run capture → recognize → score → render, linked by single-slot queues"""
+    # maxsize=1 plus offer_latest() means a newer frame replaces a stale one
+    # instead of queueing behind it (with --stdin, forward() waits instead)
+    frames = asyncio.Queue(maxsize=1)
+    recognized = asyncio.Queue(maxsize=1)
+    scored = asyncio.Queue(maxsize=1)
+    
+    await asyncio.gather(
+        capture_stage(frames),
+        recognize_stage(frames, recognized),
+        score_stage(recognized, scored),
+        render_stage(scored, renderer),
+    )
+
+def main():
+    global quiet_mode, archive, result_cache, results_log, matcher, frame_profiler, template_watcher
+    global screen_capture, stdin_frames, keep_every_frame
+    
+    parser = argparse.ArgumentParser(description="Belot Card Calculator - continuous clipboard mode")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="write one JSON line per frame to stdout instead of the live display")
+    parser.add_argument("--refresh", type=float, default=REFRESH_PER_SECOND,
+                        help="live display refreshes per second")
+    parser.add_argument("--record", metavar="ARCHIVE", default=None,
+                        help="append each distinct frame and its result to a capture archive "
+                             "(replay with: capture_archive.py replay ARCHIVE)")
+    parser.add_argument("--cache", metavar="DB", default=None,
+                        help="persistent SQLite cache of results keyed by frame digest")
+    parser.add_argument("--cache-size", type=int, default=5000,
+                        help="maximum cached frames (least recently used are evicted)")
+    parser.add_argument("--results-log", metavar="LOG", default=None,
+                        help="append every processed frame to a columnar log "
+                             "(query with: results_log.py summary LOG)")
+    parser.add_argument("--screen", metavar="X1,Y1,X2,Y2", default=None,
+                        help="grab this screen region directly instead of reading the clipboard")
+    parser.add_argument("--fps", type=float, default=10,
+                        help="screen grabs per second with --screen")
+    parser.add_argument("--fake-screen", metavar="IMAGE", nargs="+", default=None,
+                        help="with --screen, show these strip images on a synthetic screen (testing)")
+    parser.add_argument("--stdin", action="store_true",
+                        help="read concatenated PNG images from stdin instead of the clipboard, "
+                             "processing every one and exiting at the end (e.g. cat shots/*.png | ...)")
+    parser.add_argument("--matcher", choices=["cascade", "hamming", "strip"], default="cascade",
+                        help="cascade: tiered correlation matcher; hamming: binary bit-packed matcher; "
+                             "strip: detect cards anywhere in the image without slicing")
+    parser.add_argument("--no-autotune", action="store_true",
+                        help="ignore the backend tuned for this machine (autotune.py)")
+    parser.add_argument("--profile-frames", type=int, default=50,
+                        help="frames to profile when triggered by SIGUSR1 or profile.request")
+    parser.add_argument("--reload-interval", type=float, default=1.0,
+                        help="seconds between checks of templates/ for a recalibration")
+    parser.add_argument("--no-reload", action="store_true",
+                        help="do not pick up recalibrated templates while running")
+    args = parser.parse_args()
+    quiet_mode = args.quiet
+    matcher = args.matcher
+    if args.record:
+        archive = CaptureArchive(args.record)
+    if args.results_log:
+        try:
+            results_log = ResultsLog(args.results_log)
+        except ValueError as e:
+            parser.error(str(e))
+    
+    load_card_layout()
+    load_recognizer_config()
+    
     # Check if templates are available
     if not load_templates():
-        console.print("[bold red]Nu s-au găsit template-uri pentru cărți![/bold red]")
-        console.print("Rulează belot_calibrator.py mai întâi pentru a configura recunoașterea cărților.")
+        log("[bold red]Nu s-au găsit template-uri pentru cărți![/bold red]")
+        log("Rulează belot_calibrator.py mai întâi pentru a configura recunoașterea cărților.")
         return
-    
-    console.print("[bold cyan]Belot Card Calculator - Mod Continuu[/bold cyan]")
-    console.print(f"[dim]User: {USER} | Timpul: {CURRENT_TIME}[/dim]\n")
-    console.print("[yellow]Monitorizează clipboard pentru imagini cu cărți...[/yellow]")
-    console.print("[cyan]Apasă Ctrl+C pentru a opri[/cyan]\n")
+    if not args.no_autotune and matcher == 'cascade':
+        apply_tuning(ensure_tuning('belot_calculator_loop', LOOP_BACKENDS,
+                                   log=lambda message: log(f"[dim]{message}[/dim]"),
+                                   module=sys.modules[__name__]))
+    build_cascade()
+    if args.screen:
+        try:
+            region = parse_region(args.screen)
+            screen = FakeScreen(args.fake_screen) if args.fake_screen else None
+        except ValueError as e:
+            parser.error(str(e))
+        screen_capture = ScreenCapture(region, screen, fps=args.fps, layout=card_layout,
+                                       templates=rank_templates, template_region=RANK_REGION, log=log)
+    if args.stdin:
+        if args.screen:
+            parser.error("--stdin and --screen are mutually exclusive")
+        stdin_frames = iter_png_stream(sys.stdin.buffer)
+        keep_every_frame = True
+    if archive is not None:
+        archive.set_recognizer(matcher, recognizer_version())
+    if args.cache:
+        result_cache = ResultCache(args.cache, recognizer_version(), max_entries=args.cache_size)
     
     try:
-        while True:
-            # Get hash of current clipboard
-            current_hash = get_clipboard_hash()
-            
-            # If clipboard has changed and contains an image
-            if current_hash and current_hash != last_clipboard_hash:
-                last_clipboard_hash = current_hash
-                process_clipboard_image()
-            
-            # Short sleep to prevent high CPU usage
-            time.sleep(0.5)
-            
+        frame_profiler = FrameProfiler(PROFILES_DIR, control_file=PROFILE_REQUEST_FILE,
+                                       default_frames=args.profile_frames, log=log)
+    except ValueError as e:
+        parser.error(str(e))
+    frame_profiler.install_signal_handler()
+    
+    if not args.no_reload:
+        template_watcher = TemplateWatcher(TEMPLATES_DIR, prepare_template_bank,
+                                           interval=args.reload_interval, log=log).start()
+    
+    log("[bold cyan]Belot Card Calculator - Mod Continuu[/bold cyan]")
+    log(f"[dim]User: {USER} | Timpul: {CURRENT_TIME}[/dim]\n")
+    if stdin_frames is not None:
+        log("[yellow]Citește imagini PNG de pe stdin...[/yellow]")
+    else:
+        log("[yellow]Monitorizează clipboard pentru imagini cu cărți...[/yellow]")
+    log("[cyan]Apasă Ctrl+C pentru a opri[/cyan]\n")
+    
+    renderer = JsonlRenderer() if quiet_mode else LiveRenderer(args.refresh)
+    try:
+        asyncio.run(run_pipeline(renderer))
     except KeyboardInterrupt:
-        console.print("\n[bold cyan]Program oprit de utilizator.[/bold cyan]")
+        renderer.close()
+        log("\n[bold cyan]Program oprit de utilizator.[/bold cyan]")
+    finally:
+        renderer.close()
+        if template_watcher is not None:
+            template_watcher.stop()
+        if archive is not None:
+            archive.close()
+        if results_log is not None:
+            results_log.close()
+        if result_cache is not None:
+            result_cache.close()
+        card_executor.shutdown(wait=False, cancel_futures=True)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -7,10 +7,13 @@ from PIL import Image, ImageTk
 import tkinter as tk
 from tkinter import messagebox
 import json
-import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from rich.console import Console
 from rich.progress import Progress
 
+from template_bank import template_files
+
 # Current user and time information
 USER = "wolketich"
 CURRENT_TIME = "2025-04-23 08:33:58"
@@ -24,12 +27,29 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CARDS_DIR = os.path.join(BASE_DIR, 'cards')
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 MAPPING_FILE = os.path.join(BASE_DIR, 'card_mapping.json')
+MANIFEST_FILE = os.path.join(TEMPLATES_DIR, 'manifest.json')
+REGIONS_FILE = os.path.join(TEMPLATES_DIR, 'regions.json')
 
 # Card dimensions
 CARD_WIDTH = 180
 CARD_HEIGHT = 250
 CARD_GAP = 15
 
+# Template regions (x1, y1, x2, y2)
+RANK_REGION = (0, 0, 80, 80)
+SUIT_REGION = (0, 80, 80, 145)
+BACK_REGION = (0, 0, 80, 80)
+
+# Bump when the way templates are cut changes, so every template is rebuilt
+TEMPLATE_FORMAT = 1
+
+# Recognizers match only the part of each template region the glyphs can
+# cover: the union of the glyph ink over every exemplar, plus a margin for
+# slicing jitter and the border the candidate pruner ignores
+GLYPH_INK_THRESHOLD = 150
+GLYPH_MARGIN = 4
+MIN_GLYPH_AREA = 8
+
 console = Console()
 
 def download_cards():
@@ -240,20 +260,26 @@ def save_mapping(card_mapping):
     # Create templates directory
     create_templates(card_mapping)
 
-def create_templates(card_mapping):
-    """Create template images for each rank and suit"""
-    if os.path.exists(TEMPLATES_DIR):
-        shutil.rmtree(TEMPLATES_DIR)
-    
-    os.makedirs(os.path.join(TEMPLATES_DIR, 'ranks'), exist_ok=True)
-    os.makedirs(os.path.join(TEMPLATES_DIR, 'suits'), exist_ok=True)
-    
-    console.print("[bold cyan]Creating templates...[/bold cyan]")
-    
-    # Track which ranks and suits we've processed
-    processed_ranks = set()
-    processed_suits = set()
-    
+def file_digest(path):
+    """sha1 of a file's bytes, or None if it cannot be read"""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+
+def template_key(rel_path, source_file, card_info, region):
+    """Content address of a template: its source image, mapping entry and region"""
+    source_digest = file_digest(os.path.join(CARDS_DIR, source_file))
+    if source_digest is None:
+        return None
+    recipe = json.dumps([TEMPLATE_FORMAT, rel_path, source_file, card_info, list(region)],
+                        ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(f"{recipe}|{source_digest}".encode('utf-8')).hexdigest()
+
+def plan_templates(card_mapping):
+    """Pick the source card and region of every template: {rel_path: (source, info, region)}"""
+    plan = {}
     for card_file, card_info in card_mapping.items():
         rank = card_info['rank']
         suit = card_info['suit']
@@ -262,48 +288,198 @@ def create_templates(card_mapping):
         if rank == "back" and suit == "back":
             continue
         
-        # Read the card image
-        card_path = os.path.join(CARDS_DIR, card_file)
-        card = cv2.imread(card_path)
-        
+        # The first card of each rank and suit provides its template
+        plan.setdefault(f"ranks/{rank}.png", (card_file, card_info, RANK_REGION))
+        plan.setdefault(f"suits/{suit}.png", (card_file, card_info, SUIT_REGION))
+    
+    # Also create a template for card back
+    if os.path.exists(os.path.join(CARDS_DIR, "0.png")):
+        plan["back.png"] = ("0.png", card_mapping.get("0.png"), BACK_REGION)
+    return plan
+
+def load_manifest():
+    """Template entries recorded by the last create_templates run"""
+    try:
+        with open(MANIFEST_FILE, encoding='utf-8') as f:
+            return json.load(f).get('templates', {})
+    except (OSError, ValueError):
+        return {}
+
+def write_atomic(path, data):
+    """Write to a hidden temporary file next to path and rename it into place"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def write_template(job):
+    """Cut one template from its source card and write it atomically; returns its sha1"""
+    rel_path, source_file, region = job
+    card_path = os.path.join(CARDS_DIR, source_file)
+    card = cv2.imread(card_path)
+    if card is None:
+        raise OSError(f"Could not read {card_path}")
+    
+    x1, y1, x2, y2 = region
+    ok, buf = cv2.imencode('.png', card[y1:y2, x1:x2])
+    if not ok:
+        raise OSError(f"Could not encode {rel_path}")
+    data = buf.tobytes()
+    write_atomic(os.path.join(TEMPLATES_DIR, rel_path), data)
+    return hashlib.sha1(data).hexdigest()
+
+def glyph_box(card, region):
+    """Bounding box of the ink components centred inside region, clipped to it; None without ink.
+    
+    Components centred elsewhere (centre pips, face artwork, the card outline)
+    only reach into the region and are not part of its glyph.
+    """
+    gray = cv2.cvtColor(card, cv2.COLOR_BGR2GRAY) if card.ndim == 3 else card
+    ink = (gray < GLYPH_INK_THRESHOLD).astype(np.uint8)
+    count, _, stats, centroids = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    
+    x1, y1, x2, y2 = region
+    box = None
+    for i in range(1, count):
+        cx, cy = centroids[i]
+        if stats[i, cv2.CC_STAT_AREA] < MIN_GLYPH_AREA or not (x1 <= cx < x2 and y1 <= cy < y2):
+            continue
+        left, top, width, height = (int(v) for v in stats[i, :4])
+        part = (max(left, x1), max(top, y1), min(left + width, x2), min(top + height, y2))
+        if box is None:
+            box = part
+        else:
+            box = (min(box[0], part[0]), min(box[1], part[1]), max(box[2], part[2]), max(box[3], part[3]))
+    return box
+
+def derive_glyph_regions(card_mapping):
+    """Tight rank and suit regions over every exemplar in cards/.
+    
+    Returns ({'rank': region, 'suit': region}, exemplars used). A region falls
+    back to the full template region when no exemplar has ink in it.
+    """
+    boxes = {'rank': [], 'suit': []}
+    for card_file, card_info in card_mapping.items():
+        if card_info['rank'] == "back" and card_info['suit'] == "back":
+            continue
+        card = cv2.imread(os.path.join(CARDS_DIR, card_file))
         if card is None:
-            console.print(f"[red]Could not read {card_path}[/red]")
             continue
-        
-        # Extract rank region (0-80px X, 0-80px Y)
-        rank_region = card[0:80, 0:80]
-        
-        # Extract suit region (0-80px X, 80-145px Y)
-        suit_region = card[80:145, 0:80]
-        
-        # Save rank template if we haven't processed this rank yet
-        if rank not in processed_ranks:
-            rank_path = os.path.join(TEMPLATES_DIR, 'ranks', f"{rank}.png")
-            cv2.imwrite(rank_path, rank_region)
-            processed_ranks.add(rank)
-            console.print(f"Created template for rank: [cyan]{rank}[/cyan]")
-        
-        # Save suit template if we haven't processed this suit yet
-        if suit not in processed_suits:
-            suit_path = os.path.join(TEMPLATES_DIR, 'suits', f"{suit}.png")
-            cv2.imwrite(suit_path, suit_region)
-            processed_suits.add(suit)
-            console.print(f"Created template for suit: [cyan]{suit}[/cyan]")
-        
-        # Once we have all ranks and suits, we can stop
-        if len(processed_ranks) == len(RANKS) and len(processed_suits) == len(SUITS):
-            break
+        for kind, region in (('rank', RANK_REGION), ('suit', SUIT_REGION)):
+            box = glyph_box(card, region)
+            if box is not None:
+                boxes[kind].append(box)
+    
+    regions = {}
+    for kind, region in (('rank', RANK_REGION), ('suit', SUIT_REGION)):
+        if not boxes[kind]:
+            regions[kind] = region
+            continue
+        b = np.array(boxes[kind])
+        regions[kind] = (max(region[0], int(b[:, 0].min()) - GLYPH_MARGIN),
+                         max(region[1], int(b[:, 1].min()) - GLYPH_MARGIN),
+                         min(region[2], int(b[:, 2].max()) + GLYPH_MARGIN),
+                         min(region[3], int(b[:, 3].max()) + GLYPH_MARGIN))
+    return regions, len(boxes['rank'])
+
+def region_pixels(region):
+    x1, y1, x2, y2 = region
+    return (x2 - x1) * (y2 - y1)
+
+def save_glyph_regions(card_mapping):
+    """Derive the tight glyph regions, store them next to the templates and report the saving"""
+    regions, exemplars = derive_glyph_regions(card_mapping)
+    full = region_pixels(RANK_REGION) + region_pixels(SUIT_REGION)
+    tight = region_pixels(regions['rank']) + region_pixels(regions['suit'])
+    data = json.dumps({
+        'rank_region': list(regions['rank']),
+        'suit_region': list(regions['suit']),
+        'template_rank_region': list(RANK_REGION),
+        'template_suit_region': list(SUIT_REGION),
+        'exemplars': exemplars,
+        'pixels_per_card': {'full': full, 'tight': tight},
+    }, indent=4, sort_keys=True).encode('utf-8')
+    if file_digest(REGIONS_FILE) != hashlib.sha1(data).hexdigest():
+        write_atomic(REGIONS_FILE, data)
+    
+    for kind, region in (('Rank', RANK_REGION), ('Suit', SUIT_REGION)):
+        x1, y1, x2, y2 = regions[kind.lower()]
+        console.print(f"{kind} region: {x2 - x1}x{y2 - y1} at ({x1}, {y1}) instead of "
+                      f"{region[2] - region[0]}x{region[3] - region[1]}")
+    console.print(f"[green]Glyph regions from {exemplars} cards: {tight} instead of {full} pixels "
+                  f"per card ({100 * (1 - tight / full):.0f}% fewer per match)[/green]")
+    return regions
+
+def create_templates(card_mapping):
+    """Create template images for each rank and suit.
+    
+    Templates are content addressed: each one is keyed by its source image,
+    mapping entry and region, and only templates whose key changed (or whose
+    file is missing or modified) are rewritten, in parallel, each through an
+    atomic rename. templates/manifest.json records every key, so the next
+    run can skip the templates that did not change, and
+    templates/regions.json the tight glyph regions recognizers match.
+    """
+    console.print("[bold cyan]Creating templates...[/bold cyan]")
     
-    # Also create a template for card back
-    back_path = os.path.join(CARDS_DIR, "0.png")
-    if os.path.exists(back_path):
-        back_img = cv2.imread(back_path)
-        if back_img is not None:
-            # Save small version of back for detection
-            cv2.imwrite(os.path.join(TEMPLATES_DIR, 'back.png'), back_img[0:80, 0:80])
-            console.print("Created template for card back")
-    
-    console.print("[green]Templates created successfully![/green]")
+    manifest = load_manifest()
+    plan = plan_templates(card_mapping)
+    
+    entries = {}
+    jobs = []
+    for rel_path, (source_file, card_info, region) in sorted(plan.items()):
+        key = template_key(rel_path, source_file, card_info, region)
+        if key is None:
+            console.print(f"[red]Could not read {os.path.join(CARDS_DIR, source_file)}[/red]")
+            continue
+        entry = {'key': key, 'source': source_file, 'region': list(region)}
+        previous = manifest.get(rel_path)
+        if previous and previous.get('key') == key and \
+                previous.get('sha1') == file_digest(os.path.join(TEMPLATES_DIR, rel_path)):
+            entries[rel_path] = previous
+        else:
+            entries[rel_path] = entry
+            jobs.append((rel_path, source_file, region))
+    
+    # Rewrite only the changed templates, in parallel
+    with ThreadPoolExecutor() as executor:
+        futures = {rel_path: executor.submit(write_template, (rel_path, source_file, region))
+                   for rel_path, source_file, region in jobs}
+        written = 0
+        for rel_path, future in futures.items():
+            try:
+                entries[rel_path]['sha1'] = future.result()
+                written += 1
+                console.print(f"Created template: [cyan]{rel_path}[/cyan]")
+            except OSError as e:
+                console.print(f"[red]{e}[/red]")
+                del entries[rel_path]
+    
+    # Any template the new manifest does not list: labels that left the
+    # mapping, and files the manifest never knew about
+    stale = [rel_path for rel_path in template_files(TEMPLATES_DIR)
+             if rel_path.endswith('.png') and rel_path not in entries]
+    for rel_path in stale:
+        try:
+            os.remove(os.path.join(TEMPLATES_DIR, rel_path))
+            console.print(f"Removed template: [yellow]{rel_path}[/yellow]")
+        except OSError:
+            pass
+    
+    # Regions before the manifest: the manifest goes last, so a store it
+    # describes never has templates or regions missing
+    save_glyph_regions(card_mapping)
+    
+    # The manifest goes last, so it never lists a template that is not on disk
+    manifest_data = json.dumps({'format': TEMPLATE_FORMAT, 'templates': entries},
+                               indent=4, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    if jobs or stale or file_digest(MANIFEST_FILE) != hashlib.sha1(manifest_data).hexdigest():
+        write_atomic(MANIFEST_FILE, manifest_data)
+    
+    unchanged = len(entries) - written
+    console.print(f"[green]Templates up to date: {written} written, {unchanged} unchanged, "
+                  f"{len(stale)} removed[/green]")
 
 def main():
     console.print(f"[bold cyan]Belot Card Calibrator[/bold cyan]")
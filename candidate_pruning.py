@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Narrow the rank/suit templates worth correlating using cheap region features.
+
+For every slot of a hand at once this measures, on the rank and suit regions:
+
+    ink        number of pixels darker than INK_THRESHOLD
+    width      width of the ink bounding box
+    aspect     height / width of the ink bounding box
+    redness    mean (R - G) over the ink pixels; ♥♦ glyphs are red, ♠♣ black
+
+and keeps only the templates whose own features are within tolerance. Colour
+alone halves the suits; ink count splits most ranks into groups of two or
+three. Guards fall back to the full template set when the features are
+inconclusive (colour between the two levels, nothing left after pruning), and
+the recognizer falls back as well when the best pruned score misses the
+match threshold. A pruned set can still hold a wrong template that clears the
+threshold while the right one was dropped, so pruning can change a label.
+
+Run as a script for the pruning rate, accuracy and labels changed on cards/.
+"""
+import cv2
+import numpy as np
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CARDS_DIR = os.path.join(BASE_DIR, 'cards')
+MAPPING_FILE = os.path.join(BASE_DIR, 'card_mapping.json')
+
+RANK_REGION = (0, 0, 80, 80)
+SUIT_REGION = (0, 80, 80, 145)
+RED_SUITS = ('♥', '♦')
+
+# Gray levels below this count as ink (red glyphs land around 75)
+INK_THRESHOLD = 150
+
+# Pixels along the region edges ignored by the features, so a card edge or
+# the neighbouring card caught by a slightly misaligned slice is not ink
+BORDER = 3
+
+# Relative tolerances against the template's own features
+INK_TOLERANCE = 0.2
+SHAPE_TOLERANCE = 0.3
+
+# Mean R - G of ink: black glyphs sit near 0, red ones near 150. In between
+# the colour is not trusted.
+BLACK_LEVEL = 40
+RED_LEVEL = 90
+
+def stack_regions(cards, region):
+    """Same region of every card as one (N, H, W) gray or (N, H, W, 3) BGR array, padded with white"""
+    x1, y1, x2, y2 = region
+    shape = (len(cards), y2 - y1, x2 - x1) + ((3,) if cards and cards[0].ndim == 3 else ())
+    stack = np.full(shape, 255, dtype=np.uint8)
+    for i, card in enumerate(cards):
+        crop = card[y1:y2, x1:x2]
+        if crop.ndim != stack.ndim - 1:
+            crop = cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR if crop.ndim == 2 else cv2.COLOR_BGR2GRAY)
+        stack[i, :crop.shape[0], :crop.shape[1]] = crop
+    return stack
+
+def region_features(regions, colour=None):
+    """Features of a stack of regions: dict of (N,) arrays ink, width, aspect, redness.
+
+    Accepts (N, H, W, 3) BGR or (N, H, W) gray. For gray input, colour (BGR
+    copies of the same regions) supplies redness; without it redness is 0.
+    """
+    regions = np.asarray(regions)[:, BORDER:-BORDER, BORDER:-BORDER]
+    if regions.ndim == 4:
+        b, g, r = (regions[..., c].astype(np.int16) for c in range(3))
+        gray = (0.114 * b + 0.587 * g + 0.299 * r)
+        redness_map = r - g
+    else:
+        gray = regions.astype(np.float32)
+        if colour is not None:
+            colour = np.asarray(colour)[:, BORDER:-BORDER, BORDER:-BORDER].astype(np.int16)
+            redness_map = colour[..., 2] - colour[..., 1]
+        else:
+            redness_map = np.zeros(regions.shape, dtype=np.int16)
+    ink = gray < INK_THRESHOLD
+    count = ink.sum(axis=(1, 2))
+
+    # Ink bounding box from the first and last inked column and row
+    cols = ink.any(axis=1)
+    rows = ink.any(axis=2)
+    width = np.where(count > 0, cols.shape[1] - cols[:, ::-1].argmax(axis=1) - cols.argmax(axis=1), 0)
+    height = np.where(count > 0, rows.shape[1] - rows[:, ::-1].argmax(axis=1) - rows.argmax(axis=1), 0)
+
+    redness = (redness_map * ink).sum(axis=(1, 2)) / np.maximum(count, 1)
+    return {
+        'ink': count,
+        'width': width,
+        'aspect': height / np.maximum(width, 1),
+        'redness': redness,
+    }
+
+def template_features(templates):
+    """Features of each template: {label: (ink, width, aspect)}"""
+    labels = list(templates)
+    if not labels:
+        return {}
+    features = [region_features(templates[label][None]) for label in labels]
+    return {label: (float(f['ink'][0]), float(f['width'][0]), float(f['aspect'][0]))
+            for label, f in zip(labels, features)}
+
+def within(value, reference, tolerance):
+    return abs(value - reference) <= tolerance * max(reference, 1.0)
+
+class CandidatePruner:
+    """Per-slot candidate template sets from cheap features, with pruning statistics"""
+
+    def __init__(self, rank_templates, suit_templates, rank_region=RANK_REGION, suit_region=SUIT_REGION):
+        self.rank_features = template_features(rank_templates)
+        self.suit_features = template_features(suit_templates)
+        self.rank_region = rank_region
+        self.suit_region = suit_region
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    def prune(self, features, i, templates, colour=None):
+        kept = []
+        for label, (ink, width, aspect) in templates.items():
+            if colour is not None and (label in RED_SUITS) != (colour == 'red'):
+                continue
+            if not within(features['ink'][i], ink, INK_TOLERANCE):
+                continue
+            if not within(features['width'][i], width, SHAPE_TOLERANCE) or \
+                    not within(features['aspect'][i], aspect, SHAPE_TOLERANCE):
+                continue
+            kept.append(label)
+        return kept
+
+    def candidates(self, cards, corners=None):
+        """Return [(rank candidates, suit candidates)] for every card; None means all.
+
+        Gray cards carry no colour, so the suit-colour check needs corners, BGR
+        copies of the cards' index corners (see ingest.color_corners).
+        """
+        if not cards:
+            return []
+        rank_colour = suit_colour = None
+        if corners is not None and cards[0].ndim == 2:
+            rank_colour = stack_regions(corners, self.rank_region)
+            suit_colour = stack_regions(corners, self.suit_region)
+        rank = region_features(stack_regions(cards, self.rank_region), rank_colour)
+        suit = region_features(stack_regions(cards, self.suit_region), suit_colour)
+
+        result = []
+        stats = Counter()
+        for i in range(len(cards)):
+            # The rank and suit glyphs share a colour; both must agree
+            levels = (rank['redness'][i], suit['redness'][i])
+            colour = None
+            if all(level >= RED_LEVEL for level in levels):
+                colour = 'red'
+            elif all(level <= BLACK_LEVEL for level in levels):
+                colour = 'black'
+            else:
+                stats['colour_unsure'] += 1
+
+            ranks = self.prune(rank, i, self.rank_features)
+            suits = self.prune(suit, i, self.suit_features, colour)
+            if not ranks:
+                stats['rank_fallback'] += 1
+                ranks = None
+            if not suits:
+                stats['suit_fallback'] += 1
+                suits = None
+
+            stats['rank_total'] += len(self.rank_features)
+            stats['suit_total'] += len(self.suit_features)
+            stats['rank_kept'] += len(ranks) if ranks is not None else len(self.rank_features)
+            stats['suit_kept'] += len(suits) if suits is not None else len(self.suit_features)
+            result.append((ranks, suits))
+
+        with self.lock:
+            self.stats.update(stats)
+        return result
+
+    def record_fallback(self, kind):
+        """The recognizer retried a region with every template"""
+        with self.lock:
+            self.stats[f'{kind}_rescored'] += 1
+            self.stats[f'{kind}_kept'] += len(self.rank_features if kind == 'rank' else self.suit_features)
+
+    def pruning_rate(self, kind):
+        total = self.stats[f'{kind}_total']
+        return 1.0 - self.stats[f'{kind}_kept'] / total if total else 0.0
+
+    def report(self):
+        s = self.stats
+        fallbacks = s['rank_fallback'] + s['suit_fallback'] + s['rank_rescored'] + s['suit_rescored']
+        return (f"Pruned {100 * self.pruning_rate('rank'):.0f}% of rank and "
+                f"{100 * self.pruning_rate('suit'):.0f}% of suit comparisons; "
+                f"{fallbacks} fallback(s) to the full set")
+
+def benchmark(repeat=5):
+    import belot_calculator
+
+    belot_calculator.load_recognizer_config()
+    if not belot_calculator.load_templates():
+        print("Card templates not found. Run belot_calibrator.py first.", file=sys.stderr)
+        return 1
+    with open(MAPPING_FILE) as f:
+        mapping = json.load(f)
+    cards, labels = [], []
+    for filename, info in mapping.items():
+        card = cv2.imread(os.path.join(CARDS_DIR, filename))
+        if card is not None:
+            cards.append(card)
+            labels.append((info['rank'], info['suit']))
+
+    pruner = CandidatePruner(belot_calculator.rank_templates, belot_calculator.suit_templates,
+                             belot_calculator.RANK_REGION, belot_calculator.SUIT_REGION)
+    belot_calculator.candidate_pruner = pruner
+
+    def run(name, fn):
+        predicted = fn()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        per_card = (time.perf_counter() - start) / (repeat * len(cards))
+        correct = sum(p == l for p, l in zip(predicted, labels))
+        print(f"{name:<10} {correct}/{len(labels)} correct, {per_card * 1e6:8.1f} µs/card")
+        return per_card, predicted
+
+    print(f"{len(cards)} cards from {CARDS_DIR}")
+    full, full_labels = run("full", lambda: [belot_calculator.identify_card(c) for c in cards])
+    pruned, pruned_labels = run("pruned", lambda: [belot_calculator.identify_card(c, cands)
+                                     for c, cands in zip(cards, pruner.candidates(cards))])
+    print(f"Speed-up: {full / pruned:.2f}x")
+    print(f"Labels changed by pruning: {sum(f != p for f, p in zip(full_labels, pruned_labels))}")
+    print(pruner.report())
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure feature-based candidate pruning on cards/')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='timed repetitions')
+    args = parser.parse_args()
+    return benchmark(args.repeat)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""Append-only archive of processed loop frames for offline replay.
+
+The archive is a single file of length-prefixed records:
+
+    kind (1 byte: F = frame, R = result) | header length (4) | payload length (4)
+    | header (UTF-8 JSON) | payload
+
+Frame records are content-addressed by the frame digest and written once per
+distinct image, as lossless PNG. Every processed frame adds a small result
+record with the recognised labels and stage timings, pointing at its frame,
+and the matcher and recognizer version that produced them. Replay uses the
+recorded matcher unless told otherwise, and only compares labels recorded by
+the matcher it runs.
+"""
+import cv2
+import numpy as np
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+import threading
+from collections import Counter
+
+RECORD_HEADER = struct.Struct('>cII')
+FRAME = b'F'
+RESULT = b'R'
+
+# Archives written before results recorded their matcher came from the loop's default
+DEFAULT_MATCHER = 'cascade'
+
+def iter_records(path):
+    """Yield (kind, header, payload offset, payload length) for every complete record"""
+    with open(path, 'rb') as f:
+        while True:
+            offset = f.tell()
+            prefix = f.read(RECORD_HEADER.size)
+            if len(prefix) < RECORD_HEADER.size:
+                return
+            kind, header_len, payload_len = RECORD_HEADER.unpack(prefix)
+            header_bytes = f.read(header_len)
+            payload_offset = f.tell()
+            f.seek(payload_len, os.SEEK_CUR)
+            if len(header_bytes) < header_len or f.tell() > os.fstat(f.fileno()).st_size:
+                # Torn write at the end of the file (e.g. killed mid-record)
+                return
+            yield kind, json.loads(header_bytes), payload_offset, payload_len
+
+def read_payload(f, offset, length):
+    f.seek(offset)
+    return f.read(length)
+
+class CaptureArchive:
+    """Writer side: deduplicates frames and appends results"""
+
+    def __init__(self, path, matcher=None, version=None):
+        self.path = path
+        self.frames = set()
+        self.lock = threading.Lock()
+        self.matcher = matcher
+        self.version = version
+        good_end = 0
+        if os.path.exists(path):
+            for kind, header, offset, length in iter_records(path):
+                if kind == FRAME:
+                    self.frames.add(header['digest'])
+                good_end = offset + length
+            # Drop a torn trailing record so new records stay readable
+            if os.path.getsize(path) > good_end:
+                os.truncate(path, good_end)
+        self.file = open(path, 'ab')
+
+    def set_recognizer(self, matcher, version):
+        """Matcher and recognizer version recorded with the following results"""
+        with self.lock:
+            self.matcher = matcher
+            self.version = version
+
+    def append(self, kind, header, payload=b''):
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        self.file.write(RECORD_HEADER.pack(kind, len(header_bytes), len(payload)))
+        self.file.write(header_bytes)
+        self.file.write(payload)
+
+    def record(self, digest, image, card_data, tiers=None, timings=None):
+        """Store the frame (once per digest) and the result of processing it"""
+        with self.lock:
+            if digest not in self.frames:
+                ok, png = cv2.imencode('.png', image)
+                if ok:
+                    self.append(FRAME, {'digest': digest, 'shape': list(image.shape)}, png.tobytes())
+                    self.frames.add(digest)
+            self.append(RESULT, {
+                'digest': digest,
+                'time': time.time(),
+                'cards': [[rank, suit] for rank, suit in card_data],
+                'tiers': tiers,
+                'timings': timings or {},
+                'matcher': self.matcher,
+                'recognizer': self.version,
+            })
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def load_index(path):
+    """Map digest -> (payload offset, length) of its frame, and digest -> latest result header"""
+    frames = {}
+    results = {}
+    for kind, header, offset, length in iter_records(path):
+        if kind == FRAME:
+            frames[header['digest']] = (offset, length)
+        elif kind == RESULT:
+            results[header['digest']] = header
+    return frames, results
+
+def recorded_matcher(result):
+    return result.get('matcher') or DEFAULT_MATCHER
+
+def replay(path, limit=None, matcher=None):
+    """Push every archived frame through the current recognizer at full speed.
+
+    matcher defaults to the one most of the archived results were recorded
+    with; labels recorded by another matcher are not compared.
+    """
+    import belot_calculator_loop as loop
+
+    frames, results = load_index(path)
+    digests = list(frames)[:limit]
+    if matcher is None:
+        recorded = Counter(recorded_matcher(results[d]) for d in digests if d in results)
+        matcher = recorded.most_common(1)[0][0] if recorded else DEFAULT_MATCHER
+
+    loop.quiet_mode = True
+    loop.matcher = matcher
+    loop.load_card_layout()
+    loop.load_recognizer_config()
+    if not loop.load_templates():
+        print("Card templates not found. Run belot_calibrator.py first.", file=sys.stderr)
+        return 1
+    loop.build_cascade()
+    version = loop.recognizer_version()
+
+    diffs = []
+    other_matcher = 0
+    other_version = 0
+    cards_total = 0
+    decode_time = 0.0
+    recognize_time = 0.0
+    with open(path, 'rb') as f:
+        for digest in digests:
+            offset, length = frames[digest]
+            start = time.perf_counter()
+            image = cv2.imdecode(np.frombuffer(read_payload(f, offset, length), np.uint8), cv2.IMREAD_GRAYSCALE)
+            decode_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            card_data, _ = loop.recognize_cards(image)
+            recognize_time += time.perf_counter() - start
+            cards_total += len(card_data)
+
+            result = results.get(digest, {})
+            if result and recorded_matcher(result) != matcher:
+                other_matcher += 1
+                continue
+            if result.get('recognizer') not in (None, version):
+                other_version += 1
+            recorded = [tuple(card) for card in result.get('cards', [])]
+            if recorded and recorded != card_data:
+                changed = [(i, loop.card_label(*old), loop.card_label(*new))
+                           for i, (old, new) in enumerate(zip(recorded, card_data)) if old != new]
+                if len(recorded) != len(card_data):
+                    changed.append(('count', len(recorded), len(card_data)))
+                diffs.append((digest, changed))
+
+    loop.card_executor.shutdown()
+
+    n = len(digests)
+    print(f"Frames: {n} distinct ({len(results)} with results), cards: {cards_total}, matcher: {matcher}")
+    if n:
+        print(f"Decode: {decode_time:.3f}s, recognize: {recognize_time:.3f}s "
+              f"→ {n / max(recognize_time, 1e-9):.1f} frames/s, "
+              f"{cards_total / max(recognize_time, 1e-9):.1f} cards/s")
+    if other_matcher:
+        print(f"Not compared: {other_matcher} frame(s) recorded with another matcher")
+    if other_version:
+        print(f"Recorded with other templates or settings: {other_version} frame(s); "
+              f"their diffs can be expected changes")
+    print(f"Label diffs: {len(diffs)} frame(s)")
+    for digest, changed in diffs:
+        for slot, old, new in changed:
+            print(f"  {digest[:12]} card {slot}: {old} → {new}")
+    return 0
+
+def stats(path):
+    frame_count = 0
+    result_count = 0
+    frame_bytes = 0
+    for kind, header, _, length in iter_records(path):
+        if kind == FRAME:
+            frame_count += 1
+            frame_bytes += length
+        elif kind == RESULT:
+            result_count += 1
+    print(f"{path}: {os.path.getsize(path)} bytes")
+    print(f"Distinct frames: {frame_count} ({frame_bytes} bytes compressed)")
+    print(f"Processed frames: {result_count}")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or replay a loop capture archive')
+    sub = parser.add_subparsers(dest='command', required=True)
+    replay_parser = sub.add_parser('replay', help='re-run recognition on every archived frame')
+    replay_parser.add_argument('archive')
+    replay_parser.add_argument('-n', '--limit', type=int, default=None, help='replay at most N frames')
+    replay_parser.add_argument('--matcher', choices=['cascade', 'hamming', 'strip'], default=None,
+                               help='recognizer to replay with (default: the one the archive was recorded with)')
+    stats_parser = sub.add_parser('stats', help='count frames and results')
+    stats_parser.add_argument('archive')
+    args = parser.parse_args()
+
+    if args.command == 'replay':
+        return replay(args.archive, args.limit, args.matcher)
+    return stats(args.archive)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,29 +1,216 @@
 import cv2
 import os
+import json
+import argparse
+import numpy as np
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
 
-def slice_card_row(image_path, output_dir='cards_output', card_width=180, card_height=250, gap=15):
-    image = cv2.imread(image_path)
-    if image is None:
-        print("❌ Could not load image.")
-        return
+# Geometry of a hand layout. A negative gap/row_gap means neighbouring cards
+# overlap (fanned hands, trick piles); rows=None means "as many rows as fit"
+# and max_cards=None "as many cards as fit". crop selects what is emitted per
+# card: 'card' is the full card, 'corner' only the rank/suit index region that
+# recognition looks at, and 'auto' picks 'corner' whenever cards overlap.
+CardLayout = namedtuple('CardLayout', ['card_width', 'card_height', 'gap', 'max_cards',
+                                       'rows', 'row_gap', 'crop',
+                                       'corner_width', 'corner_height'],
+                        defaults=[180, 250, 15, None, 1, 15, 'auto', 80, 145])
+DEFAULT_LAYOUT = CardLayout()
+
+def load_layout(path):
+    """Read a CardLayout from a JSON file; missing keys keep their defaults"""
+    with open(path) as f:
+        values = json.load(f)
+    return CardLayout(**{k: v for k, v in values.items() if k in CardLayout._fields})
+
+def is_overlapping(layout):
+    return layout.gap < 0 or (layout.rows != 1 and layout.row_gap < 0)
+
+def crop_size(layout):
+    """(height, width) of every crop emitted for this layout"""
+    if layout.crop == 'corner' or (layout.crop == 'auto' and is_overlapping(layout)):
+        return (min(layout.corner_height, layout.card_height),
+                min(layout.corner_width, layout.card_width))
+    return layout.card_height, layout.card_width
+
+def grid_shape(img_width, img_height, layout=DEFAULT_LAYOUT):
+    """(rows, columns) of card positions that fit in an image of this size"""
+    # Only the last card of a row/column is fully exposed, so it alone must fit
+    x_step = layout.card_width + layout.gap
+    y_step = layout.card_height + layout.row_gap
+    if img_width < layout.card_width or x_step <= 0:
+        return 0, 0
+    columns = (img_width - layout.card_width) // x_step + 1
+
+    if layout.rows == 1:
+        # A single strip may be cropped slightly shorter than a card
+        rows = 1 if img_height > 0 else 0
+    else:
+        if y_step <= 0:
+            return 0, 0
+        fit = max(0, (img_height - layout.card_height) // y_step + 1)
+        rows = fit if layout.rows is None else min(layout.rows, fit)
+    return rows, columns
+
+def count_slices(img_width, img_height, layout=DEFAULT_LAYOUT):
+    """Number of crops slice_image() will yield for an image of this size"""
+    rows, columns = grid_shape(img_width, img_height, layout)
+    count = rows * columns
+    if layout.max_cards is not None:
+        count = min(count, layout.max_cards)
+    return count
+
+def slice_image(image, layout=DEFAULT_LAYOUT):
+    """Yield each card crop of an already decoded image (views, no copies).
+
+    Cards are emitted row by row, left to right. For overlapping layouts only
+    the top-left index corner of each card is visible, so only that is cut out.
+    """
+    img_height, img_width = image.shape[:2]
+    rows, columns = grid_shape(img_width, img_height, layout)
+    crop_h, crop_w = crop_size(layout)
+    remaining = count_slices(img_width, img_height, layout)
+
+    for row in range(rows):
+        y = row * (layout.card_height + layout.row_gap)
+        for column in range(columns):
+            if remaining == 0:
+                return
+            x = column * (layout.card_width + layout.gap)
+            yield image[y:y+crop_h, x:x+crop_w]
+            remaining -= 1
+
+def iter_card_slices(image_paths, layout=DEFAULT_LAYOUT):
+    """Lazily decode each input and yield (image_path, card_index, crop)"""
+    for image_path in image_paths:
+        image = cv2.imread(image_path)
+        if image is None:
+            print(f"❌ Could not load image: {image_path}")
+            continue
+        for card_index, card in enumerate(slice_image(image, layout)):
+            yield image_path, card_index, card
+
+def extract_to_memory(image_paths, layout=DEFAULT_LAYOUT):
+    """Return every crop as a list of (image_path, card_index, crop) without touching disk"""
+    return [(path, index, card.copy()) for path, index, card in iter_card_slices(image_paths, layout)]
+
+def extract_to_array(image_paths, output_path, layout=DEFAULT_LAYOUT):
+    """Pack all crops into one .npy file of shape (N, crop_height, crop_width, 3).
 
+    The array is written through a memory map, so only one input image is held
+    in memory at a time; reopen it with load_packed(). A sidecar JSON lists the
+    source image and card index of every row.
+    """
+    from PIL import Image
+
+    # Image headers are enough to size the output up front
+    total = 0
+    for image_path in image_paths:
+        try:
+            with Image.open(image_path) as img:
+                total += count_slices(img.width, img.height, layout)
+        except OSError:
+            continue
+
+    crop_h, crop_w = crop_size(layout)
+    packed = np.lib.format.open_memmap(
+        output_path, mode='w+', dtype=np.uint8,
+        shape=(total, crop_h, crop_w, 3))
+
+    index = []
+    for row, (image_path, card_index, card) in enumerate(iter_card_slices(image_paths, layout)):
+        if row >= total:
+            break
+        h = card.shape[0]
+        packed[row, :h] = card
+        packed[row, h:] = 0
+        index.append({'source': image_path, 'card': card_index})
+
+    packed.flush()
+    del packed
+
+    with open(os.path.splitext(output_path)[0] + '.json', 'w') as f:
+        json.dump({'layout': layout._asdict(), 'cards': index}, f, indent=4)
+
+    print(f"✅ Packed {len(index)} card(s) into: {output_path}")
+    return len(index)
+
+def load_packed(path):
+    """Memory-map a file written by extract_to_array()"""
+    return np.load(path, mmap_mode='r')
+
+def _write_png(job):
+    path, card = job
+    ok, buf = cv2.imencode('.png', card)
+    if ok:
+        buf.tofile(path)
+    return ok
+
+def extract_to_pngs(image_paths, output_dir='cards_output', layout=DEFAULT_LAYOUT, workers=None):
+    """Write one PNG per crop, encoding in a thread pool while slicing continues"""
     os.makedirs(output_dir, exist_ok=True)
+    single = len(image_paths) == 1
 
-    img_height, img_width, _ = image.shape
-    y = 0  # Since it’s a single row
-    x = 0
-    card_index = 0
+    def jobs():
+        for image_path, card_index, card in iter_card_slices(image_paths, layout):
+            if single:
+                filename = f'card_{card_index:02d}.png'
+            else:
+                stem = os.path.splitext(os.path.basename(image_path))[0]
+                filename = f'{stem}_card_{card_index:02d}.png'
+            yield os.path.join(output_dir, filename), card
 
-    while x + card_width <= img_width:
-        card = image[y:y+card_height, x:x+card_width]
+    # cv2.imencode releases the GIL, so threads give real parallelism here.
+    # Submission is windowed so decoded inputs are not all held at once.
+    written = 0
+    window = 4 * (workers or os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for job in jobs():
+            pending.append(executor.submit(_write_png, job))
+            if len(pending) >= window:
+                written += pending.popleft().result()
+        while pending:
+            written += pending.popleft().result()
+
+    print(f"✅ Extracted {written} card(s) to folder: {output_dir}")
+    return written
+
+def slice_card_row(image_path, output_dir='cards_output', card_width=180, card_height=250, gap=15):
+    layout = CardLayout(card_width, card_height, gap)
+    return extract_to_pngs([image_path], output_dir, layout)
 
-        filename = f'card_{card_index:02d}.png'
-        cv2.imwrite(os.path.join(output_dir, filename), card)
+def main():
+    parser = argparse.ArgumentParser(description='Slice hand strips into individual card images')
+    parser.add_argument('inputs', nargs='*', default=['cards_input.png'], help='input strip images')
+    parser.add_argument('-f', '--format', default='png', choices=['png', 'npy'],
+                        help='png: one file per card; npy: single memory-mappable array')
+    parser.add_argument('-o', '--output', default=None,
+                        help='output folder (png) or file (npy)')
+    parser.add_argument('--layout', default=None, help='JSON file with layout overrides')
+    parser.add_argument('--card-width', type=int, default=None)
+    parser.add_argument('--card-height', type=int, default=None)
+    parser.add_argument('--gap', type=int, default=None,
+                        help='horizontal gap between cards; negative for fanned hands')
+    parser.add_argument('--max-cards', type=int, default=None)
+    parser.add_argument('--rows', type=int, default=None, help='number of rows; 0 for as many as fit')
+    parser.add_argument('--row-gap', type=int, default=None,
+                        help='vertical gap between rows; negative for overlapping piles')
+    parser.add_argument('--crop', default=None, choices=['auto', 'card', 'corner'])
+    parser.add_argument('-w', '--workers', type=int, default=None, help='PNG encoder threads')
+    args = parser.parse_args()
 
-        card_index += 1
-        x += card_width + gap
+    layout = load_layout(args.layout) if args.layout else DEFAULT_LAYOUT
+    overrides = {field: getattr(args, field) for field in CardLayout._fields
+                 if getattr(args, field) is not None}
+    layout = layout._replace(**overrides)
+    if layout.rows == 0:
+        layout = layout._replace(rows=None)
 
-    print(f"✅ Extracted {card_index} card(s) to folder: {output_dir}")
+    if args.format == 'npy':
+        extract_to_array(args.inputs, args.output or 'cards_output.npy', layout)
+    else:
+        extract_to_pngs(args.inputs, args.output or 'cards_output', layout, workers=args.workers)
 
-# Example usage
-slice_card_row('cards_input.png')
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,9 @@
 import cv2
+import numpy as np
 import pytesseract
 import os
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 # Set Tesseract path if needed
 # pytesseract.pytesseract.tesseract_cmd = r'/usr/bin/tesseract'
@@ -8,49 +11,156 @@ import os
 # Belot point tables
 TRUMP_POINTS = {'J': 20, '9': 14, 'A': 11, '10': 10, 'K': 4, 'Q': 3, '8': 0, '7': 0}
 NON_TRUMP_POINTS = {'A': 11, '10': 10, 'K': 4, 'Q': 3, 'J': 2, '9': 0, '8': 0, '7': 0}
+SUITS = ['♠', '♥', '♦', '♣']
 
-def read_card_value(image_path):
-    img = cv2.imread(image_path)
+OCR_CONFIG = '--psm 7 -c tessedit_char_whitelist=A23456789JQK10♠♣♥♦'
+# Block mode for the tiled sheet: one text line per corner
+BATCH_OCR_CONFIG = '--psm 6 -c tessedit_char_whitelist=A23456789JQK10♠♣♥♦'
+TILE_GAP = 20  # white rows between tiled corners so lines never touch
+
+def threshold_corner(img, fraction=0.4):
     h, w = img.shape[:2]
-    
+
     # Crop top-left corner where rank and suit are visible
-    corner = img[0:int(h*0.4), 0:int(w*0.4)]
-    gray = cv2.cvtColor(corner, cv2.COLOR_BGR2GRAY)
+    corner = img[0:int(h*fraction), 0:int(w*fraction)]
+    gray = cv2.cvtColor(corner, cv2.COLOR_BGR2GRAY) if corner.ndim == 3 else corner
     _, thresh = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY)
+    return thresh
 
-    config = '--psm 7 -c tessedit_char_whitelist=A23456789JQK10♠♣♥♦'
-    text = pytesseract.image_to_string(thresh, config=config).strip()
-
+def clean_code(text):
     # Clean up and return first symbols
     cleaned = text.replace('\n', '').replace(' ', '').replace('0', '10')
     return cleaned[:3]  # e.g., "J♣" or "10♠"
 
+def read_card_image(img, fraction=0.4):
+    # fraction=1.0 when img is already just the index corner
+    text = pytesseract.image_to_string(threshold_corner(img, fraction), config=OCR_CONFIG).strip()
+    return clean_code(text)
+
+def read_card_value(image_path):
+    img = cv2.imread(image_path)
+    return read_card_image(img)
+
+def load_corner(image_path):
+    img = cv2.imread(image_path)
+    if img is None:
+        return None
+    return threshold_corner(img)
+
+def tile_corners(corners, gap=TILE_GAP):
+    """Stack thresholded corners into one white sheet, returning it and the row pitch"""
+    tile_h = max(c.shape[0] for c in corners)
+    tile_w = max(c.shape[1] for c in corners)
+    pitch = tile_h + gap
+
+    sheet = np.full((pitch * len(corners) + gap, tile_w + 2 * gap), 255, dtype=np.uint8)
+    for i, corner in enumerate(corners):
+        y = gap + i * pitch
+        sheet[y:y+corner.shape[0], gap:gap+corner.shape[1]] = corner
+    return sheet, pitch
+
+def read_corners_batched(corners):
+    """OCR all corners with a single tesseract call on a tiled sheet"""
+    if not corners:
+        return []
+
+    sheet, pitch = tile_corners(corners)
+    data = pytesseract.image_to_data(sheet, config=BATCH_OCR_CONFIG,
+                                     output_type=pytesseract.Output.DICT)
+
+    # Assign every recognised word to the tile its vertical centre falls in
+    texts = [[] for _ in corners]
+    for text, top, height in zip(data['text'], data['top'], data['height']):
+        text = text.strip()
+        if not text:
+            continue
+        index = (top + height // 2 - TILE_GAP) // pitch
+        if 0 <= index < len(corners):
+            texts[index].append(text)
+
+    return [clean_code(''.join(words)) for words in texts]
+
+def _init_template_worker():
+    # Each worker process loads its own copy of the templates once
+    import belot_calculator
+    belot_calculator.load_recognizer_config()
+    if not belot_calculator.load_templates():
+        raise RuntimeError("Card templates not found. Run belot_calibrator.py first.")
+
+def _identify_with_templates(image_path):
+    import belot_calculator
+    img = cv2.imread(image_path)
+    if img is None:
+        return ''
+    rank, suit = belot_calculator.identify_card(img)
+    if rank == 'back' or rank == '?' or suit == '?':
+        return ''
+    return f'{rank}{suit}'
+
+def read_all_codes(paths, mode='batch', workers=None):
+    """Read card codes for every path using the selected backend"""
+    if mode == 'ocr':
+        # Original behaviour: one tesseract process per card
+        return [read_card_value(path) for path in paths]
+
+    if mode == 'template':
+        # In-process template recognizer, spread across cores
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_template_worker) as executor:
+            return list(executor.map(_identify_with_templates, paths, chunksize=8))
+
+    # Batched OCR: decode corners in parallel, then a single tesseract call
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        corners = list(executor.map(load_corner, paths))
+    valid = [i for i, c in enumerate(corners) if c is not None]
+    codes = [''] * len(paths)
+    for i, code in zip(valid, read_corners_batched([corners[i] for i in valid])):
+        codes[i] = code
+    return codes
+
+def split_card_code(card_code):
+    # Extract rank and suit
+    if card_code.startswith('10'):
+        return '10', card_code[2:]
+    return card_code[:1], card_code[1:]
+
 def get_belot_points(card_code, trump_suit='♠'):
     if len(card_code) < 2:
         return 0  # unreadable
 
-    # Extract rank and suit
-    if card_code.startswith('10'):
-        rank, suit = '10', card_code[2:]
-    else:
-        rank, suit = card_code[0], card_code[1:]
+    rank, suit = split_card_code(card_code)
 
     if suit == trump_suit:
         return TRUMP_POINTS.get(rank, 0)
     else:
         return NON_TRUMP_POINTS.get(rank, 0)
 
-def process_all_cards(folder='cards_output', trump_suit='♣'):
+def process_all_cards(folder='cards_output', trump_suit='♣', mode='batch', workers=None):
+    filenames = sorted(f for f in os.listdir(folder) if f.endswith('.png'))
+    paths = [os.path.join(folder, f) for f in filenames]
+    codes = read_all_codes(paths, mode=mode, workers=workers)
+
     total_points = 0
-    for filename in sorted(os.listdir(folder)):
-        if filename.endswith('.png'):
-            path = os.path.join(folder, filename)
-            code = read_card_value(path)
-            points = get_belot_points(code, trump_suit=trump_suit)
-            print(f'{filename}: {code} → {points} points')
-            total_points += points
+    for filename, code in zip(filenames, codes):
+        points = get_belot_points(code, trump_suit=trump_suit)
+        print(f'{filename}: {code} → {points} points')
+        total_points += points
 
     print(f'\n🧮 Total Belot Score (Trump: {trump_suit}): {total_points}')
+    return total_points
+
+def main():
+    parser = argparse.ArgumentParser(description='Count Belot points for sliced card images')
+    parser.add_argument('folder', nargs='?', default='cards_output',
+                        help='folder with one PNG per card (default: cards_output)')
+    parser.add_argument('-t', '--trump', default='♣', choices=SUITS, help='trump suit')
+    parser.add_argument('-m', '--mode', default='batch', choices=['batch', 'template', 'ocr'],
+                        help='batch: one tiled OCR call; template: in-process matcher; '
+                             'ocr: one tesseract call per card')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='worker count for parallel decoding/recognition')
+    args = parser.parse_args()
+
+    process_all_cards(args.folder, trump_suit=args.trump, mode=args.mode, workers=args.workers)
 
-# Example usage
-process_all_cards()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Track which of the 32 belot cards have been seen during the current deal.
+
+The seen set is a 32-bit mask (bit = suit * 8 + rank). Remaining points per
+trump are kept up to date as cards are added, so every query is constant time.
+
+Run as a script to check deal detection on scripted frame sequences.
+"""
+import sys
+from collections import namedtuple
+
+TRUMP_POINTS = {'J': 20, '9': 14, 'A': 11, '10': 10, 'K': 4, 'Q': 3, '8': 0, '7': 0}
+NON_TRUMP_POINTS = {'A': 11, '10': 10, 'K': 4, 'Q': 3, 'J': 2, '9': 0, '8': 0, '7': 0}
+SUITS = ['♠', '♥', '♦', '♣']
+RANKS = ['7', '8', '9', '10', 'J', 'Q', 'K', 'A']
+
+FULL_DECK = (1 << 32) - 1
+SUIT_MASK = 0xFF
+
+# Cards in a player's hand once the deal is complete
+HAND_SIZE = 8
+
+# Points of every card index under every trump, precomputed once
+CARD_POINTS = [[TRUMP_POINTS[rank] if suit == trump else NON_TRUMP_POINTS[rank]
+                for trump in SUITS]
+               for suit in SUITS for rank in RANKS]
+DECK_POINTS = [sum(points[t] for points in CARD_POINTS) for t in range(len(SUITS))]
+
+DeckState = namedtuple('DeckState', ['deal', 'seen', 'remaining', 'remaining_points', 'exhausted'])
+
+def card_index(rank, suit):
+    """Bit index of a card, or None for backs and unidentified cards"""
+    if suit not in SUITS or rank not in RANKS:
+        return None
+    return SUITS.index(suit) * 8 + RANKS.index(rank)
+
+def card_name(index):
+    return f"{RANKS[index % 8]}{SUITS[index // 8]}"
+
+def frame_mask(card_data):
+    """Mask of the identified cards in one frame"""
+    mask = 0
+    for rank, suit in card_data:
+        index = card_index(rank, suit)
+        if index is not None:
+            mask |= 1 << index
+    return mask
+
+class DeckTracker:
+    def __init__(self):
+        self.deal = 0
+        self.reset()
+
+    def reset(self):
+        """Start a new deal"""
+        self.deal += 1
+        self.seen = 0
+        self.last_frame = 0
+        self.remaining_points = list(DECK_POINTS)
+
+    def add(self, index):
+        bit = 1 << index
+        if self.seen & bit:
+            return
+        self.seen |= bit
+        for t, points in enumerate(CARD_POINTS[index]):
+            self.remaining_points[t] -= points
+
+    def update(self, card_data):
+        """Fold one recognised frame into the deal; returns True if a new deal started.
+
+        A frame that only adds cards to the previous one (the rest of the deal,
+        a growing pile) or only drops some (cards played from the hand)
+        continues the deal. Any other frame starts a new deal when it shows
+        more cards than the previous one (the count jumping back up after a
+        play) or a full hand of HAND_SIZE cards. Anything else, such as the next
+        trick's first card, continues the deal; a new deal that looks like that
+        needs an explicit reset().
+        """
+        mask = frame_mask(card_data)
+        if mask == 0:
+            return False
+
+        new_deal = False
+        grows = (mask & self.last_frame) == self.last_frame
+        shrinks = (mask & self.last_frame) == mask
+        if not grows and not shrinks:
+            count = mask.bit_count()
+            if count > self.last_frame.bit_count() or count >= HAND_SIZE:
+                self.reset()
+                new_deal = True
+
+        # Only the newly seen cards cost any work
+        fresh = mask & ~self.seen
+        while fresh:
+            low = fresh & -fresh
+            self.add(low.bit_length() - 1)
+            fresh ^= low
+        self.last_frame = mask
+        return new_deal
+
+    def is_seen(self, rank, suit):
+        index = card_index(rank, suit)
+        return index is not None and bool(self.seen >> index & 1)
+
+    def remaining_mask(self):
+        return FULL_DECK & ~self.seen
+
+    def remaining_count(self):
+        return 32 - self.seen.bit_count()
+
+    def points_remaining(self, trump):
+        return self.remaining_points[SUITS.index(trump)]
+
+    def is_exhausted(self, suit):
+        """True once all eight cards of a suit have been seen"""
+        return (self.seen >> (SUITS.index(suit) * 8)) & SUIT_MASK == SUIT_MASK
+
+    def remaining_cards(self):
+        remaining = self.remaining_mask()
+        return [card_name(i) for i in range(32) if remaining >> i & 1]
+
+    def state(self):
+        """Snapshot for display and JSON output"""
+        return DeckState(
+            deal=self.deal,
+            seen=32 - self.remaining_count(),
+            remaining=self.remaining_cards(),
+            remaining_points={suit: self.remaining_points[t] for t, suit in enumerate(SUITS)},
+            exhausted=[suit for suit in SUITS if self.is_exhausted(suit)],
+        )
+
+def check():
+    """Scripted frame sequences and the deal detection they must produce"""
+    hand = [('7', '♠'), ('J', '♥'), ('A', '♦'), ('10', '♣'), ('K', '♠'), ('9', '♥'), ('Q', '♦'), ('8', '♣')]
+    other = [(rank, suit) for suit in SUITS for rank in RANKS if (rank, suit) not in hand][:HAND_SIZE]
+
+    # Playing cards from a hand keeps the deal and everything seen in it
+    tracker = DeckTracker()
+    assert not tracker.update(hand)
+    for played in range(1, len(hand)):
+        assert not tracker.update(hand[played:]), f"new deal after playing {played} card(s)"
+    assert tracker.deal == 1 and tracker.remaining_count() == 32 - len(hand)
+
+    # A fresh hand with no card in common with the seen set is a new deal
+    assert tracker.update(other), "disjoint full hand not detected"
+    assert tracker.deal == 2 and tracker.remaining_count() == 32 - len(other)
+    fresh = DeckTracker()
+    fresh.update(other)
+    assert tracker.remaining_points == fresh.remaining_points
+
+    # So is the count jumping back up after a play, before the hand is complete
+    assert not tracker.update(other[5:])
+    assert tracker.update(hand[:5]), "new five-card deal after a play not detected"
+    assert not tracker.update(hand), "the last three cards of the deal started another deal"
+    assert tracker.deal == 3 and tracker.remaining_count() == 32 - len(hand)
+    print("deck_tracker: deal detection checks passed")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(check())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Turn a clipboard image, file, encoded bytes or stdin into the grayscale the matchers use.
+
+Every matcher works on grayscale, so frames are decoded straight to one
+channel (cv2.imdecode/imread with IMREAD_GRAYSCALE, or PIL's own conversion
+for clipboard images) instead of RGB → BGR and back to gray per region.
+Colour is only needed for the suit-colour check of candidate pruning; for
+that a caller asks for the index corners, a small BGR copy of each card's
+corner, and the full colour image is dropped straight away.
+
+Accepted sources:
+
+    PIL.Image      clipboard grabs; converted to gray by PIL, then copied once into an array
+    str            a file path, or '-' for one image on stdin
+    bytes-like     an encoded image (PNG, JPEG, ...)
+    binary file    read to the end as one encoded image
+
+iter_png_stream() splits a stream of concatenated PNG files (for example
+`cat shots/*.png | python belot_calculator_loop.py --stdin`) into images.
+"""
+import cv2
+import numpy as np
+import sys
+import struct
+import hashlib
+from collections import namedtuple
+
+from card_extractor import slice_image
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+CHUNK_HEADER = struct.Struct('>I4s')
+MAX_IMAGE_BYTES = 64 * 1024 * 1024
+
+# digest: frame_digest() of the grayscale pixels, so equal frames compare
+# equal whatever their source; corners: BGR index corners per card slot, or None
+Ingested = namedtuple('Ingested', ['digest', 'gray', 'corners'])
+
+def to_gray(img):
+    """Grayscale view of img, converting only when it still has colour"""
+    if img.ndim == 3:
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+    return img
+
+def frame_digest(image):
+    """MD5 hex digest of an image's shape and pixels; same bytes at another size differ"""
+    digest = hashlib.md5(repr(image.shape).encode('ascii'))
+    digest.update(np.ascontiguousarray(image).tobytes())
+    return digest.hexdigest()
+
+def gray_from_pil(image):
+    """Grayscale array of a PIL image; PIL converts in C and np.asarray copies the result once"""
+    if image.mode != 'L':
+        image = image.convert('L')
+    return np.asarray(image)
+
+def color_corners(color, layout):
+    """Copies of every card's index corner, so the full colour image can be freed"""
+    return [np.ascontiguousarray(card) for card in slice_image(color, layout._replace(crop='corner'))]
+
+def decode(data, layout=None):
+    """Decode encoded image bytes; returns (gray, corners) with corners only when layout is given.
+    
+    Empty or undecodable data gives (None, None).
+    """
+    if not data:
+        return None, None
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if layout is None:
+        return cv2.imdecode(buf, cv2.IMREAD_GRAYSCALE), None
+    color = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    if color is None:
+        return None, None
+    return cv2.cvtColor(color, cv2.COLOR_BGR2GRAY), color_corners(color, layout)
+
+def read_bytes(source):
+    if source == '-':
+        return sys.stdin.buffer.read()
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return f.read()
+    if hasattr(source, 'read'):
+        return source.read()
+    # bytes, bytearray and memoryview are decoded in place
+    return source
+
+def ingest(source, layout=None):
+    """Grayscale frame from any accepted source, or None when it holds no image.
+
+    Pass the card layout to also get the colour index corners.
+    """
+    if hasattr(source, 'mode') and hasattr(source, 'size'):
+        gray = gray_from_pil(source)
+        corners = None
+        if layout is not None:
+            rgb = np.asarray(source.convert('RGB'))
+            corners = [cv2.cvtColor(c, cv2.COLOR_RGB2BGR) for c in color_corners(rgb, layout)]
+    else:
+        gray, corners = decode(read_bytes(source), layout)
+    if gray is None:
+        return None
+    return Ingested(frame_digest(gray), gray, corners)
+
+def read_exactly(stream, n):
+    data = stream.read(n)
+    while data is not None and len(data) < n:
+        more = stream.read(n - len(data))
+        if not more:
+            break
+        data += more
+    return data or b''
+
+def iter_png_stream(stream):
+    """Yield the bytes of each PNG in a stream of concatenated PNG files"""
+    while True:
+        signature = read_exactly(stream, len(PNG_SIGNATURE))
+        if not signature:
+            return
+        if signature != PNG_SIGNATURE:
+            raise ValueError("Input stream is not a sequence of PNG images")
+        parts = [signature]
+        size = len(signature)
+        while True:
+            header = read_exactly(stream, CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                raise ValueError("PNG stream ended in the middle of an image")
+            length, kind = CHUNK_HEADER.unpack(header)
+            size += length + 12
+            if size > MAX_IMAGE_BYTES:
+                raise ValueError(f"PNG image larger than {MAX_IMAGE_BYTES} bytes in stream")
+            body = read_exactly(stream, length + 4)  # chunk data + CRC
+            if len(body) < length + 4:
+                raise ValueError("PNG stream ended in the middle of an image")
+            parts += [header, body]
+            if kind == b'IEND':
+                break
+        yield b''.join(parts)
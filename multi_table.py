@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""Watch several belot tables at once with one template bank and one worker pool.
+
+Each --table is NAME=KIND:ARGUMENT, where KIND is
+
+    dir:PATH           the newest image file in a directory (e.g. a screenshot folder)
+    screen:X1,Y1,X2,Y2 a screen rectangle, narrowed to the card strip (screen_capture.py)
+    socket:[HOST:]PORT a TCP listener; clients send 4-byte big-endian length + image bytes
+
+    python multi_table.py --table left=dir:shots/left --table right=socket:9001
+
+Every table keeps its own change detection, deck tracker and output (one JSON
+line per frame, tagged with the table name, on stdout or in
+OUTPUT_DIR/NAME.jsonl). The templates and recognizer are loaded once and
+shared, and all recognition runs on a single thread pool sized to the cores,
+so adding tables costs no extra latency until the cores are busy.
+
+The shared recognizer is not read-only: the cascade's lookup tables learn the
+regions every table's frames resolve, from all worker threads at once.
+LookupTable.add and the fingerprint scan hold the table's lock, and the exact
+lookup is a single dict get, atomic under the GIL, so a reader sees an entry
+either fully added or not at all. What one table learns speeds up the others.
+"""
+import os
+import sys
+import json
+import time
+import struct
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import belot_calculator_loop as loop
+from deck_tracker import DeckTracker
+from ingest import ingest
+from screen_capture import ScreenCapture, parse_region
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+POLL_INTERVAL = 0.2
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+class DirectorySource:
+    """Newest image file in a directory, re-read whenever it changes"""
+
+    def __init__(self, path, interval=POLL_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.last_key = None
+
+    def newest(self):
+        try:
+            entries = [e for e in os.scandir(self.path)
+                       if e.is_file() and e.name.lower().endswith(IMAGE_EXTENSIONS)]
+        except OSError:
+            return None
+        if not entries:
+            return None
+        entry = max(entries, key=lambda e: e.stat().st_mtime_ns)
+        stat = entry.stat()
+        return entry.path, stat.st_mtime_ns, stat.st_size
+
+    def read(self):
+        key = self.newest()
+        if key is None or key == self.last_key:
+            return None, None
+        try:
+            with open(key[0], 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None, None
+        # A file still being written decodes as None; try again next poll
+        frame = ingest(data)
+        if frame is None:
+            return None, None
+        self.last_key = key
+        return frame.digest, frame.gray
+
+    async def frames(self):
+        aio_loop = asyncio.get_running_loop()
+        while True:
+            digest, image = await aio_loop.run_in_executor(None, self.read)
+            if image is not None:
+                yield digest, image
+            await asyncio.sleep(self.interval)
+
+class ScreenSource:
+    """A screen rectangle, narrowed to the card strip once it is located"""
+
+    def __init__(self, bbox, interval=POLL_INTERVAL):
+        self.bbox = bbox
+        self.interval = interval
+        self.capture = None
+
+    async def frames(self):
+        # Templates are loaded by now; they refine where the strip starts
+        self.capture = ScreenCapture(self.bbox, fps=1 / self.interval, layout=loop.card_layout,
+                                     templates=loop.rank_templates, template_region=loop.RANK_REGION,
+                                     log=loop.log)
+        aio_loop = asyncio.get_running_loop()
+        while True:
+            started = time.monotonic()
+            digest, image = await aio_loop.run_in_executor(None, self.capture.read)
+            if image is not None:
+                yield digest, image
+            await asyncio.sleep(self.capture.remaining(started))
+
+class SocketSource:
+    """TCP listener for length-prefixed encoded images; the newest frame wins"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.queue = None
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                header = await reader.readexactly(4)
+                (length,) = struct.unpack('>I', header)
+                if length > MAX_FRAME_BYTES:
+                    loop.log(f"[red]Frame of {length} bytes on port {self.port} rejected[/red]")
+                    break
+                data = await reader.readexactly(length)
+                loop.offer_latest(self.queue, data)
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    async def frames(self):
+        self.queue = asyncio.Queue(maxsize=1)
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        aio_loop = asyncio.get_running_loop()
+        async with server:
+            while True:
+                data = await self.queue.get()
+                frame = await aio_loop.run_in_executor(None, ingest, data)
+                if frame is not None:
+                    yield frame.digest, frame.gray
+
+def parse_source(spec):
+    """Build a source from KIND:ARGUMENT"""
+    kind, _, argument = spec.partition(':')
+    if kind == 'dir':
+        return DirectorySource(argument)
+    if kind == 'screen':
+        return ScreenSource(parse_region(argument))
+    if kind == 'socket':
+        host, _, port = argument.rpartition(':')
+        return SocketSource(host or '127.0.0.1', int(port))
+    raise ValueError(f"Unknown source kind {kind!r} (use dir, screen or socket)")
+
+def parse_table(spec, index):
+    """NAME=KIND:ARGUMENT, or KIND:ARGUMENT named tableN"""
+    name, sep, source = spec.partition('=')
+    if not sep or ':' in name:
+        name, source = f"table{index}", spec
+    return name, parse_source(source)
+
+class Table:
+    """Independent state and output of one watched table"""
+
+    def __init__(self, name, source, output):
+        self.name = name
+        self.source = source
+        self.output = output
+        self.last_hash = None
+        self.seq = 0
+        self.deck = DeckTracker()
+        self.latencies = []
+
+    def write(self, record):
+        self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.output.flush()
+
+    async def capture(self, queue):
+        async for digest, image in self.source.frames():
+            if digest == self.last_hash:
+                continue
+            self.last_hash = digest
+            self.seq += 1
+            loop.offer_latest(queue, (self.seq, digest, image, time.time()))
+
+    async def process(self, queue, executor):
+        aio_loop = asyncio.get_running_loop()
+        while True:
+            seq, digest, image, captured_at = await queue.get()
+            start = time.time()
+            # serial=True: the shared pool parallelises across frames and
+            # tables, so one frame must not fan out into the same pool
+            card_data, tiers = await aio_loop.run_in_executor(executor, loop.recognize_cards, image, True)
+            recognized = time.time()
+            scores = loop.score_cards(card_data)
+            new_deal = self.deck.update(card_data)
+            self.latencies.append(recognized - captured_at)
+            self.write({
+                'table': self.name,
+                'seq': seq,
+                'hash': digest,
+                'time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(captured_at)),
+                'cards': [loop.card_label(r, s) for r, s in card_data],
+                'tiers': tiers,
+                'points': scores['points'],
+                'valid': scores['valid'],
+                'backs': scores['backs'],
+                'unknown': scores['unknown'],
+                'deck': dict(self.deck.state()._asdict(), new_deal=new_deal),
+                'timings': {'queued': round(start - captured_at, 6),
+                            'recognize': round(recognized - start, 6)},
+            })
+
+    async def run(self, executor):
+        queue = asyncio.Queue(maxsize=1)
+        await asyncio.gather(self.capture(queue), self.process(queue, executor))
+
+    def summary(self):
+        if not self.latencies:
+            return f"{self.name}: no frames"
+        latencies = sorted(self.latencies)
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        return (f"{self.name}: {len(latencies)} frames, latency mean "
+                f"{1000 * sum(latencies) / len(latencies):.1f} ms, p95 {1000 * p95:.1f} ms")
+
+async def watch(tables, executor):
+    await asyncio.gather(*(table.run(executor) for table in tables))
+
+def main():
+    parser = argparse.ArgumentParser(description='Watch several belot tables with a shared recognizer')
+    parser.add_argument('--table', action='append', required=True, metavar='NAME=KIND:ARG',
+                        help='dir:PATH, screen:X1,Y1,X2,Y2 or socket:[HOST:]PORT (repeatable)')
+    parser.add_argument('-o', '--output-dir', default=None,
+                        help='write NAME.jsonl per table instead of one stream on stdout')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='recognition threads shared by all tables (default: CPU count)')
+    parser.add_argument('--matcher', choices=['cascade', 'hamming', 'strip'], default='cascade')
+    args = parser.parse_args()
+
+    # Status goes to stderr, results to stdout or the per-table files
+    loop.quiet_mode = True
+    loop.matcher = args.matcher
+    loop.load_card_layout()
+    loop.load_recognizer_config()
+    if not loop.load_templates():
+        loop.log("Card templates not found. Run belot_calibrator.py first.")
+        return 1
+    loop.build_cascade()
+
+    tables = []
+    outputs = []
+    try:
+        for index, spec in enumerate(args.table, 1):
+            name, source = parse_table(spec, index)
+            output = sys.stdout
+            if args.output_dir:
+                os.makedirs(args.output_dir, exist_ok=True)
+                output = open(os.path.join(args.output_dir, f"{name}.jsonl"), 'a', encoding='utf-8')
+                outputs.append(output)
+            tables.append(Table(name, source, output))
+    except ValueError as e:
+        parser.error(str(e))
+
+    workers = args.workers or os.cpu_count() or 1
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recognize')
+    loop.log(f"Watching {len(tables)} table(s) with {workers} recognition thread(s)")
+    try:
+        asyncio.run(watch(tables, executor))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        for table in tables:
+            loop.log(table.summary())
+        for output in outputs:
+            output.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""Sweep recognizer settings over a labelled corpus and report the Pareto front.
+
+Each configuration varies the rank/suit regions (trimmed inside the regions
+the calibrator cuts templates from, plus the calibrator's glyph regions from
+templates/regions.json), the match method, the template resolution and the
+acceptance thresholds. Accuracy and per-frame latency are measured in
+parallel worker processes; thresholds only change how the recorded best
+scores are accepted, so they are evaluated without re-matching.
+
+Only TM_CCOEFF_NORMED at full resolution is exported: the cascade and
+Hamming matchers ignore method and template_scale, and a threshold tuned for
+another method would not fit them. A region is exported only when it beat
+the stored one (the glyph regions, else the full template regions) with
+every other setting equal, so a sweep never silently replaces better regions.
+
+    python synth_hands.py synth_out -n 500 --scale 1 1 --offset 0 0 --gap-jitter 0
+    python param_sweep.py synth_out --export recognizer_config.json
+
+The exported file is read at startup by the calculators.
+"""
+import cv2
+import numpy as np
+import os
+import sys
+import json
+import time
+import itertools
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from template_bank import read_glyph_regions
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CARDS_DIR = os.path.join(BASE_DIR, 'cards')
+MAPPING_FILE = os.path.join(BASE_DIR, 'card_mapping.json')
+CONFIG_FILE = os.path.join(BASE_DIR, 'recognizer_config.json')
+
+# Regions the calibrator cuts templates from; swept regions stay inside them
+TEMPLATE_RANK_REGION = (0, 0, 80, 80)
+TEMPLATE_SUIT_REGION = (0, 80, 80, 145)
+BACK_REGION = (0, 0, 80, 80)
+
+TRIMS = (0, 6, 12)
+# The only method and scale every matcher honours
+EXPORT_METHOD = 'TM_CCOEFF_NORMED'
+EXPORT_SCALE = 1.0
+# Latency gain an equally accurate region needs to replace the stored one,
+# so timing noise alone never does
+REGION_SPEEDUP = 0.05
+METHODS = ('TM_CCOEFF_NORMED', 'TM_CCORR_NORMED', 'TM_SQDIFF_NORMED')
+TEMPLATE_SCALES = (1.0, 0.5)
+MATCH_THRESHOLDS = (0.5, 0.6, 0.7)
+BACK_THRESHOLDS = (0.6, 0.7, 0.8)
+
+Setting = namedtuple('Setting', ['rank_region', 'suit_region', 'method', 'template_scale'])
+Result = namedtuple('Result', ['rank_region', 'suit_region', 'method', 'template_scale',
+                               'match_threshold', 'back_threshold', 'accuracy', 'latency_ms'])
+
+def trim(region, pixels):
+    x1, y1, x2, y2 = region
+    return (x1 + pixels, y1 + pixels, x2 - pixels, y2 - pixels)
+
+def crop(img, region):
+    x1, y1, x2, y2 = region
+    return img[y1:y2, x1:x2]
+
+def fit_template(template, template_region, region):
+    """Cut a sub-region out of a template that was cut at template_region"""
+    ox, oy = template_region[:2]
+    x1, y1, x2, y2 = region
+    return template[y1-oy:y2-oy, x1-ox:x2-ox]
+
+def scale_image(img, scale):
+    if scale == 1.0:
+        return img
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+def match_score(gray, template, method):
+    """Similarity in [.., 1] where higher is better for every method"""
+    result = cv2.matchTemplate(gray, template, method)
+    min_val, max_val, _, _ = cv2.minMaxLoc(result)
+    if method == cv2.TM_SQDIFF_NORMED:
+        return 1.0 - min_val
+    return max_val
+
+def build_templates(setting):
+    """Cut rank/suit/back templates from cards/ the way create_templates does"""
+    with open(MAPPING_FILE) as f:
+        mapping = json.load(f)
+    ranks, suits, back = {}, {}, None
+    for filename, info in mapping.items():
+        card = cv2.imread(os.path.join(CARDS_DIR, filename), cv2.IMREAD_GRAYSCALE)
+        if card is None:
+            continue
+        if info['rank'] == 'back':
+            back = scale_image(crop(card, BACK_REGION), setting.template_scale)
+            continue
+        if info['rank'] not in ranks:
+            rank = fit_template(crop(card, TEMPLATE_RANK_REGION), TEMPLATE_RANK_REGION, setting.rank_region)
+            ranks[info['rank']] = scale_image(rank, setting.template_scale)
+        if info['suit'] not in suits:
+            suit = fit_template(crop(card, TEMPLATE_SUIT_REGION), TEMPLATE_SUIT_REGION, setting.suit_region)
+            suits[info['suit']] = scale_image(suit, setting.template_scale)
+    return ranks, suits, back
+
+def best_label(gray, templates, method):
+    best, best_score = None, -1.0
+    for label, template in templates.items():
+        score = match_score(gray, template, method)
+        if score > best_score:
+            best, best_score = label, score
+    return best, best_score
+
+def load_corpus(corpus_dir, limit):
+    """Decode up to limit strips and cut their cards using the recorded boxes"""
+    from synth_hands import iter_corpus
+
+    frames = []
+    for path, labels, record in itertools.islice(iter_corpus(corpus_dir), limit):
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            continue
+        cards = []
+        for x, y, w, h in record['boxes']:
+            x, y = max(0, int(round(x))), max(0, int(round(y)))
+            cards.append(image[y:y+int(round(h)), x:x+int(round(w))])
+        frames.append((cards, labels))
+    return frames
+
+_corpus = None
+
+def _init_worker(corpus_dir, limit):
+    global _corpus
+    cv2.setNumThreads(1)
+    _corpus = load_corpus(corpus_dir, limit)
+
+def evaluate(setting):
+    """Time one setting over the corpus and score it under every threshold pair"""
+    method = getattr(cv2, setting.method)
+    ranks, suits, back = build_templates(setting)
+    scale = setting.template_scale
+
+    observations = []  # (truth, back score, rank, rank score, suit, suit score)
+    started = time.perf_counter()
+    for cards, labels in _corpus:
+        for card, truth in zip(cards, labels):
+            back_score = match_score(scale_image(crop(card, BACK_REGION), scale), back, method) \
+                if back is not None else -1.0
+            rank, rank_score = best_label(scale_image(crop(card, setting.rank_region), scale), ranks, method)
+            suit, suit_score = best_label(scale_image(crop(card, setting.suit_region), scale), suits, method)
+            observations.append((truth, back_score, rank, rank_score, suit, suit_score))
+    latency_ms = 1000.0 * (time.perf_counter() - started) / max(len(_corpus), 1)
+
+    results = []
+    for match_threshold, back_threshold in itertools.product(MATCH_THRESHOLDS, BACK_THRESHOLDS):
+        correct = 0
+        for truth, back_score, rank, rank_score, suit, suit_score in observations:
+            if back_score > back_threshold:
+                predicted = 'back'
+            else:
+                predicted = (rank if rank_score > match_threshold else '?') + \
+                            (suit if suit_score > match_threshold else '?')
+            correct += predicted == truth
+        accuracy = correct / max(len(observations), 1)
+        results.append(Result(*setting, match_threshold, back_threshold, accuracy, latency_ms))
+    return results
+
+def pareto_front(results):
+    """Results not beaten on both accuracy (higher) and latency (lower)"""
+    front = []
+    for r in sorted(results, key=lambda r: (r.latency_ms, -r.accuracy)):
+        if not front or r.accuracy > front[-1].accuracy:
+            front.append(r)
+    return front
+
+def stored_regions():
+    """(rank, suit) regions the calculators use without a config"""
+    return read_glyph_regions() or (TEMPLATE_RANK_REGION, TEMPLATE_SUIT_REGION)
+
+def build_grid():
+    stored_rank, stored_suit = stored_regions()
+    rank_regions = list(dict.fromkeys([trim(TEMPLATE_RANK_REGION, t) for t in TRIMS] + [stored_rank]))
+    suit_regions = list(dict.fromkeys([trim(TEMPLATE_SUIT_REGION, t) for t in TRIMS] + [stored_suit]))
+    return [Setting(rank_region, suit_region, method, scale)
+            for rank_region, suit_region, method, scale
+            in itertools.product(rank_regions, suit_regions, METHODS, TEMPLATE_SCALES)]
+
+def exportable(results):
+    return [r for r in results if r.method == EXPORT_METHOD and r.template_scale == EXPORT_SCALE]
+
+def beats(result, other):
+    """More accurate, or as accurate and clearly faster"""
+    if result.accuracy != other.accuracy:
+        return result.accuracy > other.accuracy
+    return result.latency_ms < (1 - REGION_SPEEDUP) * other.latency_ms
+
+def regions_to_export(chosen, results, stored):
+    """{'rank_region': .., 'suit_region': ..} for each region of chosen that beat the stored one"""
+    by_setting = {(r.rank_region, r.suit_region) + tuple(r[2:6]): r for r in results}
+    exported = {}
+    for index, name in ((0, 'rank_region'), (1, 'suit_region')):
+        if chosen[index] == stored[index]:
+            continue
+        regions = [chosen.rank_region, chosen.suit_region]
+        regions[index] = stored[index]
+        baseline = by_setting.get(tuple(regions) + tuple(chosen[2:6]))
+        if baseline is None or beats(chosen, baseline):
+            exported[name] = list(chosen[index])
+    return exported
+
+def export_config(result, path, regions):
+    config = dict(regions)
+    config.update({
+        'method': result.method,
+        'template_scale': result.template_scale,
+        'match_threshold': result.match_threshold,
+        'back_threshold': result.back_threshold,
+        'accuracy': round(result.accuracy, 5),
+        'latency_ms': round(result.latency_ms, 3),
+    })
+    with open(path, 'w') as f:
+        json.dump(config, f, indent=4)
+    if not regions:
+        print("Keeping the stored rank and suit regions")
+    print(f"Exported configuration to {path}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep recognizer settings over a labelled corpus')
+    parser.add_argument('corpus', help='directory written by synth_hands.py')
+    parser.add_argument('-n', '--limit', type=int, default=200, help='strips to evaluate')
+    parser.add_argument('-w', '--workers', type=int, default=None)
+    parser.add_argument('--export', nargs='?', const=CONFIG_FILE, default=None, metavar='PATH',
+                        help=f'write the chosen configuration (default {os.path.basename(CONFIG_FILE)})')
+    parser.add_argument('--max-accuracy-loss', type=float, default=0.0,
+                        help='choose the fastest front point within this accuracy of the best')
+    parser.add_argument('--results', default=None, help='write every result as JSON lines')
+    args = parser.parse_args()
+
+    grid = build_grid()
+    print(f"Evaluating {len(grid)} settings × {len(MATCH_THRESHOLDS) * len(BACK_THRESHOLDS)} "
+          f"threshold pairs on {args.limit} strips")
+
+    results = []
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.corpus, args.limit)) as executor:
+        for done, setting_results in enumerate(executor.map(evaluate, grid), 1):
+            results.extend(setting_results)
+            print(f"\r{done}/{len(grid)} settings", end="", flush=True)
+    print(f" in {time.time() - started:.1f}s\n")
+
+    if args.results:
+        with open(args.results, 'w') as f:
+            for r in results:
+                f.write(json.dumps(r._asdict()) + "\n")
+
+    front = pareto_front(results)
+    print("Pareto front (fastest first):")
+    print(f"{'accuracy':>9} {'ms/frame':>9}  method            scale  rank region        suit region        thr   back")
+    for r in front:
+        print(f"{100 * r.accuracy:8.2f}% {r.latency_ms:9.2f}  {r.method:<17} {r.template_scale:5.2f}  "
+              f"{str(r.rank_region):<18} {str(r.suit_region):<18} {r.match_threshold:.2f}  {r.back_threshold:.2f}")
+
+    export_front = pareto_front(exportable(results))
+    if args.export and export_front:
+        best_accuracy = max(r.accuracy for r in export_front)
+        chosen = next(r for r in export_front if r.accuracy >= best_accuracy - args.max_accuracy_loss)
+        print(f"\nChosen ({EXPORT_METHOD} at full scale): {100 * chosen.accuracy:.2f}% "
+              f"at {chosen.latency_ms:.2f} ms/frame")
+        export_config(chosen, args.export, regions_to_export(chosen, results, stored_regions()))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
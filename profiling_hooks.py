@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""On-demand cProfile/tracemalloc capture for the long-running loop.
+
+Profiling is armed for the next N frames by any of:
+
+    kill -USR1 <pid>                      (N = default_frames)
+    BELOT_PROFILE_FRAMES=N at startup
+    echo N > profile.request              (the file is removed when picked up)
+
+When the N frames are done the profile (.prof, loadable with pstats or
+snakeviz), a text summary and the top allocation sites are written to
+timestamped files and both profilers switch themselves off. While disarmed the
+per-frame cost is one integer check, plus a stat() of the control file at most
+once per check_interval seconds.
+"""
+import os
+import time
+import signal
+import pstats
+import cProfile
+import tracemalloc
+
+PROFILE_ENV = 'BELOT_PROFILE_FRAMES'
+DEFAULT_FRAMES = 50
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+class FrameProfiler:
+    """Raises ValueError when BELOT_PROFILE_FRAMES is set but is not a frame count"""
+
+    def __init__(self, output_dir, control_file=None, default_frames=DEFAULT_FRAMES,
+                 check_interval=1.0, log=print):
+        self.output_dir = output_dir
+        self.control_file = control_file
+        self.default_frames = default_frames
+        self.check_interval = check_interval
+        self.log = log
+
+        self.remaining = 0
+        self.requested = 0
+        self.next_check = 0.0
+        self.profile = None
+        self.started_at = None
+
+        env_frames = os.environ.get(PROFILE_ENV, '').strip()
+        if env_frames:
+            if not env_frames.isdigit():
+                raise ValueError(f"{PROFILE_ENV} must be a number of frames, not {env_frames!r}")
+            self.requested = int(env_frames)
+
+    def install_signal_handler(self, signum=None):
+        """Arm profiling on SIGUSR1 (POSIX only)"""
+        signum = signum or getattr(signal, 'SIGUSR1', None)
+        if signum is None:
+            return False
+        signal.signal(signum, self.handle_signal)
+        return True
+
+    def handle_signal(self, signum, frame):
+        # Only set a flag here; the next frame does the actual work
+        self.requested = self.default_frames
+
+    def check_control_file(self):
+        now = time.monotonic()
+        if self.control_file is None or now < self.next_check:
+            return
+        self.next_check = now + self.check_interval
+        try:
+            with open(self.control_file) as f:
+                text = f.read().strip()
+            os.remove(self.control_file)
+        except OSError:
+            return
+        self.requested = int(text) if text.isdigit() else self.default_frames
+
+    @property
+    def active(self):
+        return self.remaining > 0
+
+    def begin_frame(self):
+        """Call before each frame; returns True while profiling is armed"""
+        if self.remaining:
+            return True
+        self.check_control_file()
+        if self.requested:
+            self.start(self.requested)
+            self.requested = 0
+            return True
+        return False
+
+    def start(self, frames):
+        self.remaining = frames
+        self.profile = cProfile.Profile()
+        self.started_at = time.strftime('%Y%m%d-%H%M%S')
+        tracemalloc.start(10)
+        self.log(f"Profiling the next {frames} frame(s)")
+
+    def run(self, fn, *args):
+        """Call fn under the profiler when armed (works from any single thread)"""
+        if not self.remaining:
+            return fn(*args)
+        self.profile.enable()
+        try:
+            return fn(*args)
+        finally:
+            self.profile.disable()
+
+    def end_frame(self):
+        """Call after each frame; writes the reports once the last armed frame is done"""
+        if not self.remaining:
+            return
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.finish()
+
+    def finish(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"profile-{self.started_at}")
+
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        self.profile.dump_stats(base + '.prof')
+
+        with open(base + '.txt', 'w') as f:
+            stats = pstats.Stats(self.profile, stream=f)
+            stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        with open(base + '-allocations.txt', 'w') as f:
+            f.write(f"Top {TOP_ALLOCATIONS} allocation sites\n\n")
+            for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                f.write(f"{stat}\n")
+                for line in stat.traceback.format()[-4:]:
+                    f.write(f"    {line}\n")
+
+        self.profile = None
+        self.log(f"Profile written to {base}.prof / .txt / -allocations.txt")
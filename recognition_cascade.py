@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""Tiered card recognition: cheap lookups first, expensive matchers only when unsure.
+
+Tier 1  exact/fingerprint lookup of the rank and suit regions
+Tier 2  TM_CCOEFF_NORMED correlation at the fixed region offset
+Tier 3  correlation tolerant to a few pixels of jitter and small scale changes
+Tier 4  Tesseract OCR of the index corner (count_cards.read_card_image)
+
+Each region escalates only while its confidence margin (best score minus the
+best score of a different label) stays below MARGIN_THRESHOLD.
+"""
+import cv2
+import numpy as np
+import hashlib
+import threading
+from collections import namedtuple, Counter
+
+TIER_NAMES = {1: 'lookup', 2: 'correlation', 3: 'jitter', 4: 'ocr'}
+
+# Defaults mirror the calculators
+RANK_REGION = (0, 0, 80, 80)
+SUIT_REGION = (0, 80, 80, 145)
+MATCH_THRESHOLD = 0.6
+BACK_THRESHOLD = 0.7
+MARGIN_THRESHOLD = 0.1
+
+# Fingerprints are 16x16 average hashes (256 bits)
+FINGERPRINT_SIZE = 16
+FINGERPRINT_MAX_DISTANCE = 12
+FINGERPRINT_MARGIN = 24
+
+# Regions resolved confidently at a higher tier are learned into the tier 1
+# exact table, so a repeated screenshot resolves on the fast path. Only those
+# with at least LEARN_SCORE also become fingerprints for near-duplicates.
+LEARN_SCORE = 0.9
+MAX_LEARNED = 4096
+
+JITTER_PIXELS = 6
+JITTER_SCALES = (0.9, 0.95, 1.0, 1.05, 1.1)
+
+# rank/suit are '?' when unresolved; tier is the highest tier that was needed
+CardResult = namedtuple('CardResult', ['rank', 'suit', 'tier', 'rank_score', 'suit_score'])
+
+def to_gray(img):
+    if len(img.shape) == 3:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return img
+
+def crop(img, region):
+    x1, y1, x2, y2 = region
+    return img[y1:y2, x1:x2]
+
+def region_digest(gray):
+    """Exact key for a region: shape plus raw pixel bytes"""
+    return hashlib.blake2b(np.ascontiguousarray(gray).tobytes() + bytes(str(gray.shape), 'ascii'),
+                           digest_size=16).digest()
+
+def fingerprint(gray):
+    """Average hash of a region as a Python int"""
+    small = cv2.resize(gray, (FINGERPRINT_SIZE, FINGERPRINT_SIZE), interpolation=cv2.INTER_AREA)
+    bits = (small > small.mean()).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def best_with_margin(scores):
+    """Return (label, best score, margin to the runner-up label)"""
+    if not scores:
+        return None, -1.0, 0.0
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    label, best = ranked[0]
+    runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+    return label, best, best - runner_up
+
+class LookupTable:
+    """Tier 1: exact digests plus nearest average-hash fingerprint"""
+
+    def __init__(self):
+        self.exact = {}
+        self.fingerprints = {}  # label -> list of fingerprints
+        self.lock = threading.Lock()
+
+    def add(self, gray, label, with_fingerprint=True):
+        with self.lock:
+            if len(self.exact) >= MAX_LEARNED:
+                return
+            self.exact[region_digest(gray)] = label
+            if with_fingerprint:
+                self.fingerprints.setdefault(label, []).append(fingerprint(gray))
+
+    def lookup(self, gray):
+        label = self.exact.get(region_digest(gray))
+        if label is not None:
+            return label, 1.0, 1.0
+
+        fp = fingerprint(gray)
+        distances = {}
+        with self.lock:
+            for candidate, prints in self.fingerprints.items():
+                distances[candidate] = min((fp ^ p).bit_count() for p in prints)
+        if not distances:
+            return None, -1.0, 0.0
+
+        ranked = sorted(distances.items(), key=lambda item: item[1])
+        label, best = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else FINGERPRINT_SIZE ** 2
+        if best <= FINGERPRINT_MAX_DISTANCE and runner_up - best >= FINGERPRINT_MARGIN:
+            return label, 1.0 - best / FINGERPRINT_SIZE ** 2, 1.0
+        return None, -1.0, 0.0
+
+def correlate(gray, templates):
+    """Tier 2: TM_CCOEFF_NORMED at the fixed region offset"""
+    scores = {}
+    for label, template in templates.items():
+        if gray.shape[0] < template.shape[0] or gray.shape[1] < template.shape[1]:
+            continue
+        result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, _ = cv2.minMaxLoc(result)
+        scores[label] = max_val
+    return scores
+
+def correlate_jitter(gray, templates, pixels=JITTER_PIXELS, scales=JITTER_SCALES):
+    """Tier 3: search a padded window and a few template scales"""
+    padded = cv2.copyMakeBorder(gray, pixels, pixels, pixels, pixels, cv2.BORDER_REPLICATE)
+    scores = {}
+    for label, template in templates.items():
+        best = -1.0
+        for scale in scales:
+            if scale == 1.0:
+                scaled = template
+            else:
+                scaled = cv2.resize(template, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+            if scaled.shape[0] > padded.shape[0] or scaled.shape[1] > padded.shape[1]:
+                continue
+            result = cv2.matchTemplate(padded, scaled, cv2.TM_CCOEFF_NORMED)
+            _, max_val, _, _ = cv2.minMaxLoc(result)
+            best = max(best, max_val)
+        scores[label] = best
+    return scores
+
+def read_corner_ocr(card, rank_region=RANK_REGION, suit_region=SUIT_REGION):
+    """Tier 4: OCR of the index corner covering both regions, or (None, None) when
+    Tesseract is unavailable"""
+    right = max(rank_region[2], suit_region[2])
+    bottom = max(rank_region[3], suit_region[3])
+    try:
+        from count_cards import read_card_image, split_card_code
+        code = read_card_image(card[0:bottom, 0:right], fraction=1.0)
+    except Exception:
+        return None, None
+    if len(code) < 2:
+        return None, None
+    return split_card_code(code)
+
+class RecognitionCascade:
+    """Identify cards, escalating each region only while it is ambiguous"""
+
+    def __init__(self, rank_templates, suit_templates, back_template=None,
+                 rank_region=RANK_REGION, suit_region=SUIT_REGION,
+                 threshold=MATCH_THRESHOLD, margin=MARGIN_THRESHOLD, back_threshold=BACK_THRESHOLD,
+                 use_ocr=True):
+        self.rank_templates = dict(rank_templates)
+        self.suit_templates = dict(suit_templates)
+        self.back_template = back_template
+        self.rank_region = rank_region
+        self.suit_region = suit_region
+        self.threshold = threshold
+        self.margin = margin
+        self.back_threshold = back_threshold
+        self.use_ocr = use_ocr
+
+        self.rank_table = LookupTable()
+        self.suit_table = LookupTable()
+        for label, template in self.rank_templates.items():
+            self.rank_table.add(template, label)
+        for label, template in self.suit_templates.items():
+            self.suit_table.add(template, label)
+        if back_template is not None:
+            self.rank_table.add(back_template, 'back')
+
+        self.tier_counts = Counter()
+        self.counts_lock = threading.Lock()
+
+    def confident(self, score, margin):
+        return score > self.threshold and margin >= self.margin
+
+    def resolve(self, gray, templates, table):
+        """Run tiers 1-3 on one region; return (label or None, score, tier, best guess)"""
+        label, score, margin = table.lookup(gray)
+        if label is not None:
+            return label, score, 1, label
+
+        guess, guess_score = None, -1.0
+        for tier, matcher in ((2, correlate), (3, correlate_jitter)):
+            label, score, margin = best_with_margin(matcher(gray, templates))
+            if score > guess_score:
+                guess, guess_score = label, score
+            if self.confident(score, margin):
+                table.add(gray, label, with_fingerprint=score >= LEARN_SCORE)
+                return label, score, tier, guess
+        return None, guess_score, 3, guess
+
+    def is_back(self, card_gray):
+        if self.back_template is None:
+            return False
+        corner = card_gray[0:self.back_template.shape[0], 0:self.back_template.shape[1]]
+        if corner.shape != self.back_template.shape:
+            return False
+        result = cv2.matchTemplate(corner, self.back_template, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, _ = cv2.minMaxLoc(result)
+        return max_val > self.back_threshold
+
+    def identify(self, card):
+        """Identify one card image; returns a CardResult"""
+        gray = to_gray(card)
+        rank_gray = crop(gray, self.rank_region)
+
+        # A back's corner is in the rank table, so repeats resolve at tier 1
+        if self.rank_table.lookup(rank_gray)[0] == 'back':
+            return self.count(CardResult('back', 'back', 1, 1.0, 1.0))
+        if self.is_back(gray):
+            return self.count(CardResult('back', 'back', 2, 1.0, 1.0))
+
+        rank, rank_score, rank_tier, rank_guess = self.resolve(
+            rank_gray, self.rank_templates, self.rank_table)
+        suit, suit_score, suit_tier, suit_guess = self.resolve(
+            crop(gray, self.suit_region), self.suit_templates, self.suit_table)
+        tier = max(rank_tier, suit_tier)
+
+        if (rank is None or suit is None) and self.use_ocr:
+            ocr_rank, ocr_suit = read_corner_ocr(card, self.rank_region, self.suit_region)
+            if rank is None and ocr_rank in self.rank_templates:
+                rank = ocr_rank
+                tier = 4
+            if suit is None and ocr_suit in self.suit_templates:
+                suit = ocr_suit
+                tier = 4
+
+        # Still ambiguous: keep the old behaviour of accepting the best score
+        # above the plain threshold, otherwise report '?'
+        if rank is None:
+            rank = rank_guess if rank_score > self.threshold else '?'
+        if suit is None:
+            suit = suit_guess if suit_score > self.threshold else '?'
+
+        return self.count(CardResult(rank, suit, tier, rank_score, suit_score))
+
+    def count(self, result):
+        with self.counts_lock:
+            self.tier_counts[result.tier] += 1
+        return result
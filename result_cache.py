@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Persistent cache of recognition results keyed by frame digest.
+
+Entries are stored in SQLite together with the recognizer version they were
+computed with (template bank + layout). Opening the cache with a different
+version drops every stale entry, so recalibrating invalidates it
+automatically. The cache is bounded to max_entries rows with least recently
+used eviction.
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+
+DEFAULT_MAX_ENTRIES = 5000
+
+class ResultCache:
+    def __init__(self, path, version, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS results (
+                               digest TEXT NOT NULL,
+                               version TEXT NOT NULL,
+                               result TEXT NOT NULL,
+                               last_used REAL NOT NULL,
+                               PRIMARY KEY (digest, version))""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self.version = None
+        self.set_version(version)
+    
+    def set_version(self, version):
+        """Switch to a new recognizer version, discarding entries made by any other"""
+        with self.lock:
+            self.version = version
+            with self.db:
+                self.db.execute("DELETE FROM results WHERE version != ?", (version,))
+    
+    def get(self, digest):
+        """Return the cached result dict for a frame digest, or None"""
+        with self.lock:
+            row = self.db.execute("SELECT result FROM results WHERE digest = ? AND version = ?",
+                                  (digest, self.version)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self.db:
+                self.db.execute("UPDATE results SET last_used = ? WHERE digest = ? AND version = ?",
+                                (time.time(), digest, self.version))
+            return json.loads(row[0])
+    
+    def put(self, digest, result):
+        """Store a JSON-serialisable result and evict the least recently used overflow"""
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                            (digest, self.version, json.dumps(result, ensure_ascii=False), time.time()))
+            (count,) = self.db.execute("SELECT COUNT(*) FROM results").fetchone()
+            if count > self.max_entries:
+                self.db.execute("""DELETE FROM results WHERE rowid IN (
+                                       SELECT rowid FROM results ORDER BY last_used LIMIT ?)""",
+                                (count - self.max_entries,))
+    
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or clear the recognition result cache')
+    parser.add_argument('cache', help='SQLite cache file')
+    parser.add_argument('--clear', action='store_true', help='delete every entry')
+    args = parser.parse_args()
+    
+    if not os.path.exists(args.cache):
+        print(f"{args.cache} does not exist", file=sys.stderr)
+        return 1
+    
+    db = sqlite3.connect(args.cache)
+    if args.clear:
+        with db:
+            db.execute("DELETE FROM results")
+        db.execute("VACUUM")
+    for version, count in db.execute("SELECT version, COUNT(*) FROM results GROUP BY version"):
+        print(f"{version}: {count} entries")
+    db.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
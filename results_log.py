@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""Append-only columnar log of processed frames, readable as a NumPy memmap.
+
+The file is a fixed HEADER_SIZE header (magic plus a JSON description of the
+record layout) followed by fixed-width records of RECORD_DTYPE:
+
+    time        capture time (seconds since the epoch)
+    seq         frame sequence number within the run
+    digest      16 raw bytes of the frame's MD5
+    count       cards found; backs and unknown are counted separately too
+    mask        32-bit mask of the identified cards (deck_tracker bit order)
+    labels      per slot: card index 0-31, SLOT_BACK, SLOT_UNKNOWN or SLOT_EMPTY
+    confidence  per slot match score (NaN where the matcher gives none)
+    tiers       per slot cascade tier (0 where unknown)
+    points      points per trump, in SUITS order
+    timings     stage seconds, in TIMING_FIELDS order
+
+Nothing is parsed on the way back: open_log() maps the records directly, so
+millions of frames can be filtered and aggregated with plain NumPy. A torn
+record at the end (process killed mid-write) is ignored by readers and
+truncated by the next writer.
+
+    python results_log.py summary results.blog
+"""
+import numpy as np
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+from deck_tracker import SUITS, RANKS, card_index, card_name, frame_mask
+
+MAGIC = b'BELOTLOG'
+FORMAT_VERSION = 1
+HEADER_SIZE = 512
+
+MAX_SLOTS = 32
+SLOT_BACK = 32
+SLOT_UNKNOWN = 33
+SLOT_EMPTY = 255
+
+TIMING_FIELDS = ('recognize', 'score', 'render', 'total')
+
+RECORD_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('seq', '<u4'),
+    ('digest', 'V16'),
+    ('count', 'u1'),
+    ('backs', 'u1'),
+    ('unknown', 'u1'),
+    ('cached', '?'),
+    ('mask', '<u4'),
+    ('labels', 'u1', (MAX_SLOTS,)),
+    ('confidence', '<f4', (MAX_SLOTS,)),
+    ('tiers', 'u1', (MAX_SLOTS,)),
+    ('points', '<u2', (len(SUITS),)),
+    ('timings', '<f4', (len(TIMING_FIELDS),)),
+])
+
+def layout():
+    """Description written to the header; a file is only appended to when it matches"""
+    return {
+        'version': FORMAT_VERSION,
+        'dtype': [list(field) if len(field) == 2 else [field[0], field[1], list(field[2])]
+                  for field in RECORD_DTYPE.descr],
+        'suits': SUITS,
+        'ranks': RANKS,
+        'timings': list(TIMING_FIELDS),
+    }
+
+def encode_header():
+    body = json.dumps(layout(), ensure_ascii=False).encode('utf-8')
+    header = MAGIC + body
+    if len(header) >= HEADER_SIZE:
+        raise ValueError("Record layout does not fit in the log header")
+    return header + b' ' * (HEADER_SIZE - len(header) - 1) + b'\n'
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or not header.startswith(MAGIC):
+        raise ValueError(f"{path} is not a results log")
+    return json.loads(header[len(MAGIC):].decode('utf-8'))
+
+def slot_code(rank, suit):
+    if rank == "back" and suit == "back":
+        return SLOT_BACK
+    index = card_index(rank, suit)
+    return SLOT_UNKNOWN if index is None else index
+
+def slot_label(code):
+    """Inverse of slot_code, using the JSONL labels (back, ?)"""
+    if code == SLOT_BACK:
+        return "back"
+    if code == SLOT_UNKNOWN:
+        return "?"
+    if code == SLOT_EMPTY:
+        return ""
+    return card_name(int(code))
+
+def make_record(captured_at, seq, digest, card_data, scores, timings, confidences=None,
+                tiers=None, cached=False):
+    """One frame as a RECORD_DTYPE scalar; slots beyond MAX_SLOTS are dropped"""
+    record = np.zeros((), dtype=RECORD_DTYPE)
+    record['time'] = captured_at
+    record['seq'] = seq
+    if digest:
+        record['digest'] = np.void(bytes.fromhex(digest)[:16].ljust(16, b'\0'))
+    record['count'] = min(len(card_data), 255)
+    record['backs'] = min(scores['backs'], 255)
+    record['unknown'] = min(scores['unknown'], 255)
+    record['cached'] = cached
+    record['mask'] = frame_mask(card_data)
+
+    n = min(len(card_data), MAX_SLOTS)
+    labels = np.full(MAX_SLOTS, SLOT_EMPTY, dtype=np.uint8)
+    labels[:n] = [slot_code(rank, suit) for rank, suit in card_data[:n]]
+    record['labels'] = labels
+    confidence = np.full(MAX_SLOTS, np.nan, dtype=np.float32)
+    if confidences is not None:
+        confidence[:n] = [np.nan if c is None else c for c in confidences[:n]]
+    record['confidence'] = confidence
+    if tiers is not None:
+        record['tiers'][:n] = [t or 0 for t in tiers[:n]]
+
+    record['points'] = [scores['points'][suit] for suit in SUITS]
+    record['timings'] = [timings.get(name, 0.0) for name in TIMING_FIELDS]
+    return record
+
+class ResultsLog:
+    """Writer side: appends one fixed-width record per processed frame"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            if read_header(path) != layout():
+                raise ValueError(f"{path} was written with a different record layout")
+            # Drop a torn trailing record so the next one lands on a boundary
+            size = os.path.getsize(path)
+            whole = HEADER_SIZE + (size - HEADER_SIZE) // RECORD_DTYPE.itemsize * RECORD_DTYPE.itemsize
+            if size > whole:
+                os.truncate(path, whole)
+            self.file = open(path, 'ab')
+        else:
+            self.file = open(path, 'wb')
+            self.file.write(encode_header())
+            self.file.flush()
+
+    def append(self, record):
+        with self.lock:
+            self.file.write(record.tobytes())
+            self.file.flush()
+
+    def record(self, captured_at, seq, digest, card_data, scores, timings, confidences=None,
+               tiers=None, cached=False):
+        self.append(make_record(captured_at, seq, digest, card_data, scores, timings,
+                                confidences, tiers, cached))
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def open_log(path):
+    """Map every complete record of a log read-only; returns a RECORD_DTYPE array"""
+    if read_header(path) != layout():
+        raise ValueError(f"{path} was written with a different record layout")
+    count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+def mask_bits(masks):
+    """(N, 32) booleans from an array of 32-bit masks, bit i in column i"""
+    as_bytes = np.ascontiguousarray(masks, dtype='<u4').view(np.uint8).reshape(-1, 4)
+    return np.unpackbits(as_bytes, axis=1, bitorder='little').astype(bool)
+
+def summary(path, top=10):
+    records = open_log(path)
+    n = len(records)
+    print(f"{path}: {n} frames ({os.path.getsize(path)} bytes, {RECORD_DTYPE.itemsize} per frame)")
+    if not n:
+        return 0
+    start, end = records['time'].min(), records['time'].max()
+    print(f"From {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start))} "
+          f"to {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(end))}")
+    print(f"Cards per frame: {records['count'].mean():.1f}, backs {int(records['backs'].sum())}, "
+          f"unknown {int(records['unknown'].sum())}, cached {int(records['cached'].sum())} frame(s)")
+
+    labels = records['labels']
+    confidence = records['confidence']
+    identified = labels < SLOT_BACK
+    scored = identified & ~np.isnan(confidence)
+    if scored.any():
+        print(f"Confidence of identified cards: mean {confidence[scored].mean():.3f}, "
+              f"min {confidence[scored].min():.3f}")
+
+    points = records['points']
+    print("Points by trump:   " + "  ".join(f"{suit} mean {points[:, t].mean():5.1f} max {points[:, t].max():3d}"
+                                           for t, suit in enumerate(SUITS)))
+
+    seen = mask_bits(records['mask']).sum(axis=0)
+    order = np.argsort(seen)[::-1][:top]
+    print(f"Most seen cards: " + ", ".join(f"{card_name(int(i))} {int(seen[i])}" for i in order if seen[i]))
+
+    for t, name in enumerate(TIMING_FIELDS):
+        values = records['timings'][:, t]
+        values = values[values > 0]
+        if len(values):
+            p50, p95 = np.percentile(values, [50, 95])
+            print(f"{name:<10} p50 {1000 * p50:7.2f} ms  p95 {1000 * p95:7.2f} ms")
+    return 0
+
+def dump(path, limit=None):
+    """Print records as JSON lines, like the loop's --quiet output"""
+    records = open_log(path)
+    if limit is not None:
+        records = records[-limit:]
+    for record in records:
+        n = int(record['count'])
+        print(json.dumps({
+            'seq': int(record['seq']),
+            'hash': bytes(record['digest']).hex(),
+            'time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(float(record['time']))),
+            'cards': [slot_label(code) for code in record['labels'][:min(n, MAX_SLOTS)]],
+            'points': {suit: int(p) for suit, p in zip(SUITS, record['points'])},
+            'timings': {name: round(float(v), 6) for name, v in zip(TIMING_FIELDS, record['timings'])},
+        }, ensure_ascii=False))
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Query a columnar results log')
+    sub = parser.add_subparsers(dest='command', required=True)
+    summary_parser = sub.add_parser('summary', help='aggregate every frame in the log')
+    summary_parser.add_argument('log')
+    dump_parser = sub.add_parser('dump', help='print records as JSON lines')
+    dump_parser.add_argument('log')
+    dump_parser.add_argument('-n', '--limit', type=int, default=None, help='only the last N frames')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'summary':
+            return summary(args.log)
+        return dump(args.log, args.limit)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""Capture the card strip straight from a screen rectangle, without the clipboard.
+
+The first grab covers the whole configured region. The card strip is located
+in it: near-white card faces of roughly card size give a coarse box, and the
+rank templates refine its top-left corner to the pixel so slicing lines up.
+From then on only that region of interest is grabbed, which is a fraction of
+the pixels to copy, hash and slice. The full region is grabbed again when the
+cached ROI stops looking like cards, and every RELOCATE_INTERVAL seconds so
+a moved window or a growing hand is picked up.
+
+Screens are anything with grab(bbox) → BGR array: PilScreen uses PIL's
+ImageGrab, FakeScreen composes strip images onto a synthetic desktop, so the
+whole path runs on a headless box.
+
+    python screen_capture.py --fake cards_input.png --frames 50
+"""
+import cv2
+import numpy as np
+import sys
+import time
+import argparse
+
+from card_extractor import DEFAULT_LAYOUT
+from ingest import gray_from_pil, to_gray, frame_digest
+
+DEFAULT_FPS = 10
+RELOCATE_INTERVAL = 5.0
+
+# Card faces are near white; a component counts as cards when its height is
+# within SIZE_TOLERANCE of a card (width may span several touching cards)
+FACE_LEVEL = 200
+SIZE_TOLERANCE = 0.15
+
+# Template refinement of the strip corner: search window and minimum score
+REFINE_MARGIN = 6
+REFINE_THRESHOLD = 0.5
+
+# Share of near-white pixels that makes a card face: without templates the
+# first card needs it for a cached ROI to stay valid, and a new card past the
+# end of the strip is detected by it
+MIN_FACE_FRACTION = 0.5
+
+class PilScreen:
+    """The real screen through PIL ImageGrab"""
+
+    def grab(self, bbox):
+        from PIL import ImageGrab
+        return gray_from_pil(ImageGrab.grab(bbox=bbox))
+
+class FakeScreen:
+    """A synthetic desktop: strip images pasted onto a flat background.
+
+    Every grab shows the next strip in turn (cycling), at position until
+    move() is called, so tests can change the hand and the window placement.
+    By default the desktop is 1080 high and wide enough for the widest strip.
+    """
+
+    def __init__(self, strips, size=None, position=(200, 400), background=(60, 110, 40)):
+        self.strips = [cv2.imread(s) if isinstance(s, str) else s for s in strips]
+        if any(s is None for s in self.strips):
+            raise ValueError("Could not load every fake screen image")
+        if size is None:
+            size = (max(1920, max(s.shape[1] for s in self.strips) + 2 * position[0]), 1080)
+        self.size = size
+        self.position = position
+        self.background = background
+        self.index = 0
+        self.grabs = 0
+        self.pixels = 0
+
+    def move(self, x, y):
+        self.position = (x, y)
+
+    def render(self):
+        width, height = self.size
+        screen = np.empty((height, width, 3), dtype=np.uint8)
+        screen[:] = self.background
+        strip = self.strips[self.index % len(self.strips)]
+        x, y = self.position
+        h = min(strip.shape[0], height - y)
+        w = min(strip.shape[1], width - x)
+        if h > 0 and w > 0:
+            screen[y:y+h, x:x+w] = strip[:h, :w]
+        return screen
+
+    def grab(self, bbox):
+        x1, y1, x2, y2 = bbox
+        image = self.render()[y1:y2, x1:x2].copy()
+        self.index += 1
+        self.grabs += 1
+        self.pixels += image.shape[0] * image.shape[1]
+        return image
+
+def find_card_box(image, layout=DEFAULT_LAYOUT):
+    """Coarse (x1, y1, x2, y2) around the card faces in image, or None"""
+    gray = to_gray(image)
+    faces = (gray >= FACE_LEVEL).astype(np.uint8)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(faces, connectivity=4)
+
+    boxes = []
+    for i in range(1, count):
+        x, y, w, h = stats[i, :4]
+        if abs(h - layout.card_height) > SIZE_TOLERANCE * layout.card_height:
+            continue
+        if w < (1 - SIZE_TOLERANCE) * min(layout.card_width, layout.corner_width):
+            continue
+        boxes.append((x, y, x + w, y + h))
+    if not boxes:
+        return None
+    return (int(min(b[0] for b in boxes)), int(min(b[1] for b in boxes)),
+            int(max(b[2] for b in boxes)), int(max(b[3] for b in boxes)))
+
+def match_corner(image, x, y, templates, region, margin=REFINE_MARGIN):
+    """Exact top-left card corner near (x, y): where a rank template matches best.
+
+    Returns (x, y, score); the input point and None when nothing matches.
+    """
+    if not templates:
+        return x, y, None
+    gray = to_gray(image)
+    rx1, ry1, rx2, ry2 = region
+    wx, wy = max(0, x + rx1 - margin), max(0, y + ry1 - margin)
+    window = gray[wy:y + ry2 + margin, wx:x + rx2 + margin]
+
+    best, best_loc = REFINE_THRESHOLD, None
+    for template in templates.values():
+        if window.shape[0] < template.shape[0] or window.shape[1] < template.shape[1]:
+            continue
+        result = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, loc = cv2.minMaxLoc(result)
+        if score > best:
+            best, best_loc = score, loc
+    if best_loc is None:
+        return x, y, None
+    return max(0, wx + best_loc[0] - rx1), max(0, wy + best_loc[1] - ry1), float(best)
+
+def locate_strip(image, layout=DEFAULT_LAYOUT, templates=None, region=None):
+    """Box (x1, y1, x2, y2) of the card strip within image, or None when no cards are visible.
+
+    The box starts at the first card's corner and spans whole card positions,
+    so slicing it yields exactly the visible cards.
+    """
+    box = find_card_box(image, layout)
+    if box is None:
+        return None
+    x1, y1, x2, y2 = box
+    # The face starts just inside the card outline
+    x1, y1, _ = match_corner(image, x1, y1, templates, region or (0, 0, layout.corner_width, layout.corner_height))
+    step = layout.card_width + layout.gap
+    if step > 0:
+        cards = max(1, round((x2 - x1 + layout.gap) / step))
+        x2 = x1 + cards * step - layout.gap
+    return x1, y1, min(x2, image.shape[1]), y2
+
+def face_fraction(image, layout=DEFAULT_LAYOUT):
+    """Share of near-white pixels inside the first card's face (just inside its outline)"""
+    face = image[4:min(layout.card_height, image.shape[0]) - 4, 4:min(layout.card_width, image.shape[1]) - 4]
+    if face.size == 0:
+        return 0.0
+    gray = to_gray(face)
+    return float((gray >= FACE_LEVEL).mean())
+
+def is_aligned(image, layout=DEFAULT_LAYOUT, templates=None, region=None):
+    """Whether a card still starts at the top-left corner of a cached ROI grab.
+
+    With templates the rank corner must match exactly at the origin, which
+    catches a strip that moved by a few pixels; otherwise the first card's
+    face only has to be mostly white.
+    """
+    if templates:
+        x, y, score = match_corner(image, 0, 0, templates,
+                                   region or (0, 0, layout.corner_width, layout.corner_height))
+        return score is not None and (x, y) == (0, 0)
+    return face_fraction(image, layout) >= MIN_FACE_FRACTION
+
+class ScreenCapture:
+    """Grab a screen region at a target rate, narrowed to the cached card-strip ROI.
+
+    read() returns (frame_digest, grayscale image of the strip) or (None, None)
+    when there is nothing to show; the digest only covers the ROI, so changes
+    elsewhere on screen do not count as new frames. The ROI reaches one card
+    position past the strip; a card appearing there triggers a new search, so
+    a growing hand is seen on the next frame rather than the next relocation.
+    """
+
+    def __init__(self, region, screen=None, fps=DEFAULT_FPS, layout=DEFAULT_LAYOUT, templates=None,
+                 template_region=None, relocate_interval=RELOCATE_INTERVAL, log=None):
+        self.region = tuple(region)
+        self.screen = screen or PilScreen()
+        self.interval = 1.0 / fps if fps else 0.0
+        self.layout = layout
+        self.templates = templates
+        self.template_region = template_region
+        self.relocate_interval = relocate_interval
+        self.log = log or (lambda message: None)
+        self.roi = None
+        self.strip_size = None
+        self.located_at = 0.0
+        self.relocations = 0
+
+    def invalidate(self):
+        """Forget the ROI; the next read grabs and searches the whole region again"""
+        self.roi = None
+
+    def relocate(self):
+        """Grab the whole region and locate the strip; returns the strip image or None"""
+        x0, y0 = self.region[:2]
+        full = self.screen.grab(self.region)
+        self.relocations += 1
+        self.located_at = time.monotonic()
+        box = locate_strip(full, self.layout, self.templates, self.template_region)
+        if box is None:
+            if self.roi is not None:
+                self.log("[yellow]Card strip no longer visible on screen[/yellow]")
+            self.roi = None
+            return None
+        x1, y1, x2, y2 = box
+        slack = min(full.shape[1], x2 + self.layout.card_width + max(self.layout.gap, 0))
+        roi = (x0 + x1, y0 + y1, x0 + slack, y0 + y2)
+        if roi != self.roi:
+            self.log(f"[dim]Card strip at {roi} ({(slack - x1) * (y2 - y1)} of "
+                     f"{full.shape[0] * full.shape[1]} pixels)[/dim]")
+        self.roi = roi
+        self.strip_size = (x2 - x1, y2 - y1)
+        return full[y1:y2, x1:x2]
+
+    def grab(self):
+        """The strip image, from the cached ROI when it is still valid"""
+        if self.roi is not None and time.monotonic() - self.located_at < self.relocate_interval:
+            image = self.screen.grab(self.roi)
+            width, height = self.strip_size
+            if is_aligned(image, self.layout, self.templates, self.template_region) and \
+                    face_fraction(image[:, width:], self.layout) < MIN_FACE_FRACTION:
+                return image[:height, :width]
+        return self.relocate()
+
+    def read(self):
+        try:
+            image = self.grab()
+        except Exception as e:
+            self.log(f"[red]Screen grab failed for {self.region}: {e}[/red]")
+            return None, None
+        if image is None:
+            return None, None
+        image = np.ascontiguousarray(to_gray(image))
+        return frame_digest(image), image
+
+    def remaining(self, started):
+        """Seconds left of the frame period that began at started (time.monotonic())"""
+        return max(0.0, self.interval - (time.monotonic() - started))
+
+def parse_region(text):
+    """X1,Y1,X2,Y2 as a tuple of ints"""
+    region = tuple(int(v) for v in text.split(','))
+    if len(region) != 4 or region[2] <= region[0] or region[3] <= region[1]:
+        raise ValueError(f"Screen region must be X1,Y1,X2,Y2 with X2 > X1 and Y2 > Y1, got {text!r}")
+    return region
+
+def benchmark(args):
+    import belot_calculator_loop as loop
+
+    loop.quiet_mode = True
+    loop.load_card_layout()
+    loop.load_recognizer_config()
+    templates = None
+    if loop.load_templates():
+        loop.build_cascade()
+        templates = loop.rank_templates
+
+    screen = FakeScreen(args.fake)
+    region = (0, 0) + screen.size
+    capture = ScreenCapture(region, screen, fps=0, layout=loop.card_layout, templates=templates,
+                            template_region=loop.RANK_REGION, log=loop.log)
+
+    start = time.perf_counter()
+    frames = 0
+    for i in range(args.frames):
+        if args.move_every and i and i % args.move_every == 0:
+            x, y = screen.position
+            screen.move(x + 37, y - 23)
+        digest, image = capture.read()
+        if image is not None:
+            frames += 1
+    elapsed = time.perf_counter() - start
+
+    full_pixels = args.frames * screen.size[0] * screen.size[1]
+    print(f"{frames}/{args.frames} frames with cards, {capture.relocations} full-region grab(s)")
+    print(f"ROI {capture.roi}; pixels grabbed {screen.pixels} vs {full_pixels} "
+          f"for full-region grabs ({100 * screen.pixels / full_pixels:.1f}%)")
+    print(f"{1000 * elapsed / max(args.frames, 1):.2f} ms per grab")
+    if templates is not None and capture.roi is not None:
+        _, image = capture.read()
+        card_data, _ = loop.recognize_cards(image, serial=True)
+        print("Cards: " + " ".join(loop.card_label(r, s) for r, s in card_data))
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure ROI-cached screen capture on a fake screen')
+    parser.add_argument('--fake', nargs='+', default=['cards_input.png'], help='strip images to show')
+    parser.add_argument('-n', '--frames', type=int, default=50)
+    parser.add_argument('--move-every', type=int, default=0, help='move the strip every N grabs')
+    args = parser.parse_args()
+    try:
+        return benchmark(args)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
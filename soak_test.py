@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""Memory and latency soak test for the continuous clipboard modes.
+
+A file-backed stand-in replaces PIL's clipboard: every grab returns the next
+synthetic strip (from synth_hands.py, written once to a frame directory), so
+the real per-frame path runs thousands of times exactly as it would against
+a changing clipboard:
+
+    loop        grab_clipboard_frame → recognize_cards → score_cards →
+                deck tracker → renderer (belot_calculator_loop.py)
+    clipboards  process_clipboard_image (belot_calculator_clipboards.py)
+
+After a warm-up, RSS, the tracemalloc heap and per-frame latency are sampled.
+The run fails when RSS grows faster than --max-rss-growth MB per 1000
+frames, the traced heap grows by more than --max-heap-growth MB, or the
+latency of the last window exceeds the first by --max-latency-drift. The
+allocation sites that grew the most are always listed.
+
+    python soak_test.py --frames 5000
+"""
+import os
+import io
+import sys
+import time
+import argparse
+import resource
+import tempfile
+import tracemalloc
+import itertools
+
+TOP_SITES = 15
+
+class FileClipboard:
+    """Stand-in for ImageGrab.grabclipboard that cycles through image files"""
+
+    def __init__(self, paths):
+        from PIL import Image
+        self.Image = Image
+        self.paths = itertools.cycle(paths)
+        self.grabs = 0
+
+    def grabclipboard(self):
+        self.grabs += 1
+        image = self.Image.open(next(self.paths))
+        image.load()
+        return image
+
+def write_frames(frame_dir, count, seed):
+    """Write count distinct synthetic strips as PNG files; returns their paths"""
+    import cv2
+    from synth_hands import iter_strips, DEFAULT_CONFIG
+
+    # Aligned strips, so recognition does the same work as on real screenshots
+    config = DEFAULT_CONFIG._replace(scale_range=(1.0, 1.0), offset_range=(0.0, 0.0), gap_jitter=0,
+                                     formats=('png',))
+    paths = []
+    for index, image, _, _, _ in iter_strips(count, seed=seed, config=config):
+        path = os.path.join(frame_dir, f"frame_{index:05d}.png")
+        cv2.imwrite(path, image)
+        paths.append(path)
+    return paths
+
+def rss_mb():
+    """Current resident set size in MB (peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+def slope(xs, ys):
+    """Least-squares slope of ys over xs"""
+    n = len(xs)
+    if n < 2:
+        return 0.0
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    var = sum((x - mean_x) ** 2 for x in xs)
+    if var == 0:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var
+
+def setup_loop(clipboard):
+    """Prepare belot_calculator_loop for synchronous per-frame processing"""
+    import belot_calculator_loop as loop
+
+    loop.ImageGrab.grabclipboard = clipboard.grabclipboard
+    loop.quiet_mode = True
+    loop.load_card_layout()
+    loop.load_recognizer_config()
+    if not loop.load_templates():
+        raise SystemExit("Card templates not found. Run belot_calibrator.py first.")
+    loop.build_cascade()
+    renderer = loop.JsonlRenderer()
+
+    def process():
+        frame_hash, image = loop.grab_clipboard_frame()
+        captured_at = time.time()
+        card_data, tiers = loop.recognize_cards(image)
+        scores = loop.score_cards(card_data)
+        new_deal = loop.deck_tracker.update(card_data)
+        deck = dict(loop.deck_tracker.state()._asdict(), new_deal=new_deal)
+        frame = loop.Frame(0, frame_hash, None, captured_at, card_data, scores,
+                           {'recognize': time.time() - captured_at}, tiers, False, deck)
+        renderer.render(frame)
+
+    def close():
+        loop.card_executor.shutdown(wait=True)
+    return process, close
+
+def setup_clipboards(clipboard):
+    """Prepare belot_calculator_clipboards; results go nowhere instead of the clipboard"""
+    import belot_calculator_clipboards as clip
+    from rich.console import Console
+
+    clip.ImageGrab.grabclipboard = clipboard.grabclipboard
+    clip.pyperclip.copy = lambda text: None
+    clip.console = Console(file=io.StringIO(), force_terminal=False)
+    clip.load_card_layout()
+    clip.load_recognizer_config()
+    if not clip.load_templates():
+        raise SystemExit("Card templates not found. Run belot_calibrator.py first.")
+    clip.build_candidate_pruner()
+
+    def process():
+        # Drop the captured output so the fake console does not grow
+        clip.console.file.seek(0)
+        clip.console.file.truncate()
+        clip.process_clipboard_image()
+
+    def close():
+        clip.card_executor.shutdown(wait=True)
+    return process, close
+
+def run(args):
+    frame_dir = args.frame_dir or tempfile.mkdtemp(prefix='belot-soak-')
+    os.makedirs(frame_dir, exist_ok=True)
+    paths = sorted(os.path.join(frame_dir, f) for f in os.listdir(frame_dir) if f.endswith('.png'))
+    if len(paths) < args.distinct:
+        print(f"Writing {args.distinct} synthetic frames to {frame_dir}", file=sys.stderr)
+        paths = write_frames(frame_dir, args.distinct, args.seed)
+
+    clipboard = FileClipboard(paths[:args.distinct])
+    setup = setup_loop if args.target == 'loop' else setup_clipboards
+
+    # Results are not the point here; keep them off the terminal
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+    process, close = setup(clipboard)
+
+    samples = []       # (frame, rss MB, traced heap MB)
+    latencies = []
+    baseline = None
+    try:
+        for frame in range(1, args.warmup + args.frames + 1):
+            start = time.perf_counter()
+            process()
+            latency = time.perf_counter() - start
+
+            if frame == args.warmup:
+                # Start tracing after warm-up: caches, pools and lazily
+                # imported modules are in place by now
+                if args.tracemalloc:
+                    tracemalloc.start(10)
+                    baseline = tracemalloc.take_snapshot()
+            if frame <= args.warmup:
+                continue
+
+            latencies.append(latency)
+            n = frame - args.warmup
+            if n % args.sample_every == 0 or n == args.frames:
+                heap = tracemalloc.get_traced_memory()[0] / 2**20 if args.tracemalloc else 0.0
+                samples.append((n, rss_mb(), heap))
+                print(f"\r{n}/{args.frames} frames, RSS {samples[-1][1]:.1f} MB, heap {heap:.2f} MB, "
+                      f"{1000 * latency:.1f} ms/frame", end="", file=sys.stderr, flush=True)
+        final = tracemalloc.take_snapshot() if args.tracemalloc else None
+    finally:
+        close()
+        sys.stdout.close()
+        sys.stdout = real_stdout
+        if args.tracemalloc:
+            tracemalloc.stop()
+    print(file=sys.stderr)
+    return samples, latencies, baseline, final
+
+def main():
+    parser = argparse.ArgumentParser(description='Soak test the continuous modes for memory and latency drift')
+    parser.add_argument('--target', choices=['loop', 'clipboards'], default='loop')
+    parser.add_argument('-n', '--frames', type=int, default=2000, help='measured frames')
+    parser.add_argument('--warmup', type=int, default=100, help='frames before measuring')
+    parser.add_argument('--distinct', type=int, default=50, help='distinct synthetic frames to cycle through')
+    parser.add_argument('--frame-dir', default=None, help='reuse (or fill) this directory of frames')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sample-every', type=int, default=100)
+    parser.add_argument('--max-rss-growth', type=float, default=5.0, help='MB per 1000 frames')
+    parser.add_argument('--max-heap-growth', type=float, default=2.0, help='MB over the whole run')
+    parser.add_argument('--max-latency-drift', type=float, default=1.5,
+                        help='allowed ratio of last to first window mean latency')
+    parser.add_argument('--no-tracemalloc', dest='tracemalloc', action='store_false',
+                        help='skip heap tracing (faster, RSS and latency only)')
+    args = parser.parse_args()
+    if args.warmup < 1:
+        parser.error('--warmup must be at least 1')
+
+    samples, latencies, baseline, final = run(args)
+
+    frames = [s[0] for s in samples]
+    rss_growth = 1000 * slope(frames, [s[1] for s in samples])
+    heap_growth = samples[-1][2] - samples[0][2] if samples else 0.0
+    window = max(1, min(args.sample_every, len(latencies) // 4))
+    first = sum(latencies[:window]) / window
+    last = sum(latencies[-window:]) / window
+    drift = last / first if first else 1.0
+
+    failures = []
+    if rss_growth > args.max_rss_growth:
+        failures.append(f"RSS grows {rss_growth:.2f} MB per 1000 frames (limit {args.max_rss_growth})")
+    if args.tracemalloc and heap_growth > args.max_heap_growth:
+        failures.append(f"traced heap grew {heap_growth:.2f} MB (limit {args.max_heap_growth})")
+    if drift > args.max_latency_drift:
+        failures.append(f"latency drifted {drift:.2f}x (limit {args.max_latency_drift})")
+
+    print(f"{args.target}: {len(latencies)} frames after {args.warmup} warm-up")
+    print(f"  RSS     {samples[0][1]:.1f} → {samples[-1][1]:.1f} MB, trend {rss_growth:+.2f} MB/1000 frames")
+    if args.tracemalloc:
+        print(f"  heap    {samples[0][2]:.2f} → {samples[-1][2]:.2f} MB traced")
+    print(f"  latency {1000 * first:.1f} → {1000 * last:.1f} ms/frame (first/last {window} frames)")
+
+    if baseline is not None and final is not None:
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        growth = final.filter_traces(filters).compare_to(baseline.filter_traces(filters), 'lineno')
+        print(f"\nTop {TOP_SITES} growing allocation sites:")
+        for stat in [s for s in growth if s.size_diff > 0][:TOP_SITES]:
+            print(f"  {stat}")
+
+    if failures:
+        print("\nFAIL: " + "; ".join(failures))
+        return 1
+    print("\nPASS")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""Detect cards anywhere in a hand strip instead of at fixed slice offsets.
+
+Every rank and suit template is correlated once against the whole grayscale
+strip with cv2.matchTemplate(TM_CCOEFF_NORMED). For templates of this size
+OpenCV computes the cross-correlation with a DFT and the local means and
+norms with integral images, so one call covers every position of the strip.
+Peaks are found with a max-filter, overlapping peaks of different labels are
+removed by greedy non-maximum suppression, and each rank peak is paired with
+the suit peak found at the expected offset below it.
+
+To bound its cost, the full-strip pass runs at COARSE_FACTOR resolution with
+a slightly lower threshold, and each surviving peak is then rescored with its
+own template in a small full-resolution window. Even so, detection is slower
+than matching slices at fixed offsets (about twice the time on the bundled
+15-card strip): it pays for not depending on the layout, not for speed.
+
+The result does not depend on slice_cards geometry: a strip shifted, padded
+or spaced differently still yields the same labels, with the corner position
+of every card.
+
+Run as a script to compare it with the fixed-offset matcher on a strip:
+
+    python strip_detector.py cards_input.png --shift 3
+"""
+import cv2
+import numpy as np
+import os
+import sys
+import time
+import argparse
+from collections import namedtuple
+
+RANK_REGION = (0, 0, 80, 80)
+SUIT_REGION = (0, 80, 80, 145)
+BACK_REGION = (0, 0, 80, 80)
+
+MATCH_THRESHOLD = 0.6
+BACK_THRESHOLD = 0.7
+
+# The whole-strip pass runs at this fraction of the matching resolution and
+# accepts peaks down to COARSE_SLACK below the threshold; REFINE_MARGIN pixels
+# around each one are rescored at full resolution
+COARSE_FACTOR = 0.5
+COARSE_SLACK = 0.1
+REFINE_MARGIN = 4
+
+# At each coarse location only labels within this score of the strongest one
+# are refined
+CANDIDATE_MARGIN = 0.1
+
+# Peaks closer than this fraction of the template size are the same glyph
+OVERLAP_FRACTION = 0.5
+
+# A suit peak pairs with a rank peak when it lies within this fraction of the
+# suit template size of the expected position
+PAIR_TOLERANCE = 0.25
+
+# x, y are the top-left corner of the card in strip coordinates
+Detection = namedtuple('Detection', ['rank', 'suit', 'x', 'y', 'rank_score', 'suit_score'])
+Peak = namedtuple('Peak', ['label', 'score', 'x', 'y'])
+
+def to_gray(img):
+    if len(img.shape) == 3:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return img
+
+def scale_image(img, scale):
+    if scale == 1.0:
+        return img
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+def response_map(gray, template):
+    """Normalised correlation of template at every position of gray"""
+    if gray.shape[0] < template.shape[0] or gray.shape[1] < template.shape[1]:
+        return np.zeros((0, 0), dtype=np.float32)
+    response = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
+    # Flat areas have zero variance and come back as inf/nan
+    return np.nan_to_num(response, nan=0.0, posinf=0.0, neginf=0.0)
+
+def find_peaks(response, threshold, size):
+    """Local maxima above threshold, at most one per (w, h) neighbourhood"""
+    if response.size == 0:
+        return []
+    w, h = size
+    kernel = np.ones((max(1, int(h * OVERLAP_FRACTION)) | 1, max(1, int(w * OVERLAP_FRACTION)) | 1),
+                     dtype=np.uint8)
+    local_max = cv2.dilate(response, kernel)
+    ys, xs = np.nonzero((response >= local_max) & (response > threshold))
+    return [(float(response[y, x]), int(x), int(y)) for y, x in zip(ys, xs)]
+
+def cluster_peaks(peaks, size, margin=0.0):
+    """Greedy non-maximum suppression across labels.
+
+    Returns one list per location, strongest peak first; with a margin the
+    overlapping peaks within margin of the strongest are kept as contenders.
+    """
+    w, h = size
+    min_dx, min_dy = w * OVERLAP_FRACTION, h * OVERLAP_FRACTION
+    clusters = []
+    for peak in sorted(peaks, key=lambda p: p.score, reverse=True):
+        for cluster in clusters:
+            leader = cluster[0]
+            if abs(peak.x - leader.x) < min_dx and abs(peak.y - leader.y) < min_dy:
+                if peak.score >= leader.score - margin:
+                    cluster.append(peak)
+                break
+        else:
+            clusters.append([peak])
+    return clusters
+
+def suppress(peaks, size):
+    """Strongest peak of every location"""
+    return [cluster[0] for cluster in cluster_peaks(peaks, size)]
+
+class StripDetector:
+    """Locate and label every card index in a strip with one whole-strip correlation per template"""
+
+    def __init__(self, rank_templates, suit_templates, back_template=None,
+                 rank_region=RANK_REGION, suit_region=SUIT_REGION,
+                 threshold=MATCH_THRESHOLD, back_threshold=BACK_THRESHOLD, scale=1.0):
+        self.scale = scale
+        self.ranks = {label: scale_image(to_gray(t), scale) for label, t in rank_templates.items()}
+        self.suits = {label: scale_image(to_gray(t), scale) for label, t in suit_templates.items()}
+        self.back = scale_image(to_gray(back_template), scale) if back_template is not None else None
+        self.coarse_ranks = {label: scale_image(t, COARSE_FACTOR) for label, t in self.ranks.items()}
+        self.coarse_suits = {label: scale_image(t, COARSE_FACTOR) for label, t in self.suits.items()}
+        self.coarse_back = scale_image(self.back, COARSE_FACTOR) if self.back is not None else None
+        self.rank_region = rank_region
+        self.suit_region = suit_region
+        self.threshold = threshold
+        self.back_threshold = back_threshold
+        # matchTemplate calls over the whole coarse strip and in refine windows
+        self.coarse_calls = 0
+        self.refine_calls = 0
+
+    def refine(self, gray, template, x, y):
+        """Rescore a coarse peak in a small full-resolution window; returns (score, x, y)"""
+        h, w = template.shape[:2]
+        x0, y0 = max(0, x - REFINE_MARGIN), max(0, y - REFINE_MARGIN)
+        window = gray[y0:y + h + REFINE_MARGIN, x0:x + w + REFINE_MARGIN]
+        self.refine_calls += 1
+        response = response_map(window, template)
+        if response.size == 0:
+            return 0.0, x, y
+        _, score, _, (dx, dy) = cv2.minMaxLoc(response)
+        return score, x0 + dx, y0 + dy
+
+    def label_peaks(self, gray, coarse_gray, templates, coarse_templates, threshold, keep=None):
+        """Run every template once over the coarse strip, refine, keep non-overlapping peaks.
+        
+        keep(x, y) can reject coarse locations (in full-resolution pixels)
+        before any refinement is spent on them.
+        """
+        coarse_peaks = []
+        size = (0, 0)
+        for label, coarse in coarse_templates.items():
+            h, w = coarse.shape[:2]
+            size = (max(size[0], w), max(size[1], h))
+            self.coarse_calls += 1
+            for score, cx, cy in find_peaks(response_map(coarse_gray, coarse),
+                                            threshold - COARSE_SLACK, (w, h)):
+                coarse_peaks.append(Peak(label, score, cx, cy))
+
+        peaks = []
+        for cluster in cluster_peaks(coarse_peaks, size, CANDIDATE_MARGIN):
+            if keep is not None and not keep(cluster[0].x / COARSE_FACTOR, cluster[0].y / COARSE_FACTOR):
+                continue
+            best = None
+            for peak in cluster:
+                score, x, y = self.refine(gray, templates[peak.label],
+                                          int(round(peak.x / COARSE_FACTOR)), int(round(peak.y / COARSE_FACTOR)))
+                if score > threshold and (best is None or score > best.score):
+                    best = Peak(peak.label, score, x, y)
+            if best is not None:
+                peaks.append(best)
+        return peaks
+
+    def suit_offset(self):
+        """Expected (dx, dy) from a rank peak to its suit peak, and the (x, y) tolerance"""
+        s = self.scale
+        dx = (self.suit_region[0] - self.rank_region[0]) * s
+        dy = (self.suit_region[1] - self.rank_region[1]) * s
+        tol_x = (self.suit_region[2] - self.suit_region[0]) * s * PAIR_TOLERANCE
+        tol_y = (self.suit_region[3] - self.suit_region[1]) * s * PAIR_TOLERANCE
+        return dx, dy, tol_x, tol_y
+
+    def pair(self, rank_peaks, suit_peaks):
+        """Match each rank peak to the suit peak at the expected offset below it"""
+        s = self.scale
+        dx, dy, tol_x, tol_y = self.suit_offset()
+
+        detections = []
+        unused = list(suit_peaks)
+        for rank in sorted(rank_peaks, key=lambda p: p.score, reverse=True):
+            candidates = [p for p in unused
+                          if abs(p.x - rank.x - dx) <= tol_x and abs(p.y - rank.y - dy) <= tol_y]
+            suit = max(candidates, key=lambda p: p.score) if candidates else None
+            if suit is not None:
+                unused.remove(suit)
+            detections.append(Detection(
+                rank.label, suit.label if suit else '?',
+                int(round(rank.x / s)) - self.rank_region[0], int(round(rank.y / s)) - self.rank_region[1],
+                rank.score, suit.score if suit else 0.0))
+        return detections
+
+    def detect(self, image):
+        """Return Detections for every card in the strip, in reading order"""
+        gray = scale_image(to_gray(image), self.scale)
+        coarse_gray = scale_image(gray, COARSE_FACTOR)
+
+        rank_peaks = self.label_peaks(gray, coarse_gray, self.ranks, self.coarse_ranks, self.threshold)
+
+        # Suit glyphs also appear as pips in the card body; only the ones
+        # below a detected rank are worth refining
+        dx, dy, tol_x, tol_y = self.suit_offset()
+        tol_x, tol_y = tol_x + REFINE_MARGIN, tol_y + REFINE_MARGIN
+
+        def below_rank(x, y):
+            return any(abs(x - p.x - dx) <= tol_x and abs(y - p.y - dy) <= tol_y for p in rank_peaks)
+
+        suit_peaks = self.label_peaks(gray, coarse_gray, self.suits, self.coarse_suits, self.threshold,
+                                      keep=below_rank)
+        detections = self.pair(rank_peaks, suit_peaks)
+
+        if self.back is not None:
+            # A back pattern may repeat inside one card; anything within a
+            # template size of a detected card is the same card
+            h, w = self.back.shape[:2]
+            taken = [(d.x, d.y) for d in detections]
+            back_peaks = self.label_peaks(gray, coarse_gray, {'back': self.back},
+                                          {'back': self.coarse_back}, self.back_threshold)
+            for peak in back_peaks:
+                x = int(round(peak.x / self.scale)) - BACK_REGION[0]
+                y = int(round(peak.y / self.scale)) - BACK_REGION[1]
+                if all(abs(x - tx) >= w / self.scale or abs(y - ty) >= h / self.scale for tx, ty in taken):
+                    detections.append(Detection('back', 'back', x, y, peak.score, peak.score))
+                    taken.append((x, y))
+
+        return sort_reading_order(detections, self.rank_region)
+
+    def identify_cards(self, image):
+        """Labels only, as (rank, suit) pairs like identify_card"""
+        return [(d.rank, d.suit) for d in self.detect(image)]
+
+def sort_reading_order(detections, rank_region=RANK_REGION):
+    """Rows top to bottom (cards within half a rank region height share a row), then left to right"""
+    if not detections:
+        return []
+    row_height = (rank_region[3] - rank_region[1]) / 2
+    by_y = sorted(detections, key=lambda d: d.y)
+    rows, row = [], [by_y[0]]
+    for d in by_y[1:]:
+        if d.y - row[0].y > row_height:
+            rows.append(row)
+            row = []
+        row.append(d)
+    rows.append(row)
+    return [d for row in rows for d in sorted(row, key=lambda d: d.x)]
+
+def misalign(image, shift, pad):
+    """Shift the strip by a few pixels and pad it, the way a sloppy crop would"""
+    if shift:
+        image = np.roll(image, (shift, shift), axis=(0, 1))
+    if pad:
+        image = cv2.copyMakeBorder(image, pad, pad, pad, pad, cv2.BORDER_CONSTANT, value=(255, 255, 255))
+    return image
+
+def main():
+    import belot_calculator
+
+    parser = argparse.ArgumentParser(description='Compare whole-strip detection with fixed slicing')
+    parser.add_argument('image', help='hand strip image')
+    parser.add_argument('--shift', type=int, default=0, help='misalign the strip by N pixels')
+    parser.add_argument('--pad', type=int, default=0, help='add an N pixel white border')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='timed repetitions')
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image)
+    if image is None:
+        print(f"Cannot read {args.image}", file=sys.stderr)
+        return 1
+    image = misalign(image, args.shift, args.pad)
+
+    belot_calculator.load_card_layout()
+    belot_calculator.load_recognizer_config()
+    if not belot_calculator.load_templates():
+        print("Card templates not found. Run belot_calibrator.py first.", file=sys.stderr)
+        return 1
+    detector = StripDetector(belot_calculator.rank_templates, belot_calculator.suit_templates,
+                             belot_calculator.back_template,
+                             rank_region=belot_calculator.RANK_REGION,
+                             suit_region=belot_calculator.SUIT_REGION,
+                             threshold=belot_calculator.MATCH_THRESHOLD,
+                             back_threshold=belot_calculator.BACK_THRESHOLD,
+                             scale=belot_calculator.TEMPLATE_SCALE)
+
+    def timed(fn):
+        result = fn()
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            fn()
+        return result, (time.perf_counter() - start) / args.repeat
+
+    cards = belot_calculator.slice_cards(image)
+    sliced, sliced_time = timed(lambda: [belot_calculator.identify_card(c) for c in cards])
+    detector.coarse_calls = detector.refine_calls = 0
+    detections, detect_time = timed(lambda: detector.detect(image))
+    coarse_calls = detector.coarse_calls // (args.repeat + 1)
+    refine_calls = detector.refine_calls // (args.repeat + 1)
+
+    templates = len(belot_calculator.scaled_rank_templates) + len(belot_calculator.scaled_suit_templates) + 1
+    print(f"{os.path.basename(args.image)}: shift {args.shift}px, pad {args.pad}px")
+    print(f"sliced    {len(sliced):3d} cards, {len(cards) * templates:4d} matchTemplate calls, "
+          f"{sliced_time * 1000:7.1f} ms  {' '.join(f'{r}{s}' if r != 'back' else 'back' for r, s in sliced)}")
+    print(f"detected  {len(detections):3d} cards, {coarse_calls + refine_calls:4d} matchTemplate calls, "
+          f"{detect_time * 1000:7.1f} ms  {' '.join(f'{d.rank}{d.suit}' if d.rank != 'back' else 'back' for d in detections)}")
+    print(f"          ({coarse_calls} over the coarse strip, {refine_calls} in refine windows)")
+    for d in detections:
+        print(f"  {d.rank:>4}{d.suit:<4} at ({d.x:4d}, {d.y:3d})  rank {d.rank_score:.2f}  suit {d.suit_score:.2f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
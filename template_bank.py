@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Helpers describing the on-disk template store written by belot_calibrator.py"""
+import os
+import json
+import time
+import hashlib
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+GLYPH_REGIONS_FILE = 'regions.json'
+
+def template_files(templates_dir=TEMPLATES_DIR):
+    """Sorted paths (relative to templates_dir) of every file in the store"""
+    files = []
+    for root, _, names in os.walk(templates_dir):
+        for name in names:
+            if name.startswith('.'):
+                continue
+            files.append(os.path.relpath(os.path.join(root, name), templates_dir))
+    return sorted(files)
+
+def template_bank_version(templates_dir=TEMPLATES_DIR):
+    """Content hash of the whole template store, or None if it does not exist.
+
+    Any recalibration that changes a template changes the version, so it can
+    key caches of recognition results.
+    """
+    if not os.path.isdir(templates_dir):
+        return None
+    
+    digest = hashlib.sha1()
+    for rel_path in template_files(templates_dir):
+        digest.update(rel_path.encode('utf-8') + b'\0')
+        with open(os.path.join(templates_dir, rel_path), 'rb') as f:
+            digest.update(f.read())
+        digest.update(b'\0')
+    return digest.hexdigest()[:16]
+
+def read_glyph_regions(templates_dir=TEMPLATES_DIR):
+    """(rank_region, suit_region) the calibrator derived from the glyph ink, or None.
+    
+    Stores calibrated before the regions were derived have no regions.json;
+    recognizers then match the full template regions.
+    """
+    try:
+        with open(os.path.join(templates_dir, GLYPH_REGIONS_FILE), encoding='utf-8') as f:
+            data = json.load(f)
+        regions = tuple(data['rank_region']), tuple(data['suit_region'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if any(len(region) != 4 or region[2] <= region[0] or region[3] <= region[1] for region in regions):
+        return None
+    return regions
+
+def store_signature(templates_dir=TEMPLATES_DIR):
+    """Cheap change detector: (path, size, mtime) of every file, or None if missing"""
+    if not os.path.isdir(templates_dir):
+        return None
+    signature = []
+    for rel_path in template_files(templates_dir):
+        try:
+            stat = os.stat(os.path.join(templates_dir, rel_path))
+        except OSError:
+            continue
+        signature.append((rel_path, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+class TemplateWatcher:
+    """Prepare a new template bank in a background thread whenever the store changes.
+    
+    load(templates_dir) must build a complete, independent bank (and raise
+    ValueError if the store is incomplete); the watcher never touches the bank
+    in use. The store has to stay unchanged for settle seconds before and
+    during a load, so a calibrator run that is still rebuilding the directory
+    is never picked up half-written. The consumer collects the prepared bank
+    with take() at a point where swapping is safe, e.g. between frames.
+    """
+    
+    def __init__(self, templates_dir, load, interval=1.0, settle=0.5, log=print):
+        self.templates_dir = templates_dir
+        self.load = load
+        self.interval = interval
+        self.settle = settle
+        self.log = log
+        
+        self.signature = store_signature(templates_dir)
+        self.version = template_bank_version(templates_dir)
+        self.pending = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+    
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='template-watcher', daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.stopped.set()
+    
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            signature = store_signature(self.templates_dir)
+            if signature == self.signature:
+                continue
+            
+            # Wait for the writer to finish
+            if self.stopped.wait(self.settle) or store_signature(self.templates_dir) != signature:
+                continue
+            
+            start = time.perf_counter()
+            version = template_bank_version(self.templates_dir)
+            if version == self.version:
+                self.signature = signature
+                continue
+            try:
+                bank = self.load(self.templates_dir)
+            except (ValueError, OSError) as e:
+                # Not retried until the store changes again
+                self.signature = signature
+                self.log(f"Template store changed but was rejected: {e}")
+                continue
+            if store_signature(self.templates_dir) != signature:
+                continue  # modified while loading; try again on the next poll
+            
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.pending = (bank, version, elapsed)
+            self.signature = signature
+            self.version = version
+    
+    def take(self):
+        """Return (bank, version, load seconds) once per new version, else None"""
+        with self.lock:
+            pending, self.pending = self.pending, None
+        return pending